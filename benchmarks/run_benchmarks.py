@@ -0,0 +1,221 @@
+import os
+import sys
+import json
+import shutil
+import platform
+import argparse
+import datetime
+import subprocess
+import tempfile
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# The tools live one folder up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import excel_io
+import merge_engine
+import instrumentation
+from instrumentation import peak_rss_mb
+import merge_keys
+import replace_engine
+import synthetic
+
+# Rules for the replacement stages: typical clean-ups of grade text
+REPLACE_RULES = "缺考,0,免考,EX,Absent,0,优,A,良,B"
+
+
+def quiet(message):
+    pass
+
+
+def stages(timer):
+    # The timer's spans by stage name, as stored in the results file
+    return {record['stage']: {key: value for key, value in record.items() if key not in ('task', 'stage')}
+            for record in timer.spans}
+
+
+def original_replace(df, replace_dict):
+    # The cell-by-cell replacement ReplacementApp used before vectorization
+    df = df.copy()
+    for column in df.columns:
+        df[column] = df[column].apply(lambda x: replace_engine.safe_replace(x, replace_dict))
+    return df
+
+
+def run_case(case, work_dir):
+    """Generate one input pair and time every stage of merging and replacing it"""
+    timer = instrumentation.StageTimer(f"{case['format']} {case['rows']}x{case['cols']}")
+    case_dir = tempfile.mkdtemp(prefix='case_', dir=work_dir)
+    try:
+        with timer.span('generate'):
+            file1_path, file2_path, file1_key, file2_key = synthetic.generate_pair(
+                case_dir, case['rows'], case['cols'], case['cardinality'], case['dup_ratio'], case['key_style'],
+                case['format'], case['overlap'], case['seed'])
+
+        rows = case['rows']
+        arrow = case.get('arrow', False)
+        with timer.span('load_file1', rows):
+            file1_df = merge_engine.try_multiple_engines(file1_path, quiet, arrow=arrow)
+        with timer.span('load_file2', rows):
+            file2_df = merge_engine.try_multiple_engines(file2_path, quiet, arrow=arrow)
+
+        key_rules = merge_keys.parse_rules(case['key_rules'])
+        with timer.span('normalize_keys', 2 * rows):
+            merge_keys.normalize_keys(file1_df[file1_key], key_rules, arrow)
+            merge_keys.normalize_keys(file2_df[file2_key], key_rules, arrow)
+
+        with timer.span('prepare_file1', rows):
+            file1_side = merge_engine.prepare_side(file1_df, file1_key, '_file1', [], "File 1", key_rules, arrow)
+        with timer.span('prepare_file2', rows):
+            file2_side = merge_engine.prepare_side(file2_df, file2_key, '_file2', [], "File 2", key_rules, arrow)
+        with timer.span('merge', 2 * rows):
+            merged_df = merge_engine.merge_sides(file1_side, file2_side)
+
+        # Half of each file's columns, the usual size of a report selection
+        selected = ([col for col in file1_side.columns[1:]][::2] + [col for col in file2_side.columns[1:]][::2])
+        with timer.span('select_columns', len(merged_df)):
+            final_df = merged_df[merge_engine.output_columns(merged_df.columns, selected)]
+
+        for output_format in case['output_formats']:
+            output_path = os.path.join(case_dir, f"merged.{output_format}")
+            with timer.span(f"write_{output_format}", len(final_df)):
+                excel_io.write_table(final_df, output_path)
+            if case['streaming']:
+                with timer.span(f"write_{output_format}_streaming", len(final_df)):
+                    excel_io.write_table(final_df, output_path, True)
+
+        replace_dict = replace_engine.parse_rules(REPLACE_RULES)
+        if case['replace_original']:
+            with timer.span('replace_safe_replace', rows):
+                original_replace(file1_df, replace_dict)
+        with timer.span('replace_compile'):
+            rules = replace_engine.ReplacementRules(replace_dict)
+        with timer.span('replace_vectorized', rows):
+            rules.apply_frame(file1_df)
+        if case['format'] == 'xlsx':
+            sheet = excel_io.list_sheet_names(file1_path)[0]
+            with timer.span('replace_in_place', rows):
+                replace_engine.replace_in_workbook(file1_path, sheet, '', rules)
+
+        return {
+            'case': case,
+            'merged_rows': len(merged_df),
+            'stages': stages(timer),
+            'peak_rss_mb': peak_rss_mb(),
+            'error': None,
+        }
+    except Exception as e:
+        return {'case': case, 'stages': stages(timer), 'peak_rss_mb': peak_rss_mb(), 'error': str(e)}
+    finally:
+        shutil.rmtree(case_dir, ignore_errors=True)
+
+
+def run_isolated(case, work_dir):
+    # A fresh process per case, so peak RSS belongs to that case alone
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(run_case, case, work_dir).result()
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'calamine': excel_io.calamine_available(),
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Time loading, merging, writing and replacing synthetic marksheets.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000], help="Rows per input file")
+    parser.add_argument("--cols", type=int, nargs="+", default=[10], help="Columns per input file")
+    parser.add_argument("--cardinality", type=int, help="Distinct keys per file (default: rows)")
+    parser.add_argument("--dup-ratio", type=float, nargs="+", default=[0.0], help="Share of rows repeating a key")
+    parser.add_argument("--key-style", choices=["ascii", "chinese"], nargs="+", default=["ascii"])
+    parser.add_argument("--format", choices=["xlsx", "xls", "csv"], nargs="+", default=["xlsx", "csv"],
+                        dest="formats", help="Input file formats")
+    parser.add_argument("--output-format", choices=["xlsx", "csv", "csv.gz", "parquet", "feather"], nargs="+",
+                        default=["xlsx", "csv"], dest="output_formats")
+    parser.add_argument("--streaming", action="store_true", help="Also time the streaming writer")
+    parser.add_argument("--normalize-keys", default="", metavar="RULES", help="Key rules for the normalization stage")
+    parser.add_argument("--arrow", action="store_true",
+                        help="Load, key and replace with Arrow-backed columns")
+    parser.add_argument("--overlap", type=float, default=0.9, help="Share of keys present in both files")
+    parser.add_argument("--skip-original-replace", action="store_true",
+                        help="Do not time the slow cell-by-cell safe_replace pass")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case; every run is recorded")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="Folder for generated files (default: system temp)")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="JSON file for the results")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    formats = list(args.formats)
+    if 'xls' in formats and not synthetic.xls_available():
+        print("Skipping .xls inputs: xlwt is not installed", file=sys.stderr)
+        formats.remove('xls')
+
+    cases = []
+    for rows, cols, dup_ratio, key_style, file_format in itertools.product(
+            args.rows, args.cols, args.dup_ratio, args.key_style, formats):
+        if file_format == 'xls' and rows >= 65536:
+            print(f"Skipping .xls with {rows} rows: the format holds at most 65535", file=sys.stderr)
+            continue
+        cases.append({
+            'rows': rows,
+            'cols': cols,
+            'cardinality': args.cardinality,
+            'dup_ratio': dup_ratio,
+            'key_style': key_style,
+            'format': file_format,
+            'overlap': args.overlap,
+            'key_rules': args.normalize_keys,
+            'output_formats': args.output_formats,
+            'streaming': args.streaming,
+            'replace_original': not args.skip_original_replace,
+            'arrow': args.arrow,
+            'seed': args.seed,
+        })
+
+    work_dir = tempfile.mkdtemp(prefix='marksheet_bench_', dir=args.work_dir)
+    results = []
+    try:
+        for case in cases:
+            for run in range(args.repeat):
+                label = f"{case['format']} {case['rows']}x{case['cols']} {case['key_style']} dup={case['dup_ratio']}"
+                print(f"Running {label} (run {run+1}/{args.repeat})...")
+                result = run_isolated(case, work_dir)
+                result['run'] = run + 1
+                results.append(result)
+                if result['error']:
+                    print(f"  Failed: {result['error']}")
+                else:
+                    for name, stage in result['stages'].items():
+                        print(f"  {name:<28} {stage['seconds']:>10.3f}s")
+                    print(f"  {'peak RSS':<28} {result['peak_rss_mb'] or 0:>10.1f} MB")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with excel_io.atomic_output(args.output) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment(), 'results': results}, f, ensure_ascii=False, indent=2)
+    print(f"Results saved to {args.output}")
+    return 0 if all(result['error'] is None for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+# Surnames and given-name characters for realistic Chinese name keys
+SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈姚卢姜崔钟谭陆汪范金石廖贾夏韦付方白邹孟熊秦邱江尹薛闫段雷侯龙史陶黎贺顾毛郝龚邵万钱严覃武戴莫孔向汤"
+GIVEN = "伟芳娜秀英敏静丽强磊军洋勇艳杰娟涛明超秀兰霞平刚桂英华玉萍红娥玲芬芳燕彩春菊兰凤洁梅琳素云莲真环雪荣爱妹霞香月莺媛艳瑞凡佳嘉琼勤珍贞莉桂娣叶璧璐娅琦晶妍茜秋珊莎锦黛青倩婷姣婉娴瑾颖露瑶怡婵雁蓓纨仪荷丹蓉眉君琴蕊薇菁梦岚苑婕馨瑗琰韵融园艺咏卿聪澜纯毓悦昭冰爽琬茗羽希宁欣飘育滢馥筠柔竹霭凝晓欢霄枫芸菲寒伊亚宜可姬舒影荔枝思丽"
+
+# Values that break numeric columns in real marksheets
+TEXT_SCORES = ["缺考", "免考", "Absent", "N/A"]
+
+
+def make_keys(cardinality, key_style, rng):
+    """``cardinality`` distinct keys: "S000123" IDs or Chinese names (unique via a numeric tail)"""
+    if key_style == 'ascii':
+        return np.array([f"S{i:07d}" for i in range(cardinality)], dtype=object)
+    surnames = rng.choice(list(SURNAMES), cardinality)
+    given = rng.choice(list(GIVEN), (cardinality, 2))
+    return np.array([f"{surnames[i]}{given[i, 0]}{given[i, 1]}{i:05d}" for i in range(cardinality)], dtype=object)
+
+
+def make_marksheet(rows, cols, keys, dup_ratio, key_name, rng, text_ratio=0.01, missing_ratio=0.02):
+    """A marksheet with ``rows`` rows drawn from ``keys``.
+
+    About ``dup_ratio`` of the rows repeat a key already used. Columns cycle
+    through integer scores, decimal scores, short text and dates; a small
+    share of score cells holds text such as "缺考" or is left blank, as in
+    real exports.
+    """
+    distinct = max(1, min(len(keys), int(round(rows * (1 - dup_ratio)))))
+    chosen = rng.choice(keys, distinct, replace=False)
+    repeats = rng.choice(chosen, rows - distinct) if rows > distinct else chosen[:0]
+    key_values = np.concatenate([chosen, repeats])
+    rng.shuffle(key_values)
+
+    data = {key_name: key_values}
+    for c in range(cols - 1):
+        kind = c % 4
+        if kind == 0:
+            values = rng.integers(0, 101, rows).astype(object)
+        elif kind == 1:
+            values = np.round(rng.random(rows) * 100, 1).astype(object)
+        elif kind == 2:
+            values = rng.choice(np.array(["A", "B", "C", "D", "优", "良", "及格"], dtype=object), rows)
+        else:
+            values = (pd.Timestamp("2024-09-01") + pd.to_timedelta(rng.integers(0, 300, rows), unit="D")).to_numpy().astype(object)
+        if kind in (0, 1):
+            text_mask = rng.random(rows) < text_ratio
+            values[text_mask] = rng.choice(np.array(TEXT_SCORES, dtype=object), text_mask.sum())
+        values[rng.random(rows) < missing_ratio] = None
+        data[f"Col{c+1}"] = values
+    return pd.DataFrame(data)
+
+
+def save_marksheet(df, path):
+    """Write a generated marksheet as .csv, .xlsx or .xls (the last needs xlwt)"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        df.to_csv(path, index=False, encoding='utf-8')
+    elif ext == '.xlsx':
+        df.to_excel(path, index=False, engine='openpyxl')
+    elif ext == '.xls':
+        _save_xls(df, path)
+    else:
+        raise ValueError(f"Unsupported benchmark format: {ext}")
+
+
+def xls_available():
+    try:
+        import xlwt  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _save_xls(df, path):
+    # pandas no longer writes .xls, so go through xlwt directly
+    import xlwt
+
+    if len(df) >= 65536:
+        raise ValueError(".xls sheets hold at most 65535 data rows")
+    workbook = xlwt.Workbook(encoding='utf-8')
+    sheet = workbook.add_sheet('Sheet1')
+    date_style = xlwt.easyxf(num_format_str='yyyy-mm-dd')
+    for c, name in enumerate(df.columns):
+        sheet.write(0, c, str(name))
+    for r, row in enumerate(df.itertuples(index=False, name=None), start=1):
+        for c, value in enumerate(row):
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                continue
+            if isinstance(value, pd.Timestamp):
+                sheet.write(r, c, value.to_pydatetime(), date_style)
+            elif isinstance(value, np.integer):
+                sheet.write(r, c, int(value))
+            else:
+                sheet.write(r, c, value)
+    workbook.save(path)
+
+
+def generate_pair(out_dir, rows, cols=10, cardinality=None, dup_ratio=0.0, key_style='ascii',
+                  file_format='xlsx', overlap=0.9, seed=0):
+    """Generate a roster/score file pair for the merge benchmarks.
+
+    Both files draw keys from one pool of ``cardinality`` keys (default
+    ``rows``); ``overlap`` is the share of File 2's pool shared with File 1.
+    Returns the two paths and their key column names.
+    """
+    rng = np.random.default_rng(seed)
+    cardinality = cardinality or rows
+    pool = make_keys(int(cardinality * (2 - overlap)) + 1, key_style, rng)
+    file1_keys = pool[:cardinality]
+    file2_keys = pool[-cardinality:]
+
+    os.makedirs(out_dir, exist_ok=True)
+    name = f"{key_style}_{rows}x{cols}_d{dup_ratio}"
+    file1_path = os.path.join(out_dir, f"roster_{name}.{file_format}")
+    file2_path = os.path.join(out_dir, f"scores_{name}.{file_format}")
+    save_marksheet(make_marksheet(rows, cols, file1_keys, dup_ratio, "学号", rng), file1_path)
+    save_marksheet(make_marksheet(rows, cols, file2_keys, dup_ratio, "ID", rng), file2_path)
+    return file1_path, file2_path, "学号", "ID"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic marksheet file pairs for benchmarking.")
+    parser.add_argument("out_dir", help="Folder for the generated files")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--cols", type=int, default=10)
+    parser.add_argument("--cardinality", type=int, help="Distinct keys per file (default: rows)")
+    parser.add_argument("--dup-ratio", type=float, default=0.0, help="Share of rows repeating a key")
+    parser.add_argument("--key-style", choices=["ascii", "chinese"], default="ascii")
+    parser.add_argument("--format", choices=["xlsx", "xls", "csv"], default="xlsx")
+    parser.add_argument("--overlap", type=float, default=0.9, help="Share of keys present in both files")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.format == 'xls' and not xls_available():
+        print("Error: writing .xls needs xlwt (pip install xlwt)", file=sys.stderr)
+        return 2
+    paths = generate_pair(args.out_dir, args.rows, args.cols, args.cardinality, args.dup_ratio,
+                          args.key_style, args.format, args.overlap, args.seed)
+    print(paths[0])
+    print(paths[1])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,357 @@
+import os
+import math
+import pickle
+import tempfile
+import pandas as pd
+
+import excel_io
+import key_stats
+import merge_engine
+import merge_keys
+from merge_engine import MERGE_KEY
+
+# Rows read from an input CSV at a time while partitioning
+READ_CHUNK_ROWS = 200000
+
+# Input bytes per bucket when the bucket count is not given; a bucket pair
+# has to fit in memory during its merge
+BUCKET_TARGET_MB = 128
+
+
+def bucket_count(*paths):
+    """Enough buckets that each one holds about BUCKET_TARGET_MB of input"""
+    total_mb = sum(os.path.getsize(path) for path in paths) / 1024 / 1024
+    return max(1, math.ceil(total_mb / BUCKET_TARGET_MB))
+
+
+def bucket_path(bucket_dir, side, bucket):
+    return os.path.join(bucket_dir, f"{side}_{bucket}.pkl")
+
+
+def _keep(usecols):
+    if usecols is None:
+        return None
+    wanted = set(usecols)
+    return lambda col: str(col) in wanted or str(col).strip() in wanted
+
+
+def with_blanks(dtype):
+    """The dtype pandas gives a column of ``dtype`` once it holds blanks (int64 -> float64)"""
+    return pd.Series([], dtype=dtype).reindex([0]).dtype
+
+
+def scan_dtypes(file_path, usecols=None):
+    """The dtype of every column as if the whole CSV were read at once.
+
+    Read in chunks, pandas infers each chunk on its own: a column with a
+    blank in one chunk only is float there and int elsewhere, and a chunk
+    of blanks looks numeric. Combining the chunks' types the way
+    ``pd.concat`` does, ignoring all-blank chunks, gives the type a single
+    ``read_csv`` would. Columns with text in any chunk map to ``str``: a
+    single read keeps every value of them as written, so they have to be
+    read as text, not cast after pandas has parsed ``1001`` as ``1001.0``.
+    Returns the dtypes by column name (read_csv makes repeated names
+    unique).
+    """
+    seen = {}
+    has_blanks = set()
+    text = set()
+    for chunk in pd.read_csv(file_path, usecols=_keep(usecols), chunksize=READ_CHUNK_ROWS):
+        for col in chunk.columns:
+            blanks = chunk[col].isna()
+            if blanks.any():
+                has_blanks.add(col)
+            kinds = seen.setdefault(col, set())
+            if not blanks.all():
+                kinds.add(chunk[col].dtype)
+                if pd.api.types.infer_dtype(chunk[col], skipna=True) == 'string':
+                    text.add(col)
+    dtypes = {}
+    for col, kinds in seen.items():
+        if col in text:
+            dtypes[col] = str
+        elif not kinds:
+            # Nothing but blanks, which read_csv also reads as float
+            dtypes[col] = pd.api.types.pandas_dtype('float64')
+        else:
+            dtype = pd.concat([pd.Series([], dtype=kind) for kind in kinds]).dtype
+            dtypes[col] = with_blanks(dtype) if col in has_blanks else dtype
+    return dtypes
+
+
+def read_csv_chunks(file_path, usecols=None, nrows=None, dtypes=None):
+    # Text columns are parsed as text and every other chunk is cast to the
+    # whole-file dtypes from scan_dtypes, so every chunk (and the keys made
+    # from it) looks like the in-memory read
+    keep = _keep(usecols)
+    text = {col: str for col, dtype in (dtypes or {}).items() if dtype is str} or None
+    if nrows is not None:
+        return _cast(pd.read_csv(file_path, usecols=keep, nrows=nrows, dtype=text), dtypes)
+    return (_cast(chunk, dtypes)
+            for chunk in pd.read_csv(file_path, usecols=keep, chunksize=READ_CHUNK_ROWS, dtype=text))
+
+
+def _cast(chunk, dtypes):
+    if dtypes is None:
+        return chunk
+    for col in chunk.columns:
+        dtype = dtypes.get(col)
+        if dtype is not None and dtype is not str and chunk[col].dtype != dtype:
+            chunk[col] = chunk[col].astype(dtype)
+    return chunk
+
+
+def output_dtypes(header, other_side_only):
+    """Output dtypes of one side's columns: upcast when the other file has keys this one lacks.
+
+    Those keys give this side's columns blanks, as they do in the in-memory
+    merge, so every chunk is written with the type the whole column has.
+    """
+    return {col: with_blanks(dtype) if other_side_only else dtype
+            for col, dtype in header.dtypes.items() if col != MERGE_KEY}
+
+
+def cast_output(merged_df, targets):
+    for position, col in enumerate(merged_df.columns):
+        target = targets.get(col)
+        if target is not None and merged_df.iloc[:, position].dtype != target:
+            merged_df.isetitem(position, merged_df.iloc[:, position].astype(target))
+    return merged_df
+
+
+def prepared_csv(file_path, key_col, suffix, selected_columns, key_rules, label, dtypes=None, key_only=False):
+    """The prepared header and a generator of prepared chunks of one CSV input.
+
+    Unless ``dtypes`` gives them, the column types come from scanning the
+    file once first (see :func:`scan_dtypes`). ``key_only`` reads just the
+    key column.
+    """
+    usecols = {key_col} if key_only else merge_engine.projected_columns(key_col, selected_columns, suffix)
+    columns = [] if key_only else selected_columns
+    if dtypes is None:
+        dtypes = scan_dtypes(file_path, usecols)
+    header = merge_engine.prepare_side(read_csv_chunks(file_path, usecols, 0, dtypes),
+                                       key_col, suffix, columns, label, key_rules)
+    chunks = (merge_engine.prepare_side(chunk, key_col, suffix, columns, label, key_rules)
+              for chunk in read_csv_chunks(file_path, usecols, dtypes=dtypes))
+    return header, chunks
+
+
+def partition_csv(file_path, key_col, suffix, selected_columns, key_rules, n_buckets, bucket_dir, side, label, log):
+    """Split one CSV into on-disk buckets by the hash of its normalized key.
+
+    Rows with equal keys always land in the same bucket, so merging bucket
+    ``i`` of both files gives exactly the rows of the full merge for those
+    keys. Each bucket's rows per key are also written on their own, for
+    :func:`bucket_key_counts`. Returns the (empty) prepared frame
+    describing the columns.
+    """
+    header, chunks = prepared_csv(file_path, key_col, suffix, selected_columns, key_rules, label)
+
+    rows = 0
+    for side_chunk in chunks:
+        buckets = pd.util.hash_pandas_object(side_chunk[MERGE_KEY], index=False).to_numpy() % n_buckets
+        for bucket, part in side_chunk.groupby(buckets, sort=False):
+            # Several pickled chunks are appended to each bucket file
+            with open(bucket_path(bucket_dir, side, bucket), 'ab') as f:
+                pickle.dump(part, f, protocol=pickle.HIGHEST_PROTOCOL)
+            with open(bucket_path(bucket_dir, f"{side}_keys", bucket), 'ab') as f:
+                pickle.dump(key_stats.key_counts(part), f, protocol=pickle.HIGHEST_PROTOCOL)
+        rows += len(side_chunk)
+
+    log(f"{label}: partitioned {rows} rows into {n_buckets} buckets")
+    return header
+
+
+def sum_counts(parts):
+    """Add up rows-per-key counts taken from several chunks of one file"""
+    if not parts:
+        return pd.Series([], dtype='int64')
+    return pd.concat(parts).groupby(level=0, sort=False).sum()
+
+
+def bucket_key_counts(bucket_dir, side, n_buckets):
+    """Rows per key of one partitioned file; every key sits in a single bucket"""
+    return pd.concat([sum_counts(bucket_parts(bucket_dir, f"{side}_keys", bucket)) for bucket in range(n_buckets)])
+
+
+def csv_key_counts(file_path, key_col, suffix, key_rules, label, dtypes=None):
+    """Rows per key of one CSV, reading its key column alone"""
+    header, chunks = prepared_csv(file_path, key_col, suffix, [], key_rules, label, dtypes, key_only=True)
+    parts = []
+    for chunk in chunks:
+        parts.append(key_stats.key_counts(chunk))
+        if len(parts) >= 16:
+            parts = [sum_counts(parts)]
+    return sum_counts(parts)
+
+
+def check_counts(job, file1_counts, file2_counts, log):
+    """Log the predicted output and apply ``max_output_rows`` like the in-memory merge.
+
+    Returns the keys to keep one row of (see :func:`key_stats.check_output_size`)
+    and whether each file has keys the other lacks, which upcasts the other
+    file's columns (see :func:`output_dtypes`).
+    """
+    stats = key_stats.profile_counts([file1_counts, file2_counts])
+    for line in key_stats.describe(stats):
+        log(f"  {line}")
+    stats, collapse = key_stats.check_output_size([file1_counts, file2_counts], job.get('max_output_rows'),
+                                                  job.get('explosion_action'), log, stats)
+    file1_only = not file1_counts.index.isin(file2_counts.index).all()
+    file2_only = not file2_counts.index.isin(file1_counts.index).all()
+    return collapse, file1_only, file2_only
+
+
+def first_rows(chunks, keys):
+    # key_stats.keep_first_rows over the chunks of one file, whose rows for
+    # a key may continue in the next chunk
+    seen = set()
+    for chunk in chunks:
+        keep = key_stats.keep_first_rows(chunk, keys)
+        keep = keep[~(keep[MERGE_KEY].isin(seen) & keep[MERGE_KEY].isin(keys))]
+        seen.update(keep[MERGE_KEY][keep[MERGE_KEY].isin(keys)])
+        yield keep
+
+
+def bucket_parts(bucket_dir, side, bucket):
+    parts = []
+    try:
+        with open(bucket_path(bucket_dir, side, bucket), 'rb') as f:
+            while True:
+                try:
+                    parts.append(pickle.load(f))
+                except EOFError:
+                    break
+    except FileNotFoundError:
+        pass
+    return parts
+
+
+def load_bucket(bucket_dir, side, bucket, header):
+    parts = bucket_parts(bucket_dir, side, bucket)
+    if not parts:
+        return header
+    return pd.concat(parts, ignore_index=True)
+
+
+def merge_sorted_csv_pair(job, log=print):
+    """Stream two CSV files already sorted by key through a sort-merge join.
+
+    No buckets are written: both files are read chunk by chunk, merged as
+    soon as each key is complete and written straight to the output, so
+    memory stays at about one chunk per file, plus the rows-per-key counts
+    of a first pass over the key columns, and the output is sorted by key
+    across the whole file. Raises :class:`sorted_merge.UnsortedKeysError`
+    as soon as either file turns out not to be sorted.
+    """
+    import sorted_merge
+
+    selected_columns = job.get('selected_columns') or []
+    key_rules = merge_keys.parse_rules(job.get('key_rules'))
+    inputs = [(job['file1_path'], job['file1_key_column'], '_file1', "File 1"),
+              (job['file2_path'], job['file2_key_column'], '_file2', "File 2")]
+    dtypes = [scan_dtypes(file_path, merge_engine.projected_columns(key_col, selected_columns, suffix))
+              for file_path, key_col, suffix, label in inputs]
+
+    # A first pass over the key columns alone predicts the output and finds
+    # the keys present in one file only, before any row is written
+    file1_counts, file2_counts = [csv_key_counts(file_path, key_col, suffix, key_rules, label, file_dtypes)
+                                  for (file_path, key_col, suffix, label), file_dtypes in zip(inputs, dtypes)]
+    collapse, file1_only, file2_only = check_counts(job, file1_counts, file2_counts, log)
+
+    (file1_header, file1_chunks), (file2_header, file2_chunks) = [
+        prepared_csv(file_path, key_col, suffix, selected_columns, key_rules, label, file_dtypes)
+        for (file_path, key_col, suffix, label), file_dtypes in zip(inputs, dtypes)]
+    if collapse:
+        file1_chunks, file2_chunks = first_rows(file1_chunks, collapse), first_rows(file2_chunks, collapse)
+
+    merged_columns = list(file1_header.columns) + [col for col in file2_header.columns if col != MERGE_KEY]
+    final_cols = merge_engine.output_columns(merged_columns, selected_columns)
+    targets = {**output_dtypes(file1_header, file2_only), **output_dtypes(file2_header, file1_only)}
+    rows_written = [0]
+
+    def merged_chunks():
+        for merged_df in sorted_merge.merge_sorted_chunks(file1_chunks, file2_chunks, file1_header, file2_header):
+            rows_written[0] += len(merged_df)
+            yield cast_output(merged_df[final_cols], targets)
+
+    log("Sort-merge join of key-sorted inputs")
+    output_path = merge_engine.prepare_output_path(job['output_file_path'], log, streaming=True)
+    excel_io.write_chunks(merged_chunks(), output_path, final_cols)
+    return output_path, rows_written[0], len(final_cols)
+
+
+def merge_csv_pair(job, log=print):
+    """Merge two CSV files larger than memory and stream the result to disk.
+
+    Both inputs are partitioned into key-hash buckets on disk, then each
+    bucket pair is merged in memory and written straight to the output, so
+    peak memory is one bucket pair plus one output chunk. The outer-join
+    rows, the output columns and their types are the same as an in-memory
+    merge; rows are sorted by key within each bucket rather than across the
+    whole file. Each input is scanned once beforehand for its column types.
+    The output size is predicted from the keys before any bucket is merged,
+    and ``max_output_rows``/``explosion_action`` apply as in
+    :func:`merge_engine.process_pair`.
+
+    With ``sorted_keys`` the files are first streamed through
+    :func:`merge_sorted_csv_pair`; under ``'auto'`` an unsorted file falls
+    back to the bucketed merge.
+
+    Returns the output path, the number of rows written and the number of
+    output columns.
+    """
+    file1_path = job['file1_path']
+    file2_path = job['file2_path']
+    for label, path in (("File 1", file1_path), ("File 2", file2_path)):
+        if excel_io.sniff_format(path) != 'csv':
+            raise ValueError(f"Out-of-core merge needs CSV inputs, but {label} is not CSV: {path}")
+
+    sorted_keys = job.get('sorted_keys')
+    if sorted_keys:
+        import sorted_merge
+        try:
+            return merge_sorted_csv_pair(job, log)
+        except sorted_merge.UnsortedKeysError as e:
+            if sorted_keys is True:
+                raise
+            # The partial output was never renamed into place
+            log(f"{str(e)}; using the bucketed merge instead")
+
+    file1_key_col = job['file1_key_column']
+    file2_key_col = job['file2_key_column']
+    selected_columns = job.get('selected_columns') or []
+    key_rules = merge_keys.parse_rules(job.get('key_rules'))
+    n_buckets = job.get('buckets') or bucket_count(file1_path, file2_path)
+
+    with tempfile.TemporaryDirectory(prefix='merge_buckets_', dir=job.get('temp_dir')) as bucket_dir:
+        log(f"Out-of-core merge using {n_buckets} buckets in {bucket_dir}")
+        file1_header = partition_csv(file1_path, file1_key_col, '_file1', selected_columns, key_rules,
+                                     n_buckets, bucket_dir, 'file1', "File 1", log)
+        file2_header = partition_csv(file2_path, file2_key_col, '_file2', selected_columns, key_rules,
+                                     n_buckets, bucket_dir, 'file2', "File 2", log)
+
+        merged_columns = list(file1_header.columns) + [col for col in file2_header.columns if col != MERGE_KEY]
+        final_cols = merge_engine.output_columns(merged_columns, selected_columns)
+        collapse, file1_only, file2_only = check_counts(job, bucket_key_counts(bucket_dir, 'file1', n_buckets),
+                                                        bucket_key_counts(bucket_dir, 'file2', n_buckets), log)
+        targets = {**output_dtypes(file1_header, file2_only), **output_dtypes(file2_header, file1_only)}
+        rows_written = [0]
+
+        def merged_buckets():
+            for bucket in range(n_buckets):
+                sides = [load_bucket(bucket_dir, 'file1', bucket, file1_header),
+                         load_bucket(bucket_dir, 'file2', bucket, file2_header)]
+                if collapse:
+                    # A bucket holds all rows of its keys, in file order
+                    sides = [key_stats.keep_first_rows(side, collapse) for side in sides]
+                merged_df = merge_engine.merge_sides(*sides)
+                rows_written[0] += len(merged_df)
+                # Buckets without one-sided keys would keep int columns as ints
+                yield cast_output(merged_df[final_cols], targets)
+
+        output_path = merge_engine.prepare_output_path(job['output_file_path'], log, streaming=True)
+        excel_io.write_chunks(merged_buckets(), output_path, final_cols)
+
+    return output_path, rows_written[0], len(final_cols)
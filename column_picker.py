@@ -0,0 +1,113 @@
+import tkinter as tk
+from tkinter import ttk
+
+# Output columns a pair may select, as the picker has always allowed
+MAX_SELECTED = 10
+
+
+class ColumnPicker(ttk.Frame):
+    """Searchable multi-select list of output columns.
+
+    A single Listbox holds the column names, and Tk only draws the rows in
+    view, so building the picker costs the same for 20 or 2,000 columns.
+    The chosen columns live in a set; a click adds or removes one name
+    instead of rescanning every column. Typing in the search box narrows the
+    list to names containing the text (case-insensitive) without losing the
+    selection. ``on_change`` is called with the selected columns, in column
+    order, after every change.
+    """
+
+    def __init__(self, parent, on_change=None, max_selected=MAX_SELECTED, height=8):
+        super().__init__(parent)
+        self.on_change = on_change
+        self.max_selected = max_selected
+        self.columns = []
+        self.order = {}        # column -> position in self.columns
+        self.visible = []      # columns currently listed, in column order
+        self.rows = {}         # visible column -> listbox row
+        self.selected = set()
+        self.query = ''
+
+        search_frame = ttk.Frame(self)
+        search_frame.pack(fill='x', padx=5, pady=(5, 2))
+        ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add('write', lambda *args: self.apply_filter())
+        ttk.Entry(search_frame, textvariable=self.search_var, width=30).pack(side=tk.LEFT, padx=5)
+        ttk.Button(search_frame, text="Clear Selection", command=self.clear_selection).pack(side=tk.LEFT, padx=5)
+
+        list_frame = ttk.Frame(self)
+        list_frame.pack(fill='both', expand=True, padx=5, pady=2)
+        self.listbox = tk.Listbox(list_frame, selectmode=tk.MULTIPLE, height=height, exportselection=False,
+                                  activestyle='none')
+        scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.listbox.yview)
+        self.listbox.configure(yscrollcommand=scrollbar.set)
+        self.listbox.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        self.listbox.bind('<<ListboxSelect>>', self.on_select)
+
+        self.count_label = ttk.Label(self, text=self.count_text())
+        self.count_label.pack(anchor='w', padx=5, pady=(2, 5))
+
+    def set_columns(self, columns):
+        """Replace the list of columns; clears the selection and the search"""
+        self.columns = list(columns)
+        self.order = {col: i for i, col in enumerate(self.columns)}
+        self.selected = set()
+        self.query = None
+        if self.search_var.get():
+            # The trace refills the list
+            self.search_var.set('')
+        else:
+            self.apply_filter()
+        self.changed()
+
+    def selected_columns(self):
+        """The selected columns in the order they appear in the files"""
+        return sorted(self.selected, key=self.order.__getitem__)
+
+    def apply_filter(self):
+        query = self.search_var.get().strip().casefold()
+        if self.query is not None and query.startswith(self.query):
+            # Typing more only narrows the current matches
+            candidates = self.visible
+        else:
+            candidates = self.columns
+        self.visible = [col for col in candidates if query in col.casefold()] if query else list(candidates)
+        self.query = query
+
+        self.rows = {col: row for row, col in enumerate(self.visible)}
+        self.listbox.delete(0, tk.END)
+        if self.visible:
+            self.listbox.insert(tk.END, *self.visible)
+        for col in self.selected:
+            row = self.rows.get(col)
+            if row is not None:
+                self.listbox.selection_set(row)
+
+    def on_select(self, event=None):
+        # Compare the listbox selection with the visible part of the set:
+        # only the clicked row differs, so this never walks all columns
+        now = {self.visible[row] for row in self.listbox.curselection()}
+        before = {col for col in self.selected if col in self.rows}
+        for col in before - now:
+            self.selected.discard(col)
+        for col in now - before:
+            if len(self.selected) < self.max_selected:
+                self.selected.add(col)
+            else:
+                self.listbox.selection_clear(self.rows[col])
+        self.changed()
+
+    def clear_selection(self):
+        self.selected.clear()
+        self.listbox.selection_clear(0, tk.END)
+        self.changed()
+
+    def count_text(self):
+        return f"Selected: {len(self.selected)}/{self.max_selected}"
+
+    def changed(self):
+        self.count_label.configure(text=self.count_text())
+        if self.on_change is not None:
+            self.on_change(self.selected_columns())
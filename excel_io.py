@@ -0,0 +1,476 @@
+import os
+import fnmatch
+import zipfile
+import contextlib
+import pandas as pd
+
+# Leading bytes of the container formats we can tell apart without parsing
+ZIP_MAGIC = b'PK\x03\x04'
+OLE2_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+# Reader used for each format when calamine is not installed
+CLASSIC_ENGINES = {
+    'xlsx': 'openpyxl',
+    'xls': 'xlrd',
+    'xlsb': 'pyxlsb',
+    'ods': 'odf',
+}
+
+
+def calamine_available():
+    """True when pandas can use the Rust calamine reader (pandas >= 2.2)"""
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return False
+    try:
+        major, minor = (int(part) for part in pd.__version__.split('.')[:2])
+    except ValueError:
+        return False
+    return (major, minor) >= (2, 2)
+
+
+def sniff_format(file_path):
+    """Identify a spreadsheet by its content rather than its extension.
+
+    Returns one of 'xlsx', 'xlsb', 'ods', 'xls', 'html' or 'csv'. Exports
+    from school management systems are often named .xls while actually being
+    xlsx, HTML or CSV, so the extension alone picks the wrong reader. Raises
+    ValueError for XML that is not XHTML, such as Excel 2003 SpreadsheetML.
+    """
+    with open(file_path, 'rb') as f:
+        head = f.read(512)
+
+    if head.startswith(ZIP_MAGIC):
+        try:
+            with zipfile.ZipFile(file_path) as archive:
+                names = set(archive.namelist())
+                if 'xl/workbook.bin' in names:
+                    return 'xlsb'
+                if 'mimetype' in names and b'opendocument.spreadsheet' in archive.read('mimetype'):
+                    return 'ods'
+        except zipfile.BadZipFile:
+            pass
+        return 'xlsx'
+
+    if head.startswith(OLE2_MAGIC):
+        return 'xls'
+
+    text = head.lstrip(b'\xef\xbb\xbf \t\r\n').lower()
+    if text.startswith((b'<html', b'<!doctype html', b'<table')):
+        return 'html'
+    if text.startswith(b'<?xml'):
+        root = _xml_root(text)
+        if root.startswith((b'<html', b'<!doctype html')):
+            return 'html'
+        if root.startswith((b'<workbook', b'<ss:workbook')):
+            raise ValueError(f"{file_path} is an Excel 2003 XML spreadsheet (SpreadsheetML), which is not "
+                             f"supported; open it in Excel and save it as .xlsx")
+        raise ValueError(f"{file_path} is an XML file, not a supported spreadsheet or HTML table")
+
+    return 'csv'
+
+
+def _xml_root(text):
+    # The text from the root element on, past the XML declaration,
+    # processing instructions (<?mso-application ...?>) and comments
+    while True:
+        text = text.lstrip()
+        if text.startswith(b'<?'):
+            closing = b'?>'
+        elif text.startswith(b'<!--'):
+            closing = b'-->'
+        else:
+            return text
+        end = text.find(closing)
+        if end < 0:
+            return b''
+        text = text[end+len(closing):]
+
+
+def choose_engine(file_format, engine=None):
+    """Pick the pandas reader engine for a sniffed format.
+
+    An explicit ``engine`` wins; otherwise calamine is used for every Excel
+    format when it is installed, falling back to the classic reader.
+    """
+    if file_format in ('csv', 'html'):
+        return None
+    if engine:
+        return engine
+    if calamine_available():
+        return 'calamine'
+    return CLASSIC_ENGINES[file_format]
+
+
+def list_sheet_names(file_path):
+    """Sheet names in tab order, without parsing any cell data.
+
+    For xlsx/xlsm only the small ``xl/workbook.xml`` part of the archive is
+    read; other formats fall back to opening a single ``pd.ExcelFile``.
+    """
+    if sniff_format(file_path) == 'xlsx':
+        from xml.etree import ElementTree
+        try:
+            with zipfile.ZipFile(file_path) as archive:
+                root = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+        except (KeyError, zipfile.BadZipFile, ElementTree.ParseError):
+            pass
+        else:
+            # Match on the local name: strict OOXML files use another namespace
+            return [node.get('name') for node in root.iter() if node.tag.rsplit('}', 1)[-1] == 'sheet']
+
+    with pd.ExcelFile(file_path) as excel_file:
+        return excel_file.sheet_names
+
+
+# Column added to tables stacked from several sheets, naming each row's sheet
+SOURCE_SHEET = 'Source_Sheet'
+
+
+def is_multi_sheet(selection):
+    """True when a sheet selection may name several sheets: a list or a pattern such as "*" or "Class*" """
+    if isinstance(selection, (list, tuple)):
+        return True
+    return isinstance(selection, str) and any(char in selection for char in '*?[')
+
+
+def select_sheets(sheet_names, selection):
+    """The sheets of a workbook picked by a selection, in tab order.
+
+    A blank selection picks the first sheet, a number the sheet at that
+    position and a name that exact sheet. Patterns ("*", "Class ?") match
+    names case-insensitively; a list combines names and patterns.
+    """
+    if selection is None or selection == '':
+        return sheet_names[:1]
+    if isinstance(selection, int):
+        if not 0 <= selection < len(sheet_names):
+            raise ValueError(f"Sheet index {selection} is out of range ({len(sheet_names)} sheets)")
+        return [sheet_names[selection]]
+
+    wanted = selection if isinstance(selection, (list, tuple)) else [selection]
+    chosen = set()
+    for item in wanted:
+        item = str(item)
+        if is_multi_sheet(item):
+            pattern = item.lower()
+            chosen.update(name for name in sheet_names if fnmatch.fnmatchcase(name.lower(), pattern))
+        elif item in sheet_names:
+            chosen.add(item)
+        else:
+            raise ValueError(f"Sheet '{item}' not found. Sheets: {', '.join(sheet_names)}")
+    if not chosen:
+        raise ValueError(f"No sheet matches {', '.join(map(str, wanted))}. Sheets: {', '.join(sheet_names)}")
+    return [name for name in sheet_names if name in chosen]
+
+
+def arrow_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def to_arrow_backed(df):
+    """The frame with Arrow-backed columns: string[pyarrow] text, Arrow floats and booleans.
+
+    Columns that mix numbers with text (a score column holding "缺考") have
+    no single Arrow type and stay Python objects. Floats are not turned into
+    integers, and dates keep their NumPy type, which writes them as before.
+    """
+    converted = df.copy(deep=False)
+    for position, dtype in enumerate(df.dtypes):
+        # Dates and durations are skipped outright: converting them can
+        # overwrite blanks in the source frame with 1970-01-01
+        if dtype.kind not in 'mM':
+            converted.isetitem(position, df.iloc[:, position].convert_dtypes(convert_integer=False,
+                                                                             dtype_backend='pyarrow'))
+    return converted
+
+
+def read_table(file_path, file_format, engine, usecols=None, nrows=None, sheet_name=0, arrow=False):
+    """Parse a sniffed file with a single reader call.
+
+    ``usecols`` is a set of column names to keep; a header matches with or
+    without surrounding whitespace. ``nrows`` limits the rows parsed and
+    ``sheet_name`` picks the worksheet of an Excel file. ``arrow`` returns
+    Arrow-backed columns: CSV is parsed with ``dtype_backend="pyarrow"``,
+    and the Excel readers' output is converted with :func:`to_arrow_backed`
+    (they fail outright on mixed columns when asked for Arrow types).
+    """
+    if usecols is not None:
+        wanted = set(usecols)
+        keep = lambda col: str(col) in wanted or str(col).strip() in wanted
+    else:
+        keep = None
+
+    if file_format == 'csv':
+        if arrow:
+            return pd.read_csv(file_path, usecols=keep, nrows=nrows, dtype_backend='pyarrow')
+        return pd.read_csv(file_path, usecols=keep, nrows=nrows)
+    if file_format == 'html':
+        # read_html cannot project while parsing, so trim afterwards
+        df = pd.read_html(file_path)[0]
+        if keep is not None:
+            df = df[[col for col in df.columns if keep(col)]]
+        df = df if nrows is None else df.head(nrows)
+    else:
+        df = pd.read_excel(file_path, sheet_name=sheet_name, engine=engine, usecols=keep, nrows=nrows)
+    return to_arrow_backed(df) if arrow else df
+
+
+# Rows handed to a streaming writer at a time
+WRITE_CHUNK_ROWS = 50000
+
+# Output extensions understood by write_table; anything else is written as xlsx
+CSV_SUFFIXES = ('.csv', '.csv.gz', '.csv.bz2', '.csv.xz', '.csv.zip', '.csv.zst')
+OUTPUT_SUFFIXES = CSV_SUFFIXES + ('.parquet', '.feather', '.xlsx')
+
+
+def output_format(output_path):
+    """Map an output path to 'csv', 'parquet', 'feather' or 'xlsx'"""
+    lower = output_path.lower()
+    if lower.endswith(CSV_SUFFIXES):
+        return 'csv'
+    if lower.endswith('.parquet'):
+        return 'parquet'
+    if lower.endswith('.feather'):
+        return 'feather'
+    return 'xlsx'
+
+
+def _full_suffix(output_path):
+    # ".csv.gz" rather than ".gz", so compression and format are both kept
+    lower = output_path.lower()
+    for suffix in OUTPUT_SUFFIXES:
+        if lower.endswith(suffix):
+            return output_path[-len(suffix):]
+    return os.path.splitext(output_path)[1]
+
+
+def _new_temp_file(directory, suffix):
+    # Like tempfile.mkstemp, but asks for the default 0o666 mode instead of a
+    # private 0600 one, so the OS applies the umask as for any new file
+    # (reading the umask would mean changing it, which is process-wide)
+    while True:
+        tmp_path = os.path.join(directory, f".~{os.urandom(6).hex()}{suffix}")
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            continue
+        os.close(fd)
+        return tmp_path
+
+
+def _copy_permissions(target_path, tmp_path):
+    # A replaced file keeps the mode it had
+    try:
+        mode = os.stat(target_path).st_mode & 0o7777
+    except FileNotFoundError:
+        return
+    os.chmod(tmp_path, mode)
+
+
+@contextlib.contextmanager
+def atomic_output(output_path):
+    """Yield a temporary path that replaces ``output_path`` only once fully written.
+
+    The temporary file sits in the same folder and keeps the extension, so
+    writers that choose a format from it still work and the final rename is
+    atomic. A crash or cancel mid-write leaves the previous file untouched.
+    """
+    directory = os.path.dirname(os.path.abspath(output_path))
+    tmp_path = _new_temp_file(directory, _full_suffix(output_path))
+    try:
+        yield tmp_path
+        _copy_permissions(output_path, tmp_path)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def iter_chunks(df, chunk_rows=WRITE_CHUNK_ROWS):
+    """Slice a frame into row blocks without copying the data"""
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def write_table(df, output_path, streaming=False):
+    """Write a frame in the format implied by the file extension.
+
+    With ``streaming`` the rows are written chunk by chunk through
+    :func:`write_chunks`, so memory stays flat however large the frame is.
+    The file is written under a temporary name and renamed when complete.
+    """
+    file_format = output_format(output_path)
+    with atomic_output(output_path) as tmp_path:
+        if streaming:
+            _write_chunks(iter_chunks(df), tmp_path, list(df.columns))
+        elif file_format == 'csv':
+            # Compression is inferred from .gz/.bz2/.xz/.zip/.zst
+            df.to_csv(tmp_path, index=False)
+        elif file_format in ('parquet', 'feather'):
+            _write_arrow_table(df, tmp_path, file_format)
+        else:
+            df.to_excel(tmp_path, index=False, engine='openpyxl')
+
+
+def write_chunks(chunks, output_path, columns):
+    """Write an iterable of frames sharing ``columns`` as one output file.
+
+    Only one chunk is held at a time. xlsx goes through xlsxwriter's
+    constant_memory mode when it is installed, otherwise an openpyxl
+    write-only workbook. Like :func:`write_table`, the file only appears
+    under its final name once it is complete.
+    """
+    with atomic_output(output_path) as tmp_path:
+        _write_chunks(chunks, tmp_path, columns)
+
+
+def _write_chunks(chunks, output_path, columns):
+    file_format = output_format(output_path)
+    if file_format == 'csv':
+        _write_csv_chunks(chunks, output_path, columns)
+    elif file_format in ('parquet', 'feather'):
+        _write_arrow_chunks(chunks, output_path, file_format)
+    else:
+        try:
+            import xlsxwriter  # noqa: F401
+        except ImportError:
+            _write_openpyxl_chunks(chunks, output_path, columns)
+        else:
+            _write_xlsxwriter_chunks(chunks, output_path, columns)
+
+
+def _open_text(output_path):
+    lower = output_path.lower()
+    if lower.endswith('.gz'):
+        import gzip
+        return gzip.open(output_path, 'wt', encoding='utf-8', newline='')
+    if lower.endswith('.bz2'):
+        import bz2
+        return bz2.open(output_path, 'wt', encoding='utf-8', newline='')
+    if lower.endswith('.xz'):
+        import lzma
+        return lzma.open(output_path, 'wt', encoding='utf-8', newline='')
+    if lower.endswith(('.zip', '.zst')):
+        raise ValueError("Streaming output supports .csv, .csv.gz, .csv.bz2 and .csv.xz")
+    return open(output_path, 'w', encoding='utf-8', newline='')
+
+
+def _write_csv_chunks(chunks, output_path, columns):
+    with _open_text(output_path) as f:
+        wrote_header = False
+        for chunk in chunks:
+            chunk.to_csv(f, index=False, header=not wrote_header)
+            wrote_header = True
+        if not wrote_header:
+            pd.DataFrame(columns=columns).to_csv(f, index=False)
+
+
+def _arrow_safe(chunk):
+    # Arrow needs one type per column; marksheet columns often mix numbers
+    # with text such as "缺考", so those are written as strings
+    for col in chunk.columns:
+        if chunk[col].dtype == object and pd.api.types.infer_dtype(chunk[col], skipna=True).startswith('mixed'):
+            chunk = chunk.assign(**{col: chunk[col].map(lambda v: v if pd.isna(v) else str(v))})
+    return chunk
+
+
+def _write_arrow_table(df, output_path, file_format):
+    # Arrow-backed columns are handed to the writer without copying their buffers
+    import pyarrow as pa
+    import pyarrow.feather
+    import pyarrow.parquet
+
+    table = pa.Table.from_pandas(_arrow_safe(df), preserve_index=False)
+    if file_format == 'parquet':
+        pyarrow.parquet.write_table(table, output_path)
+    else:
+        pyarrow.feather.write_feather(table, output_path)
+
+
+def _write_arrow_chunks(chunks, output_path, file_format):
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    writer = None
+    schema = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(_arrow_safe(chunk), schema=schema, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                if file_format == 'parquet':
+                    writer = pyarrow.parquet.ParquetWriter(output_path, schema)
+                else:
+                    writer = pyarrow.ipc.new_file(output_path, schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _excel_rows(chunks):
+    # Excel has no NaN: blank cells are written as None
+    for chunk in chunks:
+        cleaned = chunk.astype(object).where(chunk.notna(), None)
+        for row in cleaned.itertuples(index=False, name=None):
+            yield row
+
+
+def _write_openpyxl_chunks(chunks, output_path, columns):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+
+    header = []
+    for col in columns:
+        cell = WriteOnlyCell(sheet, value=str(col))
+        cell.font = Font(bold=True)
+        header.append(cell)
+    sheet.append(header)
+
+    for row in _excel_rows(chunks):
+        sheet.append(row)
+    workbook.save(output_path)
+
+
+def _write_xlsxwriter_chunks(chunks, output_path, columns):
+    import datetime
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(output_path, {
+        'constant_memory': True,
+        'remove_timezone': True,
+        'nan_inf_to_errors': True,
+        # Keep text cells as text, like the pandas/openpyxl writer does
+        'strings_to_urls': False,
+        'strings_to_numbers': False,
+    })
+    try:
+        sheet = workbook.add_worksheet('Sheet1')
+        bold = workbook.add_format({'bold': True})
+        date_format = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+
+        sheet.write_row(0, 0, [str(col) for col in columns], bold)
+        for row_idx, row in enumerate(_excel_rows(chunks), start=1):
+            for col_idx, value in enumerate(row):
+                if value is None:
+                    continue
+                if isinstance(value, (datetime.datetime, datetime.date)):
+                    sheet.write_datetime(row_idx, col_idx, value, date_format)
+                else:
+                    sheet.write(row_idx, col_idx, value)
+    finally:
+        workbook.close()
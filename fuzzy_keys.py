@@ -0,0 +1,190 @@
+import re
+import difflib
+import unicodedata
+import numpy as np
+import pandas as pd
+
+from merge_engine import MERGE_KEY
+
+# Columns added to the output when a pair asks for them
+MATCH_CONFIDENCE = 'Match_Confidence'
+FUZZY_MATCHED_KEY = 'Fuzzy_Matched_Key'
+FUZZY_COLUMNS = [MATCH_CONFIDENCE, FUZZY_MATCHED_KEY]
+
+# Similarity (difflib ratio of the cleaned keys) a fuzzy match needs
+DEFAULT_THRESHOLD = 0.85
+
+# Bigrams shared by more keys than this (a common surname, "S00") say too
+# little to block on; skipping them keeps the candidate pairs near-linear
+MAX_BLOCK_SIZE = 50
+
+# Candidates scored per unmatched key, best bigram overlap first
+CANDIDATES_PER_KEY = 5
+
+# Left keys on each side of a right key's place in sorted order that are
+# also scored; catches keys whose bigrams are all too common to block on
+NEIGHBOURHOOD = 3
+
+
+def parse_threshold(value):
+    """The similarity threshold a job's ``fuzzy_keys`` setting asks for, or None when off"""
+    if value is None or value is False or value == '':
+        return None
+    if value is True:
+        return DEFAULT_THRESHOLD
+    threshold = float(value)
+    if not 0 < threshold <= 1:
+        raise ValueError(f"Fuzzy key threshold must be between 0 and 1, got {value}")
+    return threshold
+
+
+# Spaces and punctuation; Python's re treats CJK characters as word characters
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def clean_keys(keys):
+    """Keys reduced to what identifies them: NFKC, case-folded, without spaces or punctuation"""
+    return [_SEPARATORS.sub('', unicodedata.normalize('NFKC', str(key)).casefold()) for key in keys]
+
+
+def _bigrams(cleaned):
+    # One row per distinct bigram of each padded key, so one-letter keys still
+    # have grams and the first and last characters weigh in
+    rows = [(i, gram) for i, key in enumerate(cleaned)
+            for gram in {f"^{key}$"[j:j+2] for j in range(len(key) + 1)}]
+    return pd.DataFrame(rows, columns=['id', 'gram'])
+
+
+def candidate_pairs(left_clean, right_clean):
+    """Pairs of (left id, right id) that share a selective bigram.
+
+    Only the CANDIDATES_PER_KEY right keys with the most shared bigrams are
+    kept per left key, so scoring stays linear in the number of keys.
+    """
+    left_grams = _bigrams(left_clean)
+    right_grams = _bigrams(right_clean)
+    for grams in (left_grams, right_grams):
+        sizes = grams['gram'].map(grams['gram'].value_counts())
+        grams.drop(grams.index[sizes > MAX_BLOCK_SIZE], inplace=True)
+
+    pairs = left_grams.merge(right_grams, on='gram', suffixes=('_left', '_right'))
+    if pairs.empty:
+        return pd.DataFrame({'left': [], 'right': []}, dtype='int64')
+    shared = pairs.groupby(['id_left', 'id_right'], sort=False).size().reset_index(name='shared')
+    shared = shared.sort_values(['id_left', 'shared'], ascending=[True, False], kind='stable')
+    shared = shared.groupby('id_left', sort=False).head(CANDIDATES_PER_KEY)
+    return pd.DataFrame({'left': shared['id_left'].to_numpy(), 'right': shared['id_right'].to_numpy()})
+
+
+def sorted_neighbours(left_clean, right_clean, window=NEIGHBOURHOOD):
+    """Pairs of (left id, right id) that sort next to each other.
+
+    Every right key is paired with the ``window`` left keys just before and
+    after its place in sorted order, once forwards and once on the reversed
+    strings, so a difference at either end still leaves the rest adjacent.
+    """
+    parts = []
+    for reverse in (False, True):
+        left_text = np.array([key[::-1] if reverse else key for key in left_clean], dtype=object)
+        right_text = np.array([key[::-1] if reverse else key for key in right_clean], dtype=object)
+        order = np.argsort(left_text, kind='stable')
+        places = np.searchsorted(left_text[order], right_text)
+        offsets = np.arange(-window, window)
+        positions = places[:, None] + offsets[None, :]
+        valid = (positions >= 0) & (positions < len(order))
+        right_ids = np.broadcast_to(np.arange(len(right_text))[:, None], positions.shape)[valid]
+        parts.append(pd.DataFrame({'left': order[positions[valid]], 'right': right_ids}))
+    return pd.concat(parts, ignore_index=True)
+
+
+def find_matches(left_keys, right_keys, threshold=DEFAULT_THRESHOLD):
+    """Match two lists of distinct keys one-to-one by similarity.
+
+    Keys that are equal once cleaned (see :func:`clean_keys`) match with
+    confidence 1.0. The rest are blocked on shared character bigrams and on
+    sorted neighbourhoods, never compared all against all, and scored with
+    difflib's ratio on the cleaned keys; pairs at or above
+    ``threshold`` are assigned best first, each key at most once. Returns a
+    frame of ``left``, ``right`` and ``confidence``.
+    """
+    left_keys = list(left_keys)
+    right_keys = list(right_keys)
+    empty = pd.DataFrame({'left': pd.Series(dtype=object), 'right': pd.Series(dtype=object),
+                          'confidence': pd.Series(dtype='float64')})
+    if not left_keys or not right_keys:
+        return empty
+
+    left_clean = clean_keys(left_keys)
+    right_clean = clean_keys(right_keys)
+    left_ok = np.array([key != '' for key in left_clean], dtype=bool)
+    right_ok = np.array([key != '' for key in right_clean], dtype=bool)
+
+    # Equal cleaned keys are always candidates, even when all their bigrams are common
+    exact = pd.DataFrame({'clean': left_clean, 'left': range(len(left_clean))}).merge(
+        pd.DataFrame({'clean': right_clean, 'right': range(len(right_clean))}), on='clean')
+    candidates = pd.concat([exact[['left', 'right']], candidate_pairs(left_clean, right_clean),
+                            sorted_neighbours(left_clean, right_clean)], ignore_index=True).drop_duplicates()
+    left_ids = candidates['left'].to_numpy()
+    right_ids = candidates['right'].to_numpy()
+    keep = left_ok[left_ids] & right_ok[right_ids]
+    left_ids, right_ids = left_ids[keep], right_ids[keep]
+
+    # The ratio can never beat 2*min/(sum) of the lengths; skip hopeless pairs
+    left_len = np.array([len(key) for key in left_clean])
+    right_len = np.array([len(key) for key in right_clean])
+    bound = 2 * np.minimum(left_len[left_ids], right_len[right_ids]) / (left_len[left_ids] + right_len[right_ids])
+    left_ids, right_ids = left_ids[bound >= threshold], right_ids[bound >= threshold]
+
+    scores = [difflib.SequenceMatcher(None, left_clean[i], right_clean[j]).ratio() for i, j in zip(left_ids, right_ids)]
+    scored = pd.DataFrame({'left': left_ids, 'right': right_ids, 'confidence': scores})
+    scored = scored[scored['confidence'] >= threshold]
+    # Best score first; ties go to the earlier keys so runs are repeatable
+    scored = scored.sort_values(['confidence', 'left', 'right'], ascending=[False, True, True], kind='stable')
+
+    used_left, used_right = set(), set()
+    matches = []
+    for i, j, confidence in scored.itertuples(index=False, name=None):
+        if i in used_left or j in used_right:
+            continue
+        used_left.add(i)
+        used_right.add(j)
+        matches.append((left_keys[i], right_keys[j], round(float(confidence), 4)))
+    if not matches:
+        return empty
+    return pd.DataFrame(matches, columns=['left', 'right', 'confidence'])
+
+
+def match_unmatched_keys(left_side, right_side, threshold=DEFAULT_THRESHOLD, add_columns=False, log=print):
+    """Second pass over the keys an exact merge would leave unmatched.
+
+    Right-side keys with no exact partner are matched to left-side keys
+    with no exact partner (see :func:`find_matches`) and rewritten to the
+    left key, so the normal merge then joins them. Blank keys are never
+    matched. With ``add_columns`` the right side gains ``Match_Confidence``
+    (1.0 for exact matches) and ``Fuzzy_Matched_Key`` (its original key).
+    Returns the new right side and the matches.
+    """
+    left_keys = pd.Index(left_side[MERGE_KEY].unique())
+    right_keys = pd.Index(right_side[MERGE_KEY].unique())
+    left_only = [key for key in left_keys.difference(right_keys, sort=False) if key != '']
+    right_only = [key for key in right_keys.difference(left_keys, sort=False) if key != '']
+
+    matches = find_matches(left_only, right_only, threshold)
+    log(f"Fuzzy key matching: {len(matches)} of {len(right_only)} unmatched File 2 keys matched "
+        f"(threshold {threshold})")
+    for left, right, confidence in matches.head(5).itertuples(index=False, name=None):
+        log(f"  '{right}' -> '{left}' ({confidence:.2f})")
+
+    keys = right_side[MERGE_KEY]
+    right_side = right_side.copy(deep=False)
+    remapped = pd.Series(matches['left'].to_numpy(), index=matches['right'].to_numpy(), dtype=object)
+    if len(matches):
+        new_keys = keys.map(remapped)
+        right_side.isetitem(0, new_keys.where(new_keys.notna(), keys).astype(keys.dtype))
+
+    if add_columns:
+        confidence = keys.map(pd.Series(matches['confidence'].to_numpy(), index=matches['right'].to_numpy()))
+        confidence = confidence.where(~keys.isin(left_keys), 1.0).astype('float64')
+        right_side[MATCH_CONFIDENCE] = confidence
+        right_side[FUZZY_MATCHED_KEY] = keys.where(keys.isin(remapped.index)).astype(object)
+    return right_side, matches
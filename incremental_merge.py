@@ -0,0 +1,182 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+
+import excel_io
+import key_stats
+import merge_engine
+import merge_keys
+import run_manifest
+from merge_engine import MERGE_KEY
+
+# Bump when the saved state layout changes so old states are ignored
+STATE_VERSION = 1
+
+# Above this share of changed keys a full merge is cheaper than patching
+MAX_CHANGED_FRACTION = 0.5
+
+
+def state_path(job):
+    manifest = run_manifest.RunManifest(job.get('state_dir'))
+    return manifest.path_for(job['output_file_path'], '.merge.pkl')
+
+
+def load_state(path, config_digest):
+    try:
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # Truncated or incompatible state: start again with a full merge
+        return None
+    if state.get('version') != STATE_VERSION or state.get('config') != config_digest:
+        return None
+    return state
+
+
+def save_state(path, state):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with excel_io.atomic_output(path) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def key_signatures(side):
+    """One uint64 per Merge_Key summarizing every row with that key.
+
+    Each row hash is weighted by the row's position within its key, so
+    edited, added, removed and reordered duplicate rows all change the
+    signature of their key.
+    """
+    row_hashes = pd.util.hash_pandas_object(side, index=False).to_numpy()
+    keys = side[MERGE_KEY]
+    position = keys.groupby(keys, sort=False).cumcount().to_numpy().astype(np.uint64)
+    # uint64 arithmetic wraps around, which is fine for a checksum
+    weighted = row_hashes * (position * np.uint64(2) + np.uint64(1))
+    return pd.Series(weighted, index=keys.to_numpy()).groupby(level=0, sort=False).sum()
+
+
+def changed_keys(old_side, new_side):
+    """Keys whose rows differ between two prepared versions of one input"""
+    old_sig = key_signatures(old_side)
+    new_sig = key_signatures(new_side)
+    common = old_sig.index.intersection(new_sig.index)
+    edited = common[old_sig[common].to_numpy() != new_sig[common].to_numpy()]
+    return edited.union(old_sig.index.symmetric_difference(new_sig.index))
+
+
+def same_layout(old_side, new_side):
+    return list(old_side.columns) == list(new_side.columns) and (old_side.dtypes == new_side.dtypes).all()
+
+
+def restore_dtypes(df, *sides):
+    # Patching can leave a column upcast (e.g. int to float) although the
+    # missing values that forced it are gone; a full merge would not have
+    for side in sides:
+        for col in side.columns:
+            if col == MERGE_KEY or col not in df.columns or df[col].dtype == side[col].dtype:
+                continue
+            if df[col].notna().all():
+                try:
+                    df[col] = df[col].astype(side[col].dtype)
+                except (TypeError, ValueError):
+                    pass
+    return df
+
+
+def patch_merge(final_df, file1_side, file2_side, keys, final_cols):
+    """Recompute the rows of ``keys`` and splice them into a previous result.
+
+    Rows for other keys are kept as they are. The outer merge orders rows by
+    key, so a stable sort on Merge_Key puts the recomputed rows exactly where
+    a full merge would.
+    """
+    kept = final_df[~final_df[MERGE_KEY].isin(keys)]
+    patched = merge_engine.merge_sides(file1_side[file1_side[MERGE_KEY].isin(keys)],
+                                       file2_side[file2_side[MERGE_KEY].isin(keys)])
+    combined = pd.concat([kept, patched[final_cols]], ignore_index=True)
+    combined = combined.sort_values(MERGE_KEY, kind='stable', ignore_index=True)
+    return restore_dtypes(combined, file1_side, file2_side)
+
+
+def merge_pair(job, log=print, cache=None):
+    """Merge one pair, reusing the previous result for keys whose rows did not change.
+
+    The prepared inputs and the merged result of the last run are kept in
+    the state folder next to the run records. An input whose content hash
+    is unchanged is not parsed again; otherwise it is diffed against the
+    saved version by Merge_Key and only the affected keys are merged again.
+    ``max_output_rows`` and ``explosion_action`` are applied as in
+    :func:`merge_engine.process_pair`; a run that deduplicates rows always
+    merges in full. Returns the same frame a full merge would produce.
+    """
+    selected_columns = job.get('selected_columns') or []
+    key_rules = merge_keys.parse_rules(job.get('key_rules'))
+
+    config_digest = run_manifest.fingerprint([], merge_engine.run_config(job))['config']
+    path = state_path(job)
+    state = load_state(path, config_digest)
+
+    sides = []
+    for number, spec in enumerate(merge_engine.job_inputs(job), 1):
+        digest = run_manifest.file_digest(spec['file_path'])
+        if state is not None and state[f'file{number}_digest'] == digest:
+            log(f"File {number} unchanged since the last run")
+            sides.append((state[f'file{number}_side'], digest))
+            continue
+        key_col, suffix = spec['key_column'], spec['suffix']
+        df = merge_engine.load_table(spec['file_path'], log, job.get('excel_engine'),
+                                     merge_engine.projected_columns(key_col, selected_columns, suffix), cache,
+                                     spec['sheets'], job.get('sheet_workers'), job.get('arrow', False))
+        side = merge_engine.prepare_side(df, key_col, suffix, selected_columns, f"File {number}", key_rules,
+                                         job.get('arrow', False))
+        sides.append((side, digest))
+    (file1_side, file1_digest), (file2_side, file2_digest) = sides
+
+    # The sides to merge: with explosion_action 'dedupe' they can lose rows,
+    # while the saved sides stay complete for the next run's diff
+    to_merge = [file1_side, file2_side]
+    if job.get('max_output_rows'):
+        stats = key_stats.profile_sides(to_merge)
+        for line in key_stats.describe(stats):
+            log(f"  {line}")
+        to_merge, stats = key_stats.guard_output_size(to_merge, stats, job.get('max_output_rows'),
+                                                      job.get('explosion_action'), log)
+    collapsed = sum(len(side) for side in to_merge) < len(file1_side) + len(file2_side)
+
+    final_df = None
+    if state is not None and (collapsed or state.get('collapsed')):
+        log("Rows were deduplicated to keep the output under the limit; running a full merge")
+    elif state is not None and same_layout(state['file1_side'], file1_side) and same_layout(state['file2_side'], file2_side):
+        keys = changed_keys(state['file1_side'], file1_side).union(changed_keys(state['file2_side'], file2_side))
+        total_keys = max(state['final_df'][MERGE_KEY].nunique(), 1)
+        if len(keys) == 0:
+            log("No keys changed; reusing the previous merge")
+            final_df = state['final_df']
+        elif len(keys) <= MAX_CHANGED_FRACTION * total_keys:
+            log(f"Re-merging {len(keys)} changed keys of {total_keys}")
+            final_cols = list(state['final_df'].columns)
+            final_df = patch_merge(state['final_df'], *to_merge, keys, final_cols)
+        else:
+            log(f"{len(keys)} of {total_keys} keys changed; running a full merge")
+
+    if final_df is None:
+        for number, side in enumerate(to_merge, 1):
+            log(f"File {number} shape before merge: {side.shape}")
+        merged_df = merge_engine.merge_sides(*to_merge)
+        log(f"Merged dataframe shape: {merged_df.shape}")
+        final_df = merged_df[merge_engine.output_columns(merged_df.columns, selected_columns)]
+
+    save_state(path, {
+        'version': STATE_VERSION,
+        'config': config_digest,
+        'file1_digest': file1_digest,
+        'file2_digest': file2_digest,
+        'file1_side': file1_side,
+        'file2_side': file2_side,
+        'final_df': final_df,
+        'collapsed': collapsed,
+    })
+    return final_df
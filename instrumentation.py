@@ -0,0 +1,183 @@
+import os
+import sys
+import json
+import time
+import contextlib
+import datetime
+
+import workbook_cache
+
+# Where the GUIs append their stage records and save cProfile statistics
+DEFAULT_METRICS_LOG = os.path.join(workbook_cache.DEFAULT_CACHE_DIR, 'metrics.jsonl')
+DEFAULT_PROFILE_DIR = os.path.join(workbook_cache.DEFAULT_CACHE_DIR, 'profiles')
+
+PROFILERS = ('cprofile', 'tracemalloc')
+
+# Lines of profiler output kept in the pair's messages
+PROFILE_TOP = 15
+
+
+def current_rss_mb():
+    """Resident memory of this process right now, in MB (None if unknown)"""
+    try:
+        import psutil
+    except ImportError:
+        pass
+    else:
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError, IndexError):
+        return None
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, in MB (None if unknown)"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 1024 / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def _delta(after, before):
+    if after is None or before is None:
+        return None
+    return round(after - before, 2)
+
+
+class StageTimer:
+    """Records a span (wall time, rows/sec, memory) around each stage of one task.
+
+    Every finished span is kept in ``spans`` and, when ``log_path`` is set,
+    appended to that file as one JSON line. Each line is a single write to a
+    file opened for appending, so parallel workers can share one log.
+    """
+
+    def __init__(self, task, log_path=None):
+        self.task = task
+        self.log_path = log_path
+        self.spans = []
+
+    @contextlib.contextmanager
+    def span(self, stage, rows=None, **fields):
+        """Time the enclosed block; set ``record['rows']`` inside it if only known afterwards"""
+        record = {'task': self.task, 'stage': stage, 'rows': rows}
+        record.update(fields)
+        rss_before = current_rss_mb()
+        peak_before = peak_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            record['seconds'] = round(seconds, 6)
+            if record.get('rows') is not None and seconds > 0:
+                record['rows_per_sec'] = round(record['rows'] / seconds, 1)
+            record['rss_delta_mb'] = _delta(current_rss_mb(), rss_before)
+            record['peak_rss_delta_mb'] = _delta(peak_rss_mb(), peak_before)
+            self.spans.append(record)
+            self.write(record)
+
+    def write(self, record):
+        if not self.log_path:
+            return
+        line = dict(record, time=datetime.datetime.now().isoformat(timespec='milliseconds'), pid=os.getpid())
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(line, ensure_ascii=False, default=str) + '\n')
+        except OSError:
+            # Metrics must never fail the merge itself
+            pass
+
+    def summary(self):
+        """One line listing every stage's time, e.g. for the Results pane"""
+        parts = []
+        for record in self.spans:
+            part = f"{record['stage']} {record['seconds']:.2f}s"
+            if record.get('rows_per_sec'):
+                part += f" ({record['rows_per_sec']:,.0f} rows/s)"
+            parts.append(part)
+        total = sum(record['seconds'] for record in self.spans)
+        return f"Timings: {', '.join(parts)}; total {total:.2f}s"
+
+
+def stage_totals(span_lists):
+    """Total time per stage over many tasks' spans, slowest first, as one line"""
+    totals = {}
+    for spans in span_lists:
+        for record in spans:
+            totals[record['stage']] = totals.get(record['stage'], 0) + record['seconds']
+    if not totals:
+        return None
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    return "Time by stage: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in ranked)
+
+
+def span(timer, stage, rows=None, **fields):
+    """``timer.span(...)``, or a no-op when no timer is attached"""
+    if timer is None:
+        return contextlib.nullcontext({})
+    return timer.span(stage, rows, **fields)
+
+
+@contextlib.contextmanager
+def profiled(profiler, output_dir, name, log=print):
+    """Run the enclosed block under cProfile or tracemalloc and report the top entries.
+
+    cProfile statistics are saved to ``<output_dir>/<name>.prof`` for
+    snakeviz/pstats; tracemalloc reports the peak traced memory and the
+    largest allocation sites. With no profiler this does nothing.
+    """
+    if not profiler:
+        yield
+        return
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler: {profiler}. Choose from: {', '.join(PROFILERS)}")
+
+    if profiler == 'cprofile':
+        import io
+        import cProfile
+        import pstats
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+                stats_path = os.path.join(output_dir, f"{name}.prof")
+                profile.dump_stats(stats_path)
+                log(f"Profile saved to {stats_path}")
+            text = io.StringIO()
+            pstats.Stats(profile, stream=text).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            log(text.getvalue().rstrip())
+        return
+
+    import tracemalloc
+
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if started:
+            tracemalloc.stop()
+        log(f"tracemalloc: peak {peak / 1024 / 1024:.1f} MB, still allocated {current / 1024 / 1024:.1f} MB")
+        for stat in snapshot.statistics('lineno')[:PROFILE_TOP]:
+            log(f"  {stat}")
@@ -0,0 +1,185 @@
+import pandas as pd
+
+import fuzzy_keys
+import merge_engine
+import merge_keys
+from merge_engine import MERGE_KEY
+
+# What to do when a merge would produce more than max_output_rows rows:
+#   abort  - fail the pair before merging
+#   dedupe - keep the first row of every key that is repeated in more than
+#            one input, then fail only if the output is still too large
+EXPLOSION_ACTIONS = ('abort', 'dedupe')
+
+# The most rows an .xlsx sheet can hold below its header; the GUI's default limit for .xlsx outputs
+DEFAULT_MAX_OUTPUT_ROWS = 1048575
+
+# Keys listed as the largest contributors in the summary
+TOP_KEYS = 3
+
+
+class OutputTooLargeError(ValueError):
+    """A merge would produce more rows than the configured limit"""
+
+
+def key_counts(side):
+    """Rows per Merge_Key of one prepared side"""
+    return side[MERGE_KEY].value_counts(sort=False, dropna=False)
+
+
+def profile_counts(counts):
+    """Predict an outer merge from each input's rows-per-key counts.
+
+    A key present in several inputs yields the product of its row counts
+    (duplicates are multiplied out), and a key present in one input yields
+    its own rows, so the predicted row count is exact without merging.
+    Returns a dict of plain numbers suitable for logs and result dicts.
+    """
+    aligned = pd.concat(list(counts), axis=1, keys=range(len(counts)))
+    present = aligned.notna()
+    # float64 so a runaway product cannot overflow; exact up to 2**53 rows
+    rows_per_key = aligned.fillna(1).astype('float64').prod(axis=1)
+    matched = present.all(axis=1)
+    many_to_many = (aligned > 1).sum(axis=1) > 1
+
+    top = rows_per_key[many_to_many].nlargest(TOP_KEYS)
+    return {
+        'rows': int(rows_per_key.sum()),
+        'input_rows': [int(side_counts.sum()) for side_counts in counts],
+        'keys': [len(side_counts) for side_counts in counts],
+        'duplicate_keys': [int((side_counts > 1).sum()) for side_counts in counts],
+        'blank_keys': [int(side_counts.get('', 0)) for side_counts in counts],
+        'union_keys': len(aligned),
+        'matched_keys': int(matched.sum()),
+        'match_rate': float(matched.mean()) if len(aligned) else 0.0,
+        'matched_rows': [int(aligned[i][matched].sum()) for i in range(len(counts))],
+        'many_to_many_keys': int(many_to_many.sum()),
+        'top_keys': [(key, int(rows)) for key, rows in top.items()],
+    }
+
+
+def profile_sides(sides):
+    """:func:`profile_counts` for frames prepared by :func:`merge_engine.prepare_side`"""
+    return profile_counts([key_counts(side) for side in sides])
+
+
+def describe(stats):
+    """Summary lines for the log and the pair panel"""
+    lines = [f"Predicted output: {stats['rows']:,} rows; "
+             f"{stats['match_rate']:.1%} of keys matched ({stats['matched_keys']:,} of {stats['union_keys']:,})"]
+    for number, (rows, keys, duplicates, blanks, matched) in enumerate(zip(
+            stats['input_rows'], stats['keys'], stats['duplicate_keys'], stats['blank_keys'],
+            stats['matched_rows']), 1):
+        line = f"File {number}: {rows:,} rows, {keys:,} keys, {matched / rows if rows else 0:.1%} of rows matched"
+        if duplicates:
+            line += f", {duplicates:,} duplicated keys"
+        if blanks:
+            line += f", {blanks:,} blank keys"
+        lines.append(line)
+    if stats['many_to_many_keys']:
+        largest = ", ".join(f"'{key}' -> {rows:,} rows" for key, rows in stats['top_keys'])
+        lines.append(f"Many-to-many keys: {stats['many_to_many_keys']:,} (largest: {largest})")
+    if stats.get('fuzzy_matches') is not None:
+        lines.append(f"Fuzzy matches: {stats['fuzzy_matches']:,} File 2 keys matched to File 1 keys")
+    return lines
+
+
+def repeated_keys(counts):
+    """Keys repeated in more than one input, from each input's rows-per-key counts"""
+    repeated = [set(side_counts.index[side_counts > 1]) for side_counts in counts]
+    keys = set()
+    for i, side_keys in enumerate(repeated):
+        for other in repeated[i+1:]:
+            keys |= side_keys & other
+    return keys
+
+
+def keep_first_rows(side, keys):
+    """Drop every row of ``keys`` but the first from one prepared side"""
+    extra = side[MERGE_KEY].duplicated(keep='first') & side[MERGE_KEY].isin(keys)
+    return side[~extra] if extra.any() else side
+
+
+def collapse_many_to_many(sides):
+    """Keep only the first row of each key that is repeated in more than one input.
+
+    Keys duplicated in a single input still match one row per other input,
+    which grows the output linearly, so they are left alone.
+    """
+    keys = repeated_keys([key_counts(side) for side in sides])
+    if not keys:
+        return list(sides)
+    return [keep_first_rows(side, keys) for side in sides]
+
+
+def check_output_size(counts, max_rows, action='abort', log=print, stats=None):
+    """Enforce ``max_rows`` on a merge predicted from each input's rows-per-key counts.
+
+    For merges that never hold whole inputs in memory. Returns the
+    statistics and the set of keys to keep one row of (see
+    :func:`keep_first_rows`), empty unless ``action`` is ``'dedupe'`` and
+    the prediction was too large. Raises :class:`OutputTooLargeError` when
+    the output is (still) too large.
+    """
+    action = action or 'abort'
+    if action not in EXPLOSION_ACTIONS:
+        raise ValueError(f"Unknown explosion action: {action}. Choose from: {', '.join(EXPLOSION_ACTIONS)}")
+    if stats is None:
+        stats = profile_counts(counts)
+    if not max_rows or stats['rows'] <= max_rows:
+        return stats, set()
+
+    if action == 'dedupe' and stats['many_to_many_keys']:
+        keys = repeated_keys(counts)
+        # Keeps what the caller added to the statistics, such as fuzzy_matches
+        deduped = {**stats, **profile_counts([side_counts.where(~side_counts.index.isin(keys), 1)
+                                              for side_counts in counts])}
+        log(f"Predicted {stats['rows']:,} rows exceed the limit of {max_rows:,}; kept the first row of "
+            f"{stats['many_to_many_keys']:,} keys repeated in several files, now {deduped['rows']:,} rows")
+        if deduped['rows'] <= max_rows:
+            return deduped, keys
+        stats = deduped
+
+    message = f"The merge would produce {stats['rows']:,} rows, more than the limit of {max_rows:,}"
+    if stats['many_to_many_keys']:
+        message += f" ({stats['many_to_many_keys']:,} keys are repeated in more than one file)"
+    raise OutputTooLargeError(message)
+
+
+def guard_output_size(sides, stats, max_rows, action='abort', log=print):
+    """Stop a merge whose predicted output exceeds ``max_rows``.
+
+    Returns the sides to merge and their statistics, deduplicated first when
+    ``action`` is ``'dedupe'``. Raises :class:`OutputTooLargeError` when the
+    output is (still) too large.
+    """
+    # The counts are only needed to deduplicate
+    counts = [key_counts(side) for side in sides] if max_rows and stats['rows'] > max_rows else []
+    stats, keys = check_output_size(counts, max_rows, action, log, stats)
+    if keys:
+        sides = [keep_first_rows(side, keys) for side in sides]
+    return sides, stats
+
+
+def profile_files(job, log=print):
+    """Load only the key columns of a job's files and profile them.
+
+    Used by the GUI's "Check Keys" button: the key rules and fuzzy matching
+    of the job are applied, so the prediction matches what the merge will do.
+    """
+    key_rules = merge_keys.parse_rules(job.get('key_rules'))
+    cache = merge_engine.cache_for_job(job)
+    sides = []
+    for number, spec in enumerate(merge_engine.job_inputs(job), 1):
+        df = merge_engine.load_table(spec['file_path'], log, job.get('excel_engine'), {spec['key_column']}, cache,
+                                     spec['sheets'], job.get('sheet_workers'), job.get('arrow', False))
+        sides.append(merge_engine.prepare_side(df, spec['key_column'], spec['suffix'], [spec['key_column']],
+                                               f"File {number}", key_rules, job.get('arrow', False)))
+    threshold = merge_engine.fuzzy_keys_threshold(job)
+    matches = None
+    if threshold is not None and len(sides) == 2:
+        sides[1], matches = fuzzy_keys.match_unmatched_keys(sides[0], sides[1], threshold, log=log)
+    stats = profile_sides(sides)
+    if matches is not None:
+        stats['fuzzy_matches'] = len(matches)
+    return stats
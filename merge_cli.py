@@ -0,0 +1,145 @@
+import argparse
+import multiprocessing
+import sys
+import warnings
+
+import merge_engine
+import merge_keys
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Merge marksheet file pairs listed in a JSON/YAML manifest without the GUI."
+    )
+    parser.add_argument("manifest", help="Path to a .json, .yaml or .yml manifest of file pairs")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="Number of pairs to process in parallel (0 = one per CPU core)")
+    parser.add_argument("--excel-engine", choices=["calamine", "openpyxl", "xlrd", "pyxlsb", "odf"],
+                        help="Force a pandas Excel reader instead of detecting the best one per file")
+    parser.add_argument("--sheet-workers", type=int,
+                        help="Processes parsing the sheets of a multi-sheet input (0 = one per CPU core; "
+                             "the default, except with several --workers, where it is 1)")
+    parser.add_argument("--arrow", action="store_true",
+                        help="Load inputs as Arrow-backed columns with string[pyarrow] keys (needs pyarrow)")
+    parser.add_argument("--cache-dir", help="Folder for the parsed-workbook cache (default: ~/.cache/marksheet_merge)")
+    parser.add_argument("--cache-max-mb", type=float, help="Size cap of the parsed-workbook cache in MB")
+    parser.add_argument("--no-cache", action="store_true", help="Always parse input files, never use the cache")
+    parser.add_argument("--streaming-writer", action="store_true",
+                        help="Write outputs chunk by chunk in constant memory")
+    parser.add_argument("--normalize-keys", metavar="RULES",
+                        help="Comma-separated key normalization rules: "
+                             f"{', '.join(merge_keys.KEY_RULES)} or all")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="Merge CSV inputs bucket by bucket on disk for files larger than memory")
+    parser.add_argument("--buckets", type=int,
+                        help="Number of key-hash buckets for --out-of-core (default: from input size)")
+    parser.add_argument("--sorted-keys", choices=["auto", "declared"],
+                        help="Use a sort-merge join for inputs sorted by key: 'auto' checks and falls back, "
+                             "'declared' fails if an input is not sorted")
+    parser.add_argument("--temp-dir", help="Folder for --out-of-core bucket files (default: system temp)")
+    parser.add_argument("--skip-unchanged", action="store_true",
+                        help="Skip pairs whose inputs and settings match the run that wrote their output")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Keep each pair's merge state and re-merge only the keys whose rows changed")
+    parser.add_argument("--state-dir", help="Folder for --skip-unchanged and --incremental state "
+                                            "(default: ~/.cache/marksheet_merge/runs)")
+    parser.add_argument("--fuzzy-keys", nargs="?", type=float, const=True, metavar="THRESHOLD",
+                        help="Match keys left unmatched by similarity (0-1, default 0.85)")
+    parser.add_argument("--fuzzy-columns", action="store_true",
+                        help="With --fuzzy-keys: add Match_Confidence and Fuzzy_Matched_Key output columns")
+    parser.add_argument("--max-output-rows", type=int,
+                        help="Fail a pair whose merge would produce more rows than this (predicted from key counts)")
+    parser.add_argument("--on-explosion", choices=["abort", "dedupe"],
+                        help="With --max-output-rows: 'abort' the pair (default) or 'dedupe' keys repeated in "
+                             "several files first")
+    parser.add_argument("--metrics-log", help="Append per-stage timing and memory records to this JSON lines file")
+    parser.add_argument("--profile", choices=["cprofile", "tracemalloc"],
+                        help="Profile every pair and print the top functions or allocation sites")
+    parser.add_argument("--profile-dir", help="Folder for cProfile .prof files (default: not saved)")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="Only print the processing summary")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    # Same behaviour as the GUI: keep pandas/openpyxl warnings out of the log
+    warnings.filterwarnings("ignore")
+
+    try:
+        key_rules = merge_keys.parse_rules(args.normalize_keys)
+    except ValueError as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 2
+
+    try:
+        jobs = merge_engine.load_manifest(args.manifest)
+    except Exception as e:
+        print(f"Error reading manifest: {str(e)}", file=sys.stderr)
+        return 2
+
+    # Command-line options override the manifest for every pair
+    for job in jobs:
+        if args.excel_engine:
+            job['excel_engine'] = args.excel_engine
+        if args.sheet_workers is not None:
+            job['sheet_workers'] = args.sheet_workers
+        if args.arrow:
+            job['arrow'] = True
+        if args.cache_dir:
+            job['cache_dir'] = args.cache_dir
+        if args.cache_max_mb is not None:
+            job['cache_max_mb'] = args.cache_max_mb
+        if args.no_cache:
+            job['use_cache'] = False
+        if args.streaming_writer:
+            job['streaming_writer'] = True
+        if key_rules:
+            job['key_rules'] = key_rules
+        if args.out_of_core:
+            job['out_of_core'] = True
+        if args.buckets:
+            job['buckets'] = args.buckets
+        if args.temp_dir:
+            job['temp_dir'] = args.temp_dir
+        if args.sorted_keys:
+            job['sorted_keys'] = True if args.sorted_keys == "declared" else "auto"
+        if args.skip_unchanged:
+            job['skip_unchanged'] = True
+        if args.incremental:
+            job['incremental'] = True
+        if args.state_dir:
+            job['state_dir'] = args.state_dir
+        if args.fuzzy_keys is not None:
+            job['fuzzy_keys'] = args.fuzzy_keys
+        if args.fuzzy_columns:
+            job['fuzzy_columns'] = True
+        if args.max_output_rows:
+            job['max_output_rows'] = args.max_output_rows
+        if args.on_explosion:
+            job['explosion_action'] = args.on_explosion
+        if args.metrics_log:
+            job['metrics_log'] = args.metrics_log
+        if args.profile:
+            job['profile'] = args.profile
+        if args.profile_dir:
+            job['profile_dir'] = args.profile_dir
+
+    if args.quiet:
+        summary = merge_engine.run_batch(jobs, log=lambda message: None, workers=args.workers)
+        print(f"Total pairs: {summary['total']}")
+        print(f"Successfully processed: {summary['successful']}")
+        print(f"Failed: {summary['failed']}")
+        for result in summary['results']:
+            if not result['success']:
+                print(f"  Pair #{result['id']+1}: {result['status']} {result['error'] or ''}".rstrip())
+    else:
+        summary = merge_engine.run_batch(jobs, log=print, workers=args.workers)
+
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,794 @@
+import os
+import json
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+import excel_io
+import instrumentation
+import merge_keys
+import run_manifest
+import workbook_cache
+
+# Column that holds the shared key after the two files are merged
+MERGE_KEY = "Merge_Key"
+
+# Rows sampled when only the header and column types are needed
+PREVIEW_ROWS = 200
+
+
+def _emit(log, messages, message):
+    # Keep every message for the caller and forward it when a logger is attached
+    messages.append(str(message))
+    if log is not None:
+        log(message)
+
+
+def default_output_path(file1_path):
+    """Suggest an output file next to File 1, named after it"""
+    base, ext = os.path.splitext(os.path.basename(file1_path))
+    return os.path.join(os.path.dirname(file1_path), f"merged_{base}.xlsx")
+
+
+def try_multiple_engines(file_path, log=print, engine=None, usecols=None, nrows=None, sheet_name=0, arrow=False):
+    """Load a table, choosing the reader once from the file's content.
+
+    The format is sniffed from the leading bytes, so a misnamed file is
+    parsed by the right reader the first time. When calamine was chosen and
+    fails, the format's classic engine gets one more attempt. ``usecols`` (a
+    set of column names) and ``nrows`` limit what the reader parses,
+    ``sheet_name`` picks the worksheet of an Excel file and ``arrow`` asks
+    for Arrow-backed columns (see :func:`excel_io.read_table`).
+    """
+    log(f"Attempting to load {file_path}")
+    errors = []
+
+    try:
+        file_format = excel_io.sniff_format(file_path)
+    except OSError as e:
+        raise Exception(f"Failed to load file: {str(e)}")
+
+    chosen = excel_io.choose_engine(file_format, engine)
+    candidates = [chosen]
+    if chosen == 'calamine':
+        candidates.append(excel_io.CLASSIC_ENGINES[file_format])
+
+    for candidate in candidates:
+        try:
+            if file_format == 'csv':
+                log("Trying to load as CSV file...")
+            elif file_format == 'html':
+                log("Trying to load as HTML table...")
+            else:
+                log(f"Detected {file_format} file, trying Excel engine: {candidate}...")
+            return excel_io.read_table(file_path, file_format, candidate, usecols=usecols, nrows=nrows,
+                                       sheet_name=sheet_name, arrow=arrow)
+        except Exception as e:
+            errors.append(f"{candidate or file_format} engine error: {str(e)}")
+
+    # If we got here, all attempts failed
+    error_summary = "\n".join(errors)
+    raise Exception(f"Failed to load file with any method. Errors:\n{error_summary}")
+
+
+def sheet_selection(file_path, file_format, sheets, log=print):
+    """Resolve a job's sheet selection to ``(sheet names, stacked)``.
+
+    Returns ``(None, False)`` for the first sheet, the behaviour without a
+    selection. CSV and HTML files have a single table and ignore it.
+    """
+    if sheets is None or sheets == '' or sheets == 0:
+        return None, False
+    if file_format in ('csv', 'html'):
+        log(f"Ignoring the sheet selection for {file_path}: {file_format} files have a single table")
+        return None, False
+    names = excel_io.select_sheets(excel_io.list_sheet_names(file_path), sheets)
+    return names, excel_io.is_multi_sheet(sheets)
+
+
+def _quiet(message):
+    pass
+
+
+# Set in the processes of a multi-pair batch (see iter_results)
+_in_pair_worker = False
+
+
+def _init_pair_worker():
+    global _in_pair_worker
+    _in_pair_worker = True
+
+
+def _read_sheet(file_path, sheet_name, engine, usecols, arrow):
+    # Runs in a worker process: one sheet of a multi-sheet input
+    return try_multiple_engines(file_path, _quiet, engine, usecols, sheet_name=sheet_name, arrow=arrow)
+
+
+def read_sheets(file_path, sheet_names, log=print, engine=None, usecols=None, workers=None, arrow=False):
+    """Parse several sheets of one workbook and stack them with a Source_Sheet column.
+
+    Each sheet is parsed in its own worker process (up to ``workers``, 0
+    meaning one per core), so the load takes about as long as the largest
+    sheet. Rows keep tab order, then row order within each sheet. Inside a
+    batch's pair worker the default is one process, since the pairs already
+    use every core.
+    """
+    if workers is None and _in_pair_worker:
+        workers = 1
+    workers = min(resolve_workers(workers), len(sheet_names))
+    log(f"Loading {len(sheet_names)} sheets of {file_path}" + (f" with {workers} workers" if workers > 1 else ""))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_read_sheet, file_path, name, engine, usecols, arrow) for name in sheet_names]
+            frames = [future.result() for future in futures]
+    else:
+        frames = [try_multiple_engines(file_path, log, engine, usecols, sheet_name=name, arrow=arrow)
+                  for name in sheet_names]
+
+    add_source = usecols is None or excel_io.SOURCE_SHEET in usecols
+    for name, df in zip(sheet_names, frames):
+        if add_source:
+            df[excel_io.SOURCE_SHEET] = name
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_table(file_path, log=print, engine=None, usecols=None, cache=None, sheets=None, workers=None, arrow=False):
+    """Load a table through the in-process and on-disk parse caches.
+
+    ``cache`` is a :class:`workbook_cache.WorkbookCache` or None to skip the
+    disk. Frames returned from the caches are shared and must not be
+    modified in place. ``sheets`` selects worksheets (see
+    :func:`excel_io.select_sheets`); several sheets are parsed in parallel by
+    up to ``workers`` processes and stacked by :func:`read_sheets`.
+    ``arrow`` loads Arrow-backed columns, cached apart from the default parse.
+    """
+    file_format = excel_io.sniff_format(file_path)
+    sheet_names, stacked = sheet_selection(file_path, file_format, sheets, log)
+    if sheet_names is None:
+        sheet = 0
+    else:
+        sheet = sheet_names if stacked else sheet_names[0]
+    key = workbook_cache.cache_key(file_path, sheet, excel_io.choose_engine(file_format, engine), usecols,
+                                   arrow=arrow)
+
+    df = workbook_cache.recall(key)
+    if df is not None:
+        log(f"Reusing {file_path} already loaded in this batch")
+        return df
+
+    if cache is not None:
+        df = cache.get(key)
+        if df is not None:
+            log(f"Loaded {file_path} from cache")
+            workbook_cache.remember(key, df)
+            return df
+
+    if stacked:
+        df = read_sheets(file_path, sheet_names, log, engine, usecols, workers, arrow)
+    else:
+        df = try_multiple_engines(file_path, log, engine, usecols=usecols, sheet_name=sheet, arrow=arrow)
+    workbook_cache.remember(key, df)
+    if cache is not None:
+        try:
+            cache.put(key, df)
+        except Exception as e:
+            # A full or read-only cache must never fail the merge
+            log(f"Could not write cache entry for {file_path}: {str(e)}")
+    return df
+
+
+def cache_for_job(job):
+    """The disk cache a job asked for, or None when it is disabled"""
+    if not job.get('use_cache', True):
+        return None
+    return workbook_cache.WorkbookCache(
+        job.get('cache_dir'),
+        job.get('cache_max_mb', workbook_cache.DEFAULT_MAX_MB)
+    )
+
+
+def read_preview(file_path, log=print, engine=None, sheets=None):
+    """Read the header row and a small sample, enough to pick keys and columns.
+
+    With several sheets selected the first one stands in for all of them.
+    """
+    file_format = excel_io.sniff_format(file_path)
+    sheet_names, stacked = sheet_selection(file_path, file_format, sheets, log)
+    if sheet_names is None:
+        return try_multiple_engines(file_path, log, engine, nrows=PREVIEW_ROWS)
+    df = try_multiple_engines(file_path, log, engine, nrows=PREVIEW_ROWS, sheet_name=sheet_names[0])
+    if stacked:
+        log(f"{len(sheet_names)} sheets selected: {', '.join(sheet_names)}")
+        df[excel_io.SOURCE_SHEET] = sheet_names[0]
+    return df
+
+
+def projected_columns(key_col, selected_columns, suffix):
+    """Names of the columns one file must supply for the requested output.
+
+    ``selected_columns`` holds output names such as ``Score_file1``; the ones
+    ending in ``suffix`` belong to this file. Returns None (read everything)
+    when no output columns were selected.
+    """
+    if not selected_columns:
+        return None
+    wanted = {key_col}
+    for col in selected_columns:
+        if col.endswith(suffix):
+            wanted.add(col[:-len(suffix)])
+    return wanted
+
+
+def prepare_side(df, key_col, suffix, selected_columns, label, key_rules=(), arrow=False):
+    """Rename one input for the merge and keep only the columns it contributes.
+
+    Column names are stripped and suffixed, and the key column becomes
+    ``Merge_Key``, by relabelling rather than copying the data. ``Merge_Key``
+    is placed first and the other columns follow in output order, so the
+    merged frame usually needs no reordering afterwards. Only the key column
+    is rebuilt (as normalized strings, see :mod:`merge_keys`; ``string[pyarrow]``
+    with ``arrow``); the caller's frame is never modified.
+    """
+    # Clean column names to avoid issues
+    names = [str(col).strip() for col in df.columns]
+
+    # Ensure key columns exist
+    if key_col not in names:
+        raise ValueError(f"Key column '{key_col}' not found in {label}")
+
+    # Add suffixes to columns to differentiate them after merge, and use a
+    # common name for the key columns
+    out_names = [MERGE_KEY if name == key_col else f"{name}{suffix}" for name in names]
+
+    key_positions = [i for i, name in enumerate(out_names) if name == MERGE_KEY]
+    if selected_columns:
+        # Project before the merge: drop columns that would not be output
+        rank = {}
+        for i, col in enumerate(selected_columns):
+            rank.setdefault(col, i)
+        others = sorted((i for i, name in enumerate(out_names) if name in rank and name != MERGE_KEY),
+                        key=lambda i: rank[out_names[i]])
+    else:
+        others = [i for i, name in enumerate(out_names) if name != MERGE_KEY]
+    positions = key_positions + others
+
+    if positions == list(range(len(out_names))):
+        # Shallow copy: new labels, shared column data
+        side = df.copy(deep=False)
+    else:
+        side = df.iloc[:, positions]
+    side.columns = [out_names[i] for i in positions]
+
+    # Convert key columns to string to ensure proper merging
+    for pos in range(len(key_positions)):
+        side.isetitem(pos, merge_keys.normalize_keys(side.iloc[:, pos], key_rules, arrow))
+
+    return side
+
+
+def merge_prepared(sides, selected_columns, log=print, sorted_keys=False, timer=None):
+    """Outer-merge frames prepared by :func:`prepare_side` and pick the output columns.
+
+    With ``sorted_keys`` two inputs already sorted by key are joined with a
+    sort-merge instead (see :mod:`sorted_merge`); a ``True`` value declares
+    them sorted and fails if they are not, ``'auto'`` just checks. A
+    :class:`instrumentation.StageTimer` records the merge and the column
+    selection as separate stages.
+    """
+    # Log data for debugging
+    for number, side in enumerate(sides, 1):
+        log(f"File {number} shape before merge: {side.shape}")
+
+    use_sort_merge = False
+    if sorted_keys and len(sides) == 2:
+        # Imported here: sorted_merge builds on this module
+        import sorted_merge
+        use_sort_merge = all(sorted_merge.keys_sorted(side) for side in sides)
+        if use_sort_merge:
+            log("Keys are already sorted; using a sort-merge join")
+        elif sorted_keys is True:
+            raise sorted_merge.UnsortedKeysError("Inputs were declared sorted by key but are not")
+        else:
+            log("Keys are not sorted; using the hash merge")
+
+    with instrumentation.span(timer, 'merge', sum(len(side) for side in sides)):
+        if use_sort_merge:
+            merged_df = sorted_merge.merge_sorted_sides(*sides)
+        else:
+            merged_df = merge_sides(*sides)
+
+    log(f"Merged dataframe shape: {merged_df.shape}")
+
+    # If user has selected specific columns for output
+    final_cols = output_columns(merged_df.columns, selected_columns)
+    if selected_columns:
+        log(f"Using {len(final_cols)} selected columns for output")
+    else:
+        log(f"Using default column ordering with {len(final_cols)} columns")
+
+    # Only reorder (which copies) when the merge did not already produce the output layout
+    if list(merged_df.columns) == final_cols:
+        return merged_df
+    with instrumentation.span(timer, 'select_columns', len(merged_df)):
+        return merged_df[final_cols]
+
+
+def merge_sides(*sides):
+    """Outer-merge any number of frames prepared by :func:`prepare_side` on Merge_Key.
+
+    The result is the same as outer-merging them one after another, with
+    rows sorted by key and duplicate keys multiplied out, but every input
+    is parsed and keyed once.
+    """
+    # Shallow copies so swapping in the key codes leaves the inputs untouched
+    sides = [side.copy(deep=False) for side in sides]
+
+    # Join on shared int64 codes instead of hashing the key strings during
+    # the merge; codes follow sorted key order, so rows come out in the same
+    # order as a merge on the strings
+    key_dtype = sides[0][MERGE_KEY].dtype
+    *codes, uniques = merge_keys.encode_keys(*(side[MERGE_KEY] for side in sides))
+    for side, side_codes in zip(sides, codes):
+        side.isetitem(0, side_codes)
+
+    if len(sides) > 2 and all(pd.Index(side_codes).is_unique for side_codes in codes):
+        # One row per key in every input: align all of them on the sorted
+        # union of codes and place them side by side in a single step
+        all_codes = np.unique(np.concatenate(codes))
+        merged_df = pd.concat([side.set_index(MERGE_KEY).reindex(all_codes) for side in sides], axis=1)
+        merged_df.index.name = MERGE_KEY
+        merged_df = merged_df.reset_index()
+    else:
+        # Alternative merge approach using pandas merge function instead of join
+        merged_df = sides[0]
+        for side in sides[1:]:
+            merged_df = pd.merge(
+                merged_df,
+                side,
+                on=MERGE_KEY,
+                how="outer"
+            )
+    merged_df.isetitem(0, pd.Series(uniques.take(merged_df[MERGE_KEY].to_numpy()), index=merged_df.index, dtype=key_dtype))
+    return merged_df
+
+
+def output_columns(merged_columns, selected_columns):
+    """The output column list for a merged frame with the given columns"""
+    if selected_columns:
+        # Make sure Merge_Key is always included
+        if MERGE_KEY not in selected_columns:
+            final_cols = [MERGE_KEY] + [col for col in selected_columns]
+        else:
+            final_cols = list(selected_columns)
+
+        # Only include columns that exist in the merged dataframe
+        return [col for col in final_cols if col in merged_columns]
+
+    # Merge_Key, then the file1 columns, then the file2 columns: the order
+    # prepare_side already gave the merge inputs
+    return list(merged_columns)
+
+
+def prepare_output_path(output_path, log=print, streaming=False):
+    """Create the output folder, normalize the path and log the chosen format"""
+    # Create output directory if it doesn't exist
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    # Normalize output path
+    output_path = os.path.normpath(output_path)
+
+    file_format = excel_io.output_format(output_path)
+    mode = " (streaming)" if streaming else ""
+    if file_format == 'csv':
+        log(f"Saving as CSV{mode}: {output_path}")
+    elif file_format in ('parquet', 'feather'):
+        log(f"Saving as {file_format.capitalize()}{mode}: {output_path}")
+    else:
+        log(f"Saving as Excel{mode}: {output_path}")
+    return output_path
+
+
+def write_output(final_df, output_path, log=print, streaming=False):
+    """Write the merged result, choosing the format from the file extension"""
+    output_path = prepare_output_path(output_path, log, streaming)
+    excel_io.write_table(final_df, output_path, streaming)
+    return output_path
+
+
+def job_inputs(job):
+    """The input files of a job, as dicts with file_path, key_column, suffix and df.
+
+    A two-file job uses the ``file1_*``/``file2_*`` keys; a multi-file job
+    lists its files under ``inputs``, each with its own ``key_column`` and an
+    optional ``suffix`` (``_file1``, ``_file2``, ... by default). ``sheets``
+    (``file1_sheets``/``file2_sheets`` for two files) selects worksheets.
+    """
+    if job.get('inputs'):
+        return [{
+            'file_path': spec.get('file_path'),
+            'key_column': spec.get('key_column'),
+            'suffix': spec.get('suffix') or f"_file{number}",
+            'sheets': spec.get('sheets'),
+            'df': spec.get('df'),
+        } for number, spec in enumerate(job['inputs'], 1)]
+    return [
+        {'file_path': job.get('file1_path'), 'key_column': job.get('file1_key_column'),
+         'suffix': '_file1', 'sheets': job.get('file1_sheets'), 'df': job.get('file1_df')},
+        {'file_path': job.get('file2_path'), 'key_column': job.get('file2_key_column'),
+         'suffix': '_file2', 'sheets': job.get('file2_sheets'), 'df': job.get('file2_df')},
+    ]
+
+
+def fuzzy_keys_threshold(job):
+    """The similarity threshold of a job's fuzzy key matching, or None when it is off"""
+    if not job.get('fuzzy_keys'):
+        return None
+    # Imported here: fuzzy_keys builds on this module
+    import fuzzy_keys
+    return fuzzy_keys.parse_threshold(job['fuzzy_keys'])
+
+
+def run_config(job):
+    """The job settings that change a pair's output, for run fingerprints"""
+    if job.get('inputs'):
+        return {
+            'inputs': [(spec['key_column'], spec['suffix'], spec['sheets']) for spec in job_inputs(job)],
+            'selected_columns': list(job.get('selected_columns') or []),
+            'key_rules': merge_keys.parse_rules(job.get('key_rules')),
+            'excel_engine': job.get('excel_engine'),
+            'arrow': bool(job.get('arrow')),
+            'streaming_writer': bool(job.get('streaming_writer')),
+            'max_output_rows': job.get('max_output_rows'),
+            'explosion_action': job.get('explosion_action'),
+        }
+    return {
+        'file1_key_column': job.get('file1_key_column'),
+        'file2_key_column': job.get('file2_key_column'),
+        'file1_sheets': job.get('file1_sheets'),
+        'file2_sheets': job.get('file2_sheets'),
+        'selected_columns': list(job.get('selected_columns') or []),
+        'key_rules': merge_keys.parse_rules(job.get('key_rules')),
+        'excel_engine': job.get('excel_engine'),
+        'arrow': bool(job.get('arrow')),
+        'streaming_writer': bool(job.get('streaming_writer')),
+        'out_of_core': bool(job.get('out_of_core')),
+        # The bucket count sets the out-of-core row order
+        'buckets': job.get('buckets'),
+        'sorted_keys': bool(job.get('sorted_keys')),
+        'max_output_rows': job.get('max_output_rows'),
+        'explosion_action': job.get('explosion_action'),
+        'fuzzy_keys': fuzzy_keys_threshold(job),
+        'fuzzy_columns': bool(job.get('fuzzy_columns')),
+    }
+
+
+def process_pair(job, log=None):
+    """Load, merge and save one file pair described by a job dictionary.
+
+    Job options, named as in the GUI pair configuration:
+
+    - ``file1_path``, ``file2_path``, ``file1_key_column``,
+      ``file2_key_column``, ``selected_columns``, ``output_file_path``;
+      ``inputs`` for more than two files (see :func:`job_inputs`)
+    - reading: ``file1_df``/``file2_df``, ``excel_engine``,
+      ``file1_sheets``/``file2_sheets``, ``sheet_workers``, ``arrow``,
+      ``use_cache``, ``cache_dir``, ``cache_max_mb``
+    - keys: ``key_rules``, ``fuzzy_keys``, ``fuzzy_columns``
+    - size limit: ``max_output_rows``, ``explosion_action``
+    - strategy: ``out_of_core`` (with ``buckets``, ``temp_dir``),
+      ``incremental``, ``sorted_keys``, ``skip_unchanged``, ``state_dir``
+    - output and metrics: ``streaming_writer``, ``metrics_log``,
+      ``profile``, ``profile_dir``
+
+    The result's ``key_stats`` (see :mod:`key_stats`) holds the predicted
+    ``rows``, ``match_rate`` and per-file ``keys``, ``duplicate_keys`` and
+    ``blank_keys``, plus ``fuzzy_matches`` when fuzzy keys are on.
+    Never raises; the outcome is reported in the returned result dictionary.
+    """
+    messages = []
+    emit = lambda message: _emit(log, messages, message)
+    label = f"Pair #{job.get('id', 0)+1}"
+    result = {
+        'id': job.get('id', 0),
+        'success': False,
+        'status': 'Not processed',
+        'rows': 0,
+        'output_file_path': job.get('output_file_path'),
+        'messages': messages,
+        'error': None,
+        'timings': [],
+        'key_stats': None,
+    }
+
+    inputs = job_inputs(job)
+    output_path = job.get('output_file_path')
+    selected_columns = job.get('selected_columns') or []
+
+    # Validate selections
+    if not all(spec['key_column'] for spec in inputs):
+        emit(f"{label}: Missing key column selections")
+        result['status'] = 'Failed - Missing key column selections'
+        return result
+
+    if not output_path:
+        emit(f"{label}: No output path specified")
+        result['status'] = 'Failed - No output path'
+        return result
+
+    timer = instrumentation.StageTimer(label, job.get('metrics_log'))
+    result['timings'] = timer.spans
+
+    try:
+        emit(f"Processing {label}...")
+
+        with instrumentation.profiled(job.get('profile'), job.get('profile_dir'), f"pair_{job.get('id', 0)+1}", emit):
+            if job.get('skip_unchanged'):
+                manifest = run_manifest.RunManifest(job.get('state_dir'))
+                with timer.span('fingerprint'):
+                    run_fingerprint = run_manifest.fingerprint([spec['file_path'] for spec in inputs], run_config(job))
+                    record = manifest.is_current(output_path, run_fingerprint)
+                if record is not None:
+                    emit(f"{label}: Skipped - inputs and settings unchanged since {output_path} was written")
+                    result['success'] = True
+                    result['status'] = 'Skipped - Unchanged'
+                    result['rows'] = record.get('rows', 0)
+                    return result
+
+            if len(inputs) > 2 and (job.get('out_of_core') or job.get('incremental')):
+                raise ValueError("Out-of-core and incremental merges support two-file pairs only")
+            if job.get('fuzzy_keys') and (len(inputs) > 2 or job.get('out_of_core') or job.get('incremental')):
+                raise ValueError("Fuzzy key matching supports two-file in-memory merges only")
+
+            if job.get('out_of_core'):
+                # Imported here: chunked_merge builds on this module
+                import chunked_merge
+                with timer.span('out_of_core_merge') as span:
+                    output_path, rows, columns = chunked_merge.merge_csv_pair(job, emit)
+                    span['rows'] = rows
+            elif job.get('incremental'):
+                # Imported here: incremental_merge builds on this module
+                import incremental_merge
+                with timer.span('incremental_merge') as span:
+                    final_df = incremental_merge.merge_pair(job, emit, cache_for_job(job))
+                    span['rows'] = len(final_df)
+                with timer.span('write', len(final_df)):
+                    output_path = write_output(final_df, output_path, emit, job.get('streaming_writer', False))
+                rows, columns = len(final_df), len(final_df.columns)
+            else:
+                suffixes = [spec['suffix'] for spec in inputs]
+                if len(set(suffixes)) != len(suffixes):
+                    raise ValueError(f"Input suffixes must be unique: {', '.join(suffixes)}")
+
+                # Only parse the key column and the selected output columns
+                cache = cache_for_job(job)
+                frames = []
+                for number, spec in enumerate(inputs, 1):
+                    df = spec['df']
+                    if df is None:
+                        with timer.span(f'load_file{number}') as span:
+                            df = load_table(spec['file_path'], emit, job.get('excel_engine'),
+                                            projected_columns(spec['key_column'], selected_columns, spec['suffix']),
+                                            cache, spec['sheets'], job.get('sheet_workers'), job.get('arrow', False))
+                            span['rows'] = len(df)
+                    frames.append(df)
+
+                key_rules = merge_keys.parse_rules(job.get('key_rules'))
+                with timer.span('normalize_keys', sum(len(df) for df in frames)):
+                    sides = [prepare_side(df, spec['key_column'], spec['suffix'], selected_columns,
+                                          f"File {number}", key_rules, job.get('arrow', False))
+                             for number, (df, spec) in enumerate(zip(frames, inputs), 1)]
+
+                output_selection = selected_columns
+                threshold = fuzzy_keys_threshold(job)
+                if threshold is not None:
+                    # Imported here: fuzzy_keys builds on this module
+                    import fuzzy_keys
+                    with timer.span('fuzzy_keys', sum(len(side) for side in sides)):
+                        sides[1], matches = fuzzy_keys.match_unmatched_keys(
+                            sides[0], sides[1], threshold, job.get('fuzzy_columns', False), emit)
+                    if job.get('fuzzy_columns') and selected_columns:
+                        output_selection = list(selected_columns) + fuzzy_keys.FUZZY_COLUMNS
+
+                # Imported here: key_stats builds on this module
+                import key_stats
+                with timer.span('key_stats', sum(len(side) for side in sides)):
+                    stats = key_stats.profile_sides(sides)
+                if threshold is not None:
+                    stats['fuzzy_matches'] = len(matches)
+                for line in key_stats.describe(stats):
+                    emit(f"  {line}")
+                sides, stats = key_stats.guard_output_size(sides, stats, job.get('max_output_rows'),
+                                                           job.get('explosion_action'), emit)
+                result['key_stats'] = stats
+
+                final_df = merge_prepared(sides, output_selection, emit, job.get('sorted_keys', False), timer)
+                with timer.span('write', len(final_df)):
+                    output_path = write_output(final_df, output_path, emit, job.get('streaming_writer', False))
+                rows, columns = len(final_df), len(final_df.columns)
+
+            if job.get('skip_unchanged'):
+                manifest.record(output_path, run_fingerprint, rows=rows)
+
+        emit(f"{label}: Successfully processed and saved to {output_path}")
+        emit(f"  - Records merged: {rows}")
+        if selected_columns:
+            emit(f"  - Selected columns: {columns}")
+        emit(f"  - {timer.summary()}")
+
+        result['success'] = True
+        result['status'] = 'Processed successfully'
+        result['rows'] = rows
+        result['output_file_path'] = output_path
+
+    except Exception as e:
+        error_details = traceback.format_exc()
+        emit(f"{label}: Failed - {str(e)}")
+        emit(error_details)
+        result['status'] = 'Failed - Processing error'
+        result['error'] = str(e)
+
+    return result
+
+
+def resolve_workers(workers):
+    """Turn a requested worker count into a usable one (0 or less means all cores)"""
+    if workers is None or workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def iter_results(jobs, log=None, workers=1, cancel_event=None):
+    """Process jobs and yield each result as soon as its pair finishes.
+
+    With one worker the pairs run in this process and log messages stream
+    live. With more, each pair runs in a separate process; its messages are
+    passed to ``log`` in one block when the pair completes, so results arrive
+    in completion order rather than job order.
+
+    Setting ``cancel_event`` (a ``threading.Event``) stops pairs that have not
+    started yet; pairs already running are allowed to finish. Frames kept in
+    memory for the batch (see :func:`load_table`) are released at the end.
+    """
+    workers = min(resolve_workers(workers), max(len(jobs), 1))
+    cancelled = lambda: cancel_event is not None and cancel_event.is_set()
+
+    if workers == 1:
+        try:
+            for job in jobs:
+                if cancelled():
+                    return
+                yield process_pair(job, log)
+        finally:
+            # Frames shared between the batch's pairs are not needed after it
+            workbook_cache.forget_all()
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_pair_worker) as executor:
+        futures = {executor.submit(process_pair, job): job for job in jobs}
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            if cancelled():
+                # Drop everything still queued; running pairs still report back
+                for pending in futures:
+                    pending.cancel()
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker process itself died (e.g. out of memory)
+                result = {
+                    'id': job.get('id', 0),
+                    'success': False,
+                    'status': 'Failed - Worker error',
+                    'rows': 0,
+                    'output_file_path': job.get('output_file_path'),
+                    'messages': [f"Pair #{job.get('id', 0)+1}: Failed - {str(e)}"],
+                    'error': str(e),
+                    'timings': [],
+                    'key_stats': None,
+                }
+            if log is not None:
+                for message in result['messages']:
+                    log(message)
+            yield result
+
+
+def run_batch(jobs, log=print, workers=1, on_result=None):
+    """Process every job and return a summary dictionary.
+
+    ``on_result`` is called with each result as soon as its pair finishes.
+    """
+    total_pairs = len(jobs)
+    results = []
+
+    log(f"Starting to process {total_pairs} file pairs...")
+
+    for result in iter_results(jobs, log, workers):
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+
+    results.sort(key=lambda result: result['id'])
+    successful_pairs = sum(1 for result in results if result['success'])
+    failed_pairs = total_pairs - successful_pairs
+
+    # Show summary
+    log("\nProcessing Summary:")
+    log(f"Total pairs: {total_pairs}")
+    log(f"Successfully processed: {successful_pairs}")
+    log(f"Failed: {failed_pairs}")
+    totals = instrumentation.stage_totals(result['timings'] for result in results)
+    if totals:
+        log(totals)
+
+    return {
+        'total': total_pairs,
+        'successful': successful_pairs,
+        'failed': failed_pairs,
+        'results': results,
+    }
+
+
+def load_manifest(manifest_path):
+    """Read a JSON or YAML batch manifest and return the list of jobs.
+
+    The manifest is either a list of pairs or a mapping with a ``pairs`` list.
+    Each pair uses the job keys accepted by :func:`process_pair`, either two
+    files or an ``inputs`` list; relative paths are resolved against the
+    manifest's directory.
+    """
+    ext = os.path.splitext(manifest_path)[1].lower()
+    with open(manifest_path, encoding='utf-8') as f:
+        if ext in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("PyYAML is required for YAML manifests (pip install pyyaml)")
+            manifest = yaml.safe_load(f)
+        else:
+            manifest = json.load(f)
+
+    pairs = manifest.get('pairs', []) if isinstance(manifest, dict) else manifest
+    if not isinstance(pairs, list):
+        raise ValueError("Manifest 'pairs' must be a list")
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+
+    def resolve(path):
+        return os.path.normpath(os.path.join(base_dir, os.path.expanduser(str(path))))
+
+    jobs = []
+    for i, pair in enumerate(pairs):
+        job = dict(pair)
+        job['id'] = i
+        if 'inputs' in pair:
+            inputs = pair['inputs']
+            if not isinstance(inputs, list) or len(inputs) < 2:
+                raise ValueError(f"Pair #{i+1} in manifest: 'inputs' must list at least two files")
+            job['inputs'] = []
+            for number, spec in enumerate(inputs, 1):
+                missing = [key for key in ('file_path', 'key_column') if not spec.get(key)]
+                if missing:
+                    raise ValueError(f"Pair #{i+1} in manifest, input {number} is missing: {', '.join(missing)}")
+                job['inputs'].append(dict(spec, file_path=resolve(spec['file_path'])))
+            first_path = job['inputs'][0]['file_path']
+        else:
+            missing = [key for key in ('file1_path', 'file2_path') if not pair.get(key)]
+            if missing:
+                raise ValueError(f"Pair #{i+1} in manifest is missing: {', '.join(missing)}")
+            job['file1_path'] = resolve(pair['file1_path'])
+            job['file2_path'] = resolve(pair['file2_path'])
+            first_path = job['file1_path']
+
+        if pair.get('output_file_path'):
+            job['output_file_path'] = resolve(pair['output_file_path'])
+        else:
+            job['output_file_path'] = default_output_path(first_path)
+        job['selected_columns'] = list(pair.get('selected_columns') or [])
+        jobs.append(job)
+
+    return jobs
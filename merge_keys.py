@@ -0,0 +1,100 @@
+import pandas as pd
+
+# Normalization rules, applied in this order when enabled:
+#   fullwidth - full-width letters, digits and spaces (common in Chinese
+#               input methods) become their ASCII forms (Unicode NFKC)
+#   strip     - leading and trailing whitespace is removed
+#   casefold  - letters are compared case-insensitively
+#   numeric   - integers written as decimals ("1001.0", "1001.00") lose the
+#               fractional zeros, as happens when Excel stores IDs as floats
+KEY_RULES = ('fullwidth', 'strip', 'casefold', 'numeric')
+
+
+def parse_rules(rules):
+    """Turn a comma-separated string or list into validated rule names.
+
+    ``"all"`` enables every rule; an empty value enables none.
+    """
+    if not rules:
+        return []
+    if isinstance(rules, str):
+        rules = [rule.strip() for rule in rules.split(',') if rule.strip()]
+    rules = [rule.lower() for rule in rules]
+    if 'all' in rules:
+        return list(KEY_RULES)
+    unknown = [rule for rule in rules if rule not in KEY_RULES]
+    if unknown:
+        raise ValueError(f"Unknown key normalization rule(s): {', '.join(unknown)}. "
+                         f"Choose from: {', '.join(KEY_RULES)}, all")
+    return [rule for rule in KEY_RULES if rule in rules]
+
+
+def normalize_keys(values, rules=(), arrow=False):
+    """Convert a key column to strings and apply the enabled rules.
+
+    Without rules this is exactly ``fillna('').astype(str)``, the conversion
+    the merge has always used. With ``arrow`` the keys come back as
+    ``string[pyarrow]`` and the rules run as Arrow compute kernels, giving
+    the same keys.
+    """
+    if arrow:
+        return _normalize_arrow(values, rules)
+    keys = values.fillna('').astype(str)
+    if 'fullwidth' in rules:
+        keys = keys.str.normalize('NFKC')
+    if 'strip' in rules:
+        keys = keys.str.strip()
+    if 'casefold' in rules:
+        keys = keys.str.casefold()
+    if 'numeric' in rules:
+        keys = keys.str.replace(r'^([+-]?\d+)\.0+$', r'\1', regex=True)
+    return keys
+
+
+def _normalize_arrow(values, rules):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if values.dtype != object and pd.api.types.is_string_dtype(values.dtype):
+        # Arrow-backed text is handed to the kernels without copying
+        keys = pc.fill_null(pa.array(values.array), '')
+    else:
+        # Numbers and dates go through the same conversion as without
+        # Arrow (1001.0 stays "1001.0"). NumPy-backed loading stores integer
+        # columns with blanks as floats; key them the same way.
+        if isinstance(values.dtype, pd.ArrowDtype):
+            if pa.types.is_integer(values.dtype.pyarrow_dtype) and values.hasnans:
+                values = values.astype('double[pyarrow]')
+            values = values.astype(object)
+        keys = pa.array(values.fillna('').astype(str).to_numpy(dtype=object), type=pa.large_string(),
+                        from_pandas=True)
+    if 'fullwidth' in rules:
+        keys = pc.utf8_normalize(keys, 'NFKC')
+    if 'strip' in rules:
+        keys = pc.utf8_trim_whitespace(keys)
+    keys = pd.Series(pd.arrays.ArrowStringArray(keys.cast(pa.large_string())), index=values.index, name=values.name)
+    if 'casefold' in rules:
+        # Arrow has no full case folding ("ß" -> "ss"); this one step stays in Python
+        keys = keys.str.casefold()
+    if 'numeric' in rules:
+        keys = keys.str.replace(r'^([+-]?\d+)\.0+$', r'\1', regex=True)
+    return keys
+
+
+def encode_keys(*key_columns):
+    """Map several string key columns into one shared int64 code space.
+
+    Codes are assigned in sorted key order, so sorting or outer-merging on
+    codes orders rows exactly as the string keys would. Returns one code
+    array per input followed by the index of unique keys, where
+    ``uniques.take(codes)`` gives the strings back.
+    """
+    combined = pd.concat(key_columns, ignore_index=True)
+    codes, uniques = pd.factorize(combined, sort=True)
+
+    split = []
+    start = 0
+    for keys in key_columns:
+        split.append(codes[start:start + len(keys)])
+        start += len(keys)
+    return split + [uniques]
@@ -1,562 +1,705 @@
-import tkinter as tk
-from tkinter import filedialog, ttk, messagebox, scrolledtext
-import pandas as pd
-import os
-import traceback
-import sys
-import warnings
-
-class BatchMarksheetMergeApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Batch Marksheet Merge Tool")
-        self.root.geometry("900x700")
-        
-        # Suppress warnings to avoid cluttering the UI
-        warnings.filterwarnings("ignore")
-        
-        # Create a list to hold all file pairs and their configurations
-        self.file_pairs = []
-        
-        # Create the GUI
-        self.create_widgets()
-    
-    def create_widgets(self):
-        # Create main frames
-        self.control_frame = ttk.Frame(self.root, padding=10)
-        self.control_frame.pack(fill='x', padx=10, pady=5)
-        
-        self.pairs_frame = ttk.LabelFrame(self.root, text="File Pairs", padding=10)
-        self.pairs_frame.pack(fill='both', expand=True, padx=10, pady=5)
-        
-        # Create a canvas with scrollbar for the pairs
-        self.canvas = tk.Canvas(self.pairs_frame)
-        self.scrollbar = ttk.Scrollbar(self.pairs_frame, orient="vertical", command=self.canvas.yview)
-        self.scrollable_frame = ttk.Frame(self.canvas)
-        
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-        )
-        
-        self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
-        
-        self.canvas.pack(side="left", fill="both", expand=True)
-        self.scrollbar.pack(side="right", fill="y")
-        
-        # Control buttons
-        ttk.Button(self.control_frame, text="Add File Pair", command=self.add_file_pair).pack(side=tk.LEFT, padx=5)
-        ttk.Button(self.control_frame, text="Process All Pairs", command=self.process_all_pairs).pack(side=tk.LEFT, padx=5)
-        
-        # Results area
-        self.results_frame = ttk.LabelFrame(self.root, text="Results", padding=10)
-        self.results_frame.pack(fill='both', expand=True, padx=10, pady=5)
-        
-        self.results_text = scrolledtext.ScrolledText(self.results_frame, height=10)
-        self.results_text.pack(fill='both', expand=True)
-        
-        # Add the first pair by default
-        self.add_file_pair()
-    
-    def add_file_pair(self):
-        pair_id = len(self.file_pairs)
-        pair_frame = ttk.LabelFrame(self.scrollable_frame, text=f"Pair #{pair_id+1}", padding=10)
-        pair_frame.pack(fill='x', expand=True, padx=5, pady=5, anchor='nw')
-        
-        # Create a dictionary to store this pair's configuration
-        pair_config = {
-            'id': pair_id,
-            'frame': pair_frame,
-            'file1_path': tk.StringVar(),
-            'file2_path': tk.StringVar(),
-            'output_file_path': tk.StringVar(),
-            'file1_key_column': tk.StringVar(),
-            'file2_key_column': tk.StringVar(),
-            'file1_df': None,
-            'file2_df': None,
-            'status': 'Not processed',
-            'dropdown_widgets': {},
-            'selected_columns': [],  # List to store selected output columns
-            'column_vars': [],       # List to store checkbox variables
-        }
-        
-        # File 1 selection
-        file1_frame = ttk.Frame(pair_frame)
-        file1_frame.pack(fill='x', padx=5, pady=2)
-        
-        ttk.Label(file1_frame, text="File 1:").pack(side=tk.LEFT, padx=5)
-        ttk.Entry(file1_frame, textvariable=pair_config['file1_path'], width=40).pack(side=tk.LEFT, padx=5)
-        ttk.Button(file1_frame, text="Browse...", 
-                   command=lambda: self.browse_file(pair_config['file1_path'])).pack(side=tk.LEFT, padx=5)
-        
-        # File 2 selection
-        file2_frame = ttk.Frame(pair_frame)
-        file2_frame.pack(fill='x', padx=5, pady=2)
-        
-        ttk.Label(file2_frame, text="File 2:").pack(side=tk.LEFT, padx=5)
-        ttk.Entry(file2_frame, textvariable=pair_config['file2_path'], width=40).pack(side=tk.LEFT, padx=5)
-        ttk.Button(file2_frame, text="Browse...", 
-                   command=lambda: self.browse_file(pair_config['file2_path'])).pack(side=tk.LEFT, padx=5)
-        
-        # Load files button
-        ttk.Button(pair_frame, text="Load Files", 
-                  command=lambda p=pair_config: self.load_files(p)).pack(anchor='center', pady=5)
-        
-        # Column selection (initially hidden, shown after loading files)
-        columns_frame = ttk.LabelFrame(pair_frame, text="Key Column Selection", padding=5)
-        pair_config['columns_frame'] = columns_frame
-        
-        # File 1 key column
-        file1_cols_frame = ttk.Frame(columns_frame)
-        file1_cols_frame.pack(fill='x', padx=5, pady=2)
-        
-        ttk.Label(file1_cols_frame, text="File 1 Key Column:").pack(side=tk.LEFT, padx=5)
-        file1_key_combo = ttk.Combobox(file1_cols_frame, textvariable=pair_config['file1_key_column'], state='readonly', width=20)
-        file1_key_combo.pack(side=tk.LEFT, padx=5)
-        pair_config['dropdown_widgets']['file1_key'] = file1_key_combo
-        
-        # File 2 key column
-        file2_cols_frame = ttk.Frame(columns_frame)
-        file2_cols_frame.pack(fill='x', padx=5, pady=2)
-        
-        ttk.Label(file2_cols_frame, text="File 2 Key Column:").pack(side=tk.LEFT, padx=5)
-        file2_key_combo = ttk.Combobox(file2_cols_frame, textvariable=pair_config['file2_key_column'], state='readonly', width=20)
-        file2_key_combo.pack(side=tk.LEFT, padx=5)
-        pair_config['dropdown_widgets']['file2_key'] = file2_key_combo
-        
-        # Output column selection (initially hidden, shown after loading files)
-        output_columns_frame = ttk.LabelFrame(pair_frame, text="Select Output Columns (Max 10)", padding=5)
-        pair_config['output_columns_frame'] = output_columns_frame
-        
-        # Create a frame with scrollbar for the output column checkboxes
-        output_canvas = tk.Canvas(output_columns_frame, height=150)
-        output_scrollbar = ttk.Scrollbar(output_columns_frame, orient="vertical", command=output_canvas.yview)
-        output_scrollable_frame = ttk.Frame(output_canvas)
-        
-        output_scrollable_frame.bind(
-            "<Configure>",
-            lambda e: output_canvas.configure(scrollregion=output_canvas.bbox("all"))
-        )
-        
-        output_canvas.create_window((0, 0), window=output_scrollable_frame, anchor="nw")
-        output_canvas.configure(yscrollcommand=output_scrollbar.set)
-        
-        output_canvas.pack(side="left", fill="both", expand=True, padx=5, pady=5)
-        output_scrollbar.pack(side="right", fill="y")
-        
-        pair_config['output_scrollable_frame'] = output_scrollable_frame
-        pair_config['output_canvas'] = output_canvas
-        
-        # Output file selection
-        output_frame = ttk.Frame(pair_frame)
-        output_frame.pack(fill='x', padx=5, pady=2)
-        
-        ttk.Label(output_frame, text="Output File:").pack(side=tk.LEFT, padx=5)
-        ttk.Entry(output_frame, textvariable=pair_config['output_file_path'], width=40).pack(side=tk.LEFT, padx=5)
-        ttk.Button(output_frame, text="Browse...", 
-                   command=lambda: self.browse_save_file(pair_config['output_file_path'])).pack(side=tk.LEFT, padx=5)
-        
-        # Status indicator
-        status_frame = ttk.Frame(pair_frame)
-        status_frame.pack(fill='x', padx=5, pady=2)
-        
-        ttk.Label(status_frame, text="Status:").pack(side=tk.LEFT, padx=5)
-        status_label = ttk.Label(status_frame, text=pair_config['status'])
-        status_label.pack(side=tk.LEFT, padx=5)
-        pair_config['status_label'] = status_label
-        
-        # Add remove button
-        ttk.Button(pair_frame, text="Remove Pair", 
-                  command=lambda p=pair_config: self.remove_pair(p)).pack(anchor='e', pady=5)
-        
-        # Add this pair to our list
-        self.file_pairs.append(pair_config)
-        
-        # Update the canvas scroll region
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-    
-    def remove_pair(self, pair_config):
-        if len(self.file_pairs) <= 1:
-            messagebox.showinfo("Cannot Remove", "You must have at least one file pair")
-            return
-            
-        pair_config['frame'].destroy()
-        self.file_pairs.remove(pair_config)
-        
-        # Renumber the remaining pairs
-        for i, pair in enumerate(self.file_pairs):
-            pair['id'] = i
-            pair['frame'].configure(text=f"Pair #{i+1}")
-        
-        # Update the canvas scroll region
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-    
-    def browse_file(self, file_path_var):
-        file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx;*.xls"), ("CSV files", "*.csv"), ("All files", "*.*")])
-        if file_path:
-            # Convert to normal string and normalize path
-            file_path = os.path.normpath(str(file_path))
-            file_path_var.set(file_path)
-    
-    def browse_save_file(self, file_path_var):
-        file_path = filedialog.asksaveasfilename(
-            defaultextension=".xlsx", 
-            filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")]
-        )
-        if file_path:
-            # Add extension if not provided
-            if not (file_path.endswith('.xlsx') or file_path.endswith('.csv')):
-                file_path += '.xlsx'
-            # Convert to normal string and normalize path
-            file_path = os.path.normpath(str(file_path))
-            file_path_var.set(file_path)
-    
-    def try_multiple_engines(self, file_path):
-        """Try to load Excel file with multiple engines"""
-        self.log_message(f"Attempting to load {file_path}")
-        errors = []
-        
-        # Check file extension
-        ext = os.path.splitext(file_path)[1].lower()
-        
-        # If CSV, try to load as CSV
-        if ext == '.csv':
-            try:
-                self.log_message("Trying to load as CSV file...")
-                return pd.read_csv(file_path)
-            except Exception as e:
-                errors.append(f"CSV engine error: {str(e)}")
-        
-        # Try with different engines
-        engines = ['openpyxl', 'xlrd']
-        for engine in engines:
-            try:
-                self.log_message(f"Trying Excel engine: {engine}...")
-                # Try with explicit engine
-                return pd.read_excel(file_path, engine=engine)
-            except Exception as e:
-                errors.append(f"{engine} engine error: {str(e)}")
-        
-        # If all of the above failed, try with default settings
-        try:
-            self.log_message("Trying default pandas Excel reader...")
-            return pd.read_excel(file_path)
-        except Exception as e:
-            errors.append(f"Default engine error: {str(e)}")
-            
-        # If we got here, all attempts failed
-        error_summary = "\n".join(errors)
-        raise Exception(f"Failed to load file with any method. Errors:\n{error_summary}")
-    
-    def load_files(self, pair_config):
-        file1_path = pair_config['file1_path'].get()
-        file2_path = pair_config['file2_path'].get()
-        
-        if not file1_path or not file2_path:
-            messagebox.showerror("Error", f"Please select both files for Pair #{pair_config['id']+1}")
-            return
-        
-        try:
-            # Check if files exist
-            if not os.path.isfile(file1_path):
-                raise FileNotFoundError(f"File 1 does not exist: {file1_path}")
-            if not os.path.isfile(file2_path):
-                raise FileNotFoundError(f"File 2 does not exist: {file2_path}")
-                
-            # Print file sizes for debugging
-            file1_size = os.path.getsize(file1_path) / 1024 / 1024  # Size in MB
-            file2_size = os.path.getsize(file2_path) / 1024 / 1024  # Size in MB
-            self.log_message(f"File 1 size: {file1_size:.2f} MB")
-            self.log_message(f"File 2 size: {file2_size:.2f} MB")
-            
-            # Use try/except for each file to provide more specific error messages
-            try:
-                self.log_message(f"Loading File 1: {file1_path}")
-                pair_config['file1_df'] = self.try_multiple_engines(file1_path)
-                self.log_message(f"File 1 loaded successfully with shape: {pair_config['file1_df'].shape}")
-            except Exception as e:
-                self.log_message(f"Error loading File 1: {str(e)}")
-                raise Exception(f"Error loading File 1: {str(e)}")
-                
-            try:
-                self.log_message(f"Loading File 2: {file2_path}")
-                pair_config['file2_df'] = self.try_multiple_engines(file2_path)
-                self.log_message(f"File 2 loaded successfully with shape: {pair_config['file2_df'].shape}")
-            except Exception as e:
-                self.log_message(f"Error loading File 2: {str(e)}")
-                raise Exception(f"Error loading File 2: {str(e)}")
-            
-            # Show the column selection areas
-            pair_config['columns_frame'].pack(fill='x', padx=5, pady=5)
-            
-            # Update dropdowns with column headers
-            file1_columns = list(pair_config['file1_df'].columns)
-            file2_columns = list(pair_config['file2_df'].columns)
-            
-            # Log column data types to identify potential issues
-            self.log_message("File 1 column types:")
-            for col in file1_columns:
-                dtype = pair_config['file1_df'][col].dtype
-                self.log_message(f"  - {col}: {dtype}")
-                
-            self.log_message("File 2 column types:")
-            for col in file2_columns:
-                dtype = pair_config['file2_df'][col].dtype
-                self.log_message(f"  - {col}: {dtype}")
-            
-            pair_config['dropdown_widgets']['file1_key']['values'] = file1_columns
-            pair_config['dropdown_widgets']['file2_key']['values'] = file2_columns
-            
-            # Try to auto-select columns with "name" or "id" in them
-            for col in file1_columns:
-                col_lower = str(col).lower()
-                if any(key in col_lower for key in ['name', 'id', '姓名', '名字', '学号', '身份']):
-                    pair_config['file1_key_column'].set(col)
-                    break
-            
-            for col in file2_columns:
-                col_lower = str(col).lower()
-                if any(key in col_lower for key in ['name', 'id', '姓名', '名字', '学号', '身份']):
-                    pair_config['file2_key_column'].set(col)
-                    break
-            
-            # Clear any existing output column checkboxes
-            for widget in pair_config['output_scrollable_frame'].winfo_children():
-                widget.destroy()
-            pair_config['column_vars'] = []
-            pair_config['selected_columns'] = []
-            
-            # Setup output column selection
-            # Create preview merged dataframe to show all potential columns
-            file1_df_preview = pair_config['file1_df'].copy().add_suffix('_file1')
-            file2_df_preview = pair_config['file2_df'].copy().add_suffix('_file2')
-            
-            # Get all possible column names
-            all_columns = list(file1_df_preview.columns) + list(file2_df_preview.columns)
-            
-            # Add checkboxes for column selection
-            ttk.Label(pair_config['output_scrollable_frame'], 
-                    text="Select columns to include in output (max 10):").pack(anchor='w', padx=5, pady=5)
-            
-            def update_selection():
-                # Update the selected_columns list based on checkboxes
-                pair_config['selected_columns'] = [col for col, var in zip(all_columns, pair_config['column_vars']) if var.get()]
-                
-                # If more than 10 are selected, deselect the most recent one
-                if len(pair_config['selected_columns']) > 10:
-                    # Find index of last selected item
-                    for i in range(len(pair_config['column_vars'])-1, -1, -1):
-                        if pair_config['column_vars'][i].get():
-                            pair_config['column_vars'][i].set(False)
-                            break
-                    # Update selected columns again
-                    pair_config['selected_columns'] = [col for col, var in zip(all_columns, pair_config['column_vars']) if var.get()]
-                
-                # Update selection count
-                selection_count_label.config(text=f"Selected: {len(pair_config['selected_columns'])}/10")
-            
-            for col in all_columns:
-                var = tk.BooleanVar(value=False)
-                pair_config['column_vars'].append(var)
-                chk = ttk.Checkbutton(
-                    pair_config['output_scrollable_frame'], 
-                    text=col,
-                    variable=var,
-                    command=update_selection
-                )
-                chk.pack(anchor='w', padx=20, pady=2)
-            
-            # Add a label to show selection count
-            selection_count_label = ttk.Label(pair_config['output_scrollable_frame'], text="Selected: 0/10")
-            selection_count_label.pack(anchor='w', padx=5, pady=5)
-            pair_config['selection_count_label'] = selection_count_label
-            
-            # Show the output column selection frame
-            pair_config['output_columns_frame'].pack(fill='x', padx=5, pady=5)
-            
-            # Suggest output file name based on input files
-            if not pair_config['output_file_path'].get():
-                file1_basename = os.path.basename(file1_path)
-                base, ext = os.path.splitext(file1_basename)
-                output_name = f"merged_{base}.xlsx"
-                output_dir = os.path.dirname(file1_path)
-                pair_config['output_file_path'].set(os.path.join(output_dir, output_name))
-            
-            # Update status
-            pair_config['status'] = 'Files loaded'
-            pair_config['status_label'].configure(text=pair_config['status'], foreground='green')
-            
-            self.log_message(f"Pair #{pair_config['id']+1}: Files loaded successfully")
-            
-        except Exception as e:
-            error_details = traceback.format_exc()
-            self.log_message(f"Error loading files for Pair #{pair_config['id']+1}: {str(e)}")
-            self.log_message(error_details)
-            messagebox.showerror("Error", f"Error loading files for Pair #{pair_config['id']+1}: {str(e)}")
-    
-    def process_all_pairs(self):
-        if not self.file_pairs:
-            messagebox.showinfo("No Pairs", "No file pairs to process")
-            return
-            
-        total_pairs = len(self.file_pairs)
-        successful_pairs = 0
-        failed_pairs = 0
-        
-        self.log_message(f"Starting to process {total_pairs} file pairs...")
-        
-        for pair in self.file_pairs:
-            # Skip if files not loaded
-            if pair['file1_df'] is None or pair['file2_df'] is None:
-                self.log_message(f"Pair #{pair['id']+1}: Skipped - Files not loaded")
-                pair['status'] = 'Skipped - Files not loaded'
-                pair['status_label'].configure(text=pair['status'], foreground='orange')
-                failed_pairs += 1
-                continue
-                
-            # Get column selections
-            file1_key_col = pair['file1_key_column'].get()
-            file2_key_col = pair['file2_key_column'].get()
-            output_path = pair['output_file_path'].get()
-            selected_columns = pair['selected_columns']
-            
-            # Validate selections
-            if not file1_key_col or not file2_key_col:
-                self.log_message(f"Pair #{pair['id']+1}: Missing key column selections")
-                pair['status'] = 'Failed - Missing key column selections'
-                pair['status_label'].configure(text=pair['status'], foreground='red')
-                failed_pairs += 1
-                continue
-                
-            if not output_path:
-                self.log_message(f"Pair #{pair['id']+1}: No output path specified")
-                pair['status'] = 'Failed - No output path'
-                pair['status_label'].configure(text=pair['status'], foreground='red')
-                failed_pairs += 1
-                continue
-                
-            try:
-                self.log_message(f"Processing Pair #{pair['id']+1}...")
-                
-                # Create deep copies to avoid modifying original dataframes
-                file1_df = pair['file1_df'].copy()
-                file2_df = pair['file2_df'].copy()
-                
-                # Clean column names to avoid issues
-                file1_df.columns = [str(col).strip() for col in file1_df.columns]
-                file2_df.columns = [str(col).strip() for col in file2_df.columns]
-                
-                # Ensure key columns exist
-                if file1_key_col not in file1_df.columns:
-                    raise ValueError(f"Key column '{file1_key_col}' not found in File 1")
-                if file2_key_col not in file2_df.columns:
-                    raise ValueError(f"Key column '{file2_key_col}' not found in File 2")
-                
-                # Convert key columns to string to ensure proper merging
-                file1_df[file1_key_col] = file1_df[file1_key_col].fillna('').astype(str)
-                file2_df[file2_key_col] = file2_df[file2_key_col].fillna('').astype(str)
-                
-                # Add suffixes to columns to differentiate them after merge
-                file1_df_renamed = file1_df.add_suffix('_file1')
-                file2_df_renamed = file2_df.add_suffix('_file2')
-                
-                # Rename the key columns back to a common column for merging
-                file1_df_renamed = file1_df_renamed.rename(columns={f"{file1_key_col}_file1": "Merge_Key"})
-                file2_df_renamed = file2_df_renamed.rename(columns={f"{file2_key_col}_file2": "Merge_Key"})
-                
-                # Log data for debugging
-                self.log_message(f"File 1 shape before merge: {file1_df_renamed.shape}")
-                self.log_message(f"File 2 shape before merge: {file2_df_renamed.shape}")
-                
-                # Alternative merge approach using pandas merge function instead of join
-                merged_df = pd.merge(
-                    file1_df_renamed, 
-                    file2_df_renamed,
-                    on="Merge_Key",
-                    how="outer"
-                )
-                
-                self.log_message(f"Merged dataframe shape: {merged_df.shape}")
-                
-                # If user has selected specific columns for output
-                if selected_columns:
-                    # Make sure Merge_Key is always included
-                    if "Merge_Key" not in selected_columns:
-                        final_cols = ["Merge_Key"] + [col for col in selected_columns]
-                    else:
-                        final_cols = selected_columns
-                        
-                    # Only include columns that exist in the merged dataframe
-                    final_cols = [col for col in final_cols if col in merged_df.columns]
-                    
-                    self.log_message(f"Using {len(final_cols)} selected columns for output")
-                    final_df = merged_df[final_cols]
-                else:
-                    # Reorder columns to have file1 columns first, then file2
-                    file1_cols = ["Merge_Key"] + [col for col in merged_df.columns if col.endswith('_file1') and col != "Merge_Key"]
-                    file2_cols = [col for col in merged_df.columns if col.endswith('_file2')]
-                    
-                    # Final column order
-                    final_cols = file1_cols + file2_cols
-                    self.log_message(f"Using default column ordering with {len(final_cols)} columns")
-                    final_df = merged_df[final_cols]
-                
-                # Create output directory if it doesn't exist
-                output_dir = os.path.dirname(output_path)
-                if output_dir and not os.path.exists(output_dir):
-                    os.makedirs(output_dir)
-                
-                # Normalize output path
-                output_path = os.path.normpath(output_path)
-                
-                # Save based on file extension
-                if output_path.lower().endswith('.csv'):
-                    self.log_message(f"Saving as CSV: {output_path}")
-                    final_df.to_csv(output_path, index=False)
-                else:
-                    self.log_message(f"Saving as Excel: {output_path}")
-                    final_df.to_excel(output_path, index=False, engine='openpyxl')
-                
-                self.log_message(f"Pair #{pair['id']+1}: Successfully processed and saved to {output_path}")
-                self.log_message(f"  - Records merged: {len(final_df)}")
-                if selected_columns:
-                    self.log_message(f"  - Selected columns: {len(final_cols)}")
-                
-                pair['status'] = 'Processed successfully'
-                pair['status_label'].configure(text=pair['status'], foreground='green')
-                successful_pairs += 1
-                
-            except Exception as e:
-                error_details = traceback.format_exc()
-                self.log_message(f"Pair #{pair['id']+1}: Failed - {str(e)}")
-                self.log_message(error_details)
-                
-                pair['status'] = 'Failed - Processing error'
-                pair['status_label'].configure(text=pair['status'], foreground='red')
-                failed_pairs += 1
-        
-        # Show summary
-        self.log_message("\nProcessing Summary:")
-        self.log_message(f"Total pairs: {total_pairs}")
-        self.log_message(f"Successfully processed: {successful_pairs}")
-        self.log_message(f"Failed: {failed_pairs}")
-        
-        messagebox.showinfo("Processing Complete", 
-                           f"Processing complete.\nSuccessful: {successful_pairs}\nFailed: {failed_pairs}")
-    
-    def log_message(self, message):
-        self.results_text.configure(state='normal')
-        self.results_text.insert(tk.END, str(message) + "\n")
-        self.results_text.see(tk.END)
-        self.results_text.configure(state='disabled')
-        # Update UI
-        self.root.update_idletasks()
-
-def main():
-    root = tk.Tk()
-    app = BatchMarksheetMergeApp(root)
-    root.mainloop()
-
-if __name__ == "__main__":
+import tkinter as tk
+from tkinter import filedialog, ttk, messagebox, scrolledtext
+import os
+import traceback
+import warnings
+import multiprocessing
+import queue
+import threading
+
+import excel_io
+import fuzzy_keys
+import instrumentation
+import key_stats
+import merge_engine
+from column_picker import ColumnPicker, MAX_SELECTED
+
+class BatchMarksheetMergeApp:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("Batch Marksheet Merge Tool")
+        self.root.geometry("900x700")
+        
+        # Suppress warnings to avoid cluttering the UI
+        warnings.filterwarnings("ignore")
+        
+        # Create a list to hold all file pairs and their configurations
+        self.file_pairs = []
+        
+        # Background work: only one load/merge task runs at a time, and it talks
+        # to the Tk main thread exclusively through this queue
+        self.ui_queue = queue.Queue()
+        self.worker_thread = None
+        self.cancel_event = threading.Event()
+        
+        # Create the GUI
+        self.create_widgets()
+        
+        # Start draining the queue on the Tk event loop
+        self.root.after(100, self.poll_queue)
+    
+    def create_widgets(self):
+        # Create main frames
+        self.control_frame = ttk.Frame(self.root, padding=10)
+        self.control_frame.pack(fill='x', padx=10, pady=5)
+        
+        self.pairs_frame = ttk.LabelFrame(self.root, text="File Pairs", padding=10)
+        self.pairs_frame.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        # Create a canvas with scrollbar for the pairs
+        self.canvas = tk.Canvas(self.pairs_frame)
+        self.scrollbar = ttk.Scrollbar(self.pairs_frame, orient="vertical", command=self.canvas.yview)
+        self.scrollable_frame = ttk.Frame(self.canvas)
+        
+        self.scrollable_frame.bind(
+            "<Configure>",
+            lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        )
+        
+        self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        
+        # Control buttons
+        ttk.Button(self.control_frame, text="Add File Pair", command=self.add_file_pair).pack(side=tk.LEFT, padx=5)
+        ttk.Button(self.control_frame, text="Process All Pairs", command=self.process_all_pairs).pack(side=tk.LEFT, padx=5)
+        
+        # Number of pairs processed in parallel
+        ttk.Label(self.control_frame, text="Workers:").pack(side=tk.LEFT, padx=(15, 5))
+        self.workers_var = tk.IntVar(value=1)
+        ttk.Spinbox(self.control_frame, from_=1, to=os.cpu_count() or 1, textvariable=self.workers_var, width=4).pack(side=tk.LEFT)
+        
+        # Merge options get their own row under the buttons
+        self.options_frame = ttk.Frame(self.root, padding=(10, 0))
+        self.options_frame.pack(fill='x', padx=10, after=self.control_frame)
+        
+        # Write outputs chunk by chunk for very large merges
+        self.streaming_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.options_frame, text="Low-memory writer", variable=self.streaming_var).pack(side=tk.LEFT, padx=5)
+        
+        # Match keys regardless of spacing, case, full-width digits and "1001.0" vs "1001"
+        self.normalize_keys_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.options_frame, text="Normalize keys", variable=self.normalize_keys_var).pack(side=tk.LEFT, padx=5)
+        
+        # Leave outputs alone when neither the input files nor the settings changed
+        self.skip_unchanged_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.options_frame, text="Skip unchanged", variable=self.skip_unchanged_var).pack(side=tk.LEFT, padx=5)
+        
+        # Re-merge only the students whose rows changed since the last run
+        self.incremental_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.options_frame, text="Incremental", variable=self.incremental_var).pack(side=tk.LEFT, padx=5)
+        
+        # Exports sorted by student ID can be joined with a sort-merge
+        self.sorted_keys_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.options_frame, text="Sorted keys", variable=self.sorted_keys_var).pack(side=tk.LEFT, padx=5)
+        
+        # Match names that differ by spacing, punctuation or a character, with a confidence column
+        self.fuzzy_keys_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.options_frame, text="Fuzzy keys", variable=self.fuzzy_keys_var).pack(side=tk.LEFT, padx=5)
+        # Two- and three-character names one character apart score 0.5-0.8
+        self.fuzzy_threshold_var = tk.StringVar(value=str(fuzzy_keys.DEFAULT_THRESHOLD))
+        ttk.Entry(self.options_frame, textvariable=self.fuzzy_threshold_var, width=5).pack(side=tk.LEFT)
+        
+        # Hold the data in Arrow memory: smaller text columns and faster key handling
+        self.arrow_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.options_frame, text="Arrow mode", variable=self.arrow_var,
+                        state="normal" if excel_io.arrow_available() else "disabled").pack(side=tk.LEFT, padx=5)
+        
+        # cProfile each pair and show the slowest functions in the Results pane
+        self.profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.options_frame, text="Profile", variable=self.profile_var).pack(side=tk.LEFT, padx=5)
+        
+        # Refuse merges whose duplicate keys would multiply into a huge output
+        ttk.Label(self.options_frame, text="Max rows:").pack(side=tk.LEFT, padx=(15, 5))
+        # Blank: only .xlsx outputs are limited, to the rows a sheet holds
+        self.max_rows_var = tk.StringVar(value="")
+        ttk.Entry(self.options_frame, textvariable=self.max_rows_var, width=10).pack(side=tk.LEFT)
+        self.dedupe_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.options_frame, text="Dedupe if over", variable=self.dedupe_var).pack(side=tk.LEFT, padx=5)
+        
+        # Progress of the running background task
+        self.cancel_button = ttk.Button(self.control_frame, text="Cancel", command=self.cancel_task, state='disabled')
+        self.cancel_button.pack(side=tk.RIGHT, padx=5)
+        self.progress_bar = ttk.Progressbar(self.control_frame, mode='determinate', length=200)
+        self.progress_bar.pack(side=tk.RIGHT, padx=5)
+        
+        # Results area
+        self.results_frame = ttk.LabelFrame(self.root, text="Results", padding=10)
+        self.results_frame.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        self.results_text = scrolledtext.ScrolledText(self.results_frame, height=10)
+        self.results_text.pack(fill='both', expand=True)
+        
+        # Add the first pair by default
+        self.add_file_pair()
+    
+    def add_file_pair(self):
+        pair_id = len(self.file_pairs)
+        pair_frame = ttk.LabelFrame(self.scrollable_frame, text=f"Pair #{pair_id+1}", padding=10)
+        pair_frame.pack(fill='x', expand=True, padx=5, pady=5, anchor='nw')
+        
+        # Create a dictionary to store this pair's configuration
+        pair_config = {
+            'id': pair_id,
+            'frame': pair_frame,
+            'file1_path': tk.StringVar(),
+            'file2_path': tk.StringVar(),
+            'output_file_path': tk.StringVar(),
+            'file1_key_column': tk.StringVar(),
+            'file2_key_column': tk.StringVar(),
+            'file1_sheets': tk.StringVar(),   # Blank: first sheet; a name, or a pattern such as *
+            'file2_sheets': tk.StringVar(),
+            'file1_preview': None,   # Header row and a sample of rows, not the full file
+            'file2_preview': None,
+            'status': 'Not processed',
+            'dropdown_widgets': {},
+            'selected_columns': [],  # List to store selected output columns
+        }
+        
+        # File 1 selection
+        file1_frame = ttk.Frame(pair_frame)
+        file1_frame.pack(fill='x', padx=5, pady=2)
+        
+        ttk.Label(file1_frame, text="File 1:").pack(side=tk.LEFT, padx=5)
+        ttk.Entry(file1_frame, textvariable=pair_config['file1_path'], width=40).pack(side=tk.LEFT, padx=5)
+        ttk.Button(file1_frame, text="Browse...", 
+                   command=lambda: self.browse_file(pair_config['file1_path'])).pack(side=tk.LEFT, padx=5)
+        self.add_sheet_selector(file1_frame, pair_config['file1_path'], pair_config['file1_sheets'])
+        
+        # File 2 selection
+        file2_frame = ttk.Frame(pair_frame)
+        file2_frame.pack(fill='x', padx=5, pady=2)
+        
+        ttk.Label(file2_frame, text="File 2:").pack(side=tk.LEFT, padx=5)
+        ttk.Entry(file2_frame, textvariable=pair_config['file2_path'], width=40).pack(side=tk.LEFT, padx=5)
+        ttk.Button(file2_frame, text="Browse...", 
+                   command=lambda: self.browse_file(pair_config['file2_path'])).pack(side=tk.LEFT, padx=5)
+        self.add_sheet_selector(file2_frame, pair_config['file2_path'], pair_config['file2_sheets'])
+        
+        # Load files button
+        ttk.Button(pair_frame, text="Load Files", 
+                  command=lambda p=pair_config: self.load_files(p)).pack(anchor='center', pady=5)
+        
+        # Column selection (initially hidden, shown after loading files)
+        columns_frame = ttk.LabelFrame(pair_frame, text="Key Column Selection", padding=5)
+        pair_config['columns_frame'] = columns_frame
+        
+        # File 1 key column
+        file1_cols_frame = ttk.Frame(columns_frame)
+        file1_cols_frame.pack(fill='x', padx=5, pady=2)
+        
+        ttk.Label(file1_cols_frame, text="File 1 Key Column:").pack(side=tk.LEFT, padx=5)
+        file1_key_combo = ttk.Combobox(file1_cols_frame, textvariable=pair_config['file1_key_column'], state='readonly', width=20)
+        file1_key_combo.pack(side=tk.LEFT, padx=5)
+        pair_config['dropdown_widgets']['file1_key'] = file1_key_combo
+        
+        # File 2 key column
+        file2_cols_frame = ttk.Frame(columns_frame)
+        file2_cols_frame.pack(fill='x', padx=5, pady=2)
+        
+        ttk.Label(file2_cols_frame, text="File 2 Key Column:").pack(side=tk.LEFT, padx=5)
+        file2_key_combo = ttk.Combobox(file2_cols_frame, textvariable=pair_config['file2_key_column'], state='readonly', width=20)
+        file2_key_combo.pack(side=tk.LEFT, padx=5)
+        pair_config['dropdown_widgets']['file2_key'] = file2_key_combo
+        
+        # Key statistics: predicted output size and match rate, from the full key columns
+        key_stats_frame = ttk.Frame(columns_frame)
+        key_stats_frame.pack(fill='x', padx=5, pady=2)
+        
+        ttk.Button(key_stats_frame, text="Check Keys",
+                   command=lambda p=pair_config: self.check_keys(p)).pack(side=tk.LEFT, padx=5)
+        key_stats_label = ttk.Label(key_stats_frame, text="", justify=tk.LEFT)
+        key_stats_label.pack(side=tk.LEFT, padx=5)
+        pair_config['key_stats_label'] = key_stats_label
+        
+        # Output column selection (initially hidden, shown after loading files)
+        output_columns_frame = ttk.LabelFrame(pair_frame, text=f"Select Output Columns (Max {MAX_SELECTED})", padding=5)
+        pair_config['output_columns_frame'] = output_columns_frame
+        
+        # One searchable list for every column of both files; selecting a
+        # column updates the pair's selected_columns
+        def set_selected(columns, pair_config=pair_config):
+            pair_config['selected_columns'] = columns
+        
+        column_picker = ColumnPicker(output_columns_frame, on_change=set_selected)
+        column_picker.pack(fill='both', expand=True)
+        pair_config['column_picker'] = column_picker
+        
+        # Output file selection
+        output_frame = ttk.Frame(pair_frame)
+        output_frame.pack(fill='x', padx=5, pady=2)
+        
+        ttk.Label(output_frame, text="Output File:").pack(side=tk.LEFT, padx=5)
+        ttk.Entry(output_frame, textvariable=pair_config['output_file_path'], width=40).pack(side=tk.LEFT, padx=5)
+        ttk.Button(output_frame, text="Browse...", 
+                   command=lambda: self.browse_save_file(pair_config['output_file_path'])).pack(side=tk.LEFT, padx=5)
+        
+        # Status indicator
+        status_frame = ttk.Frame(pair_frame)
+        status_frame.pack(fill='x', padx=5, pady=2)
+        
+        ttk.Label(status_frame, text="Status:").pack(side=tk.LEFT, padx=5)
+        status_label = ttk.Label(status_frame, text=pair_config['status'])
+        status_label.pack(side=tk.LEFT, padx=5)
+        pair_config['status_label'] = status_label
+        
+        # Add remove button
+        ttk.Button(pair_frame, text="Remove Pair", 
+                  command=lambda p=pair_config: self.remove_pair(p)).pack(anchor='e', pady=5)
+        
+        # Add this pair to our list
+        self.file_pairs.append(pair_config)
+        
+        # Update the canvas scroll region
+        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+    
+    def add_sheet_selector(self, parent, file_path_var, sheets_var):
+        # Editable: pick a sheet, "*" for all sheets, or type a pattern such as "Class*"
+        ttk.Label(parent, text="Sheets:").pack(side=tk.LEFT, padx=(10, 5))
+        combo = ttk.Combobox(parent, textvariable=sheets_var, width=15)
+        combo.configure(postcommand=lambda: self.fill_sheet_choices(combo, file_path_var.get()))
+        combo.pack(side=tk.LEFT, padx=5)
+    
+    def fill_sheet_choices(self, combo, file_path):
+        # Listed when the dropdown opens; only the workbook's index is read
+        choices = ['', '*']
+        if file_path and os.path.isfile(file_path):
+            try:
+                choices += excel_io.list_sheet_names(file_path)
+            except Exception:
+                pass
+        combo['values'] = choices
+    
+    def remove_pair(self, pair_config):
+        if len(self.file_pairs) <= 1:
+            messagebox.showinfo("Cannot Remove", "You must have at least one file pair")
+            return
+            
+        pair_config['frame'].destroy()
+        self.file_pairs.remove(pair_config)
+        
+        # Renumber the remaining pairs
+        for i, pair in enumerate(self.file_pairs):
+            pair['id'] = i
+            pair['frame'].configure(text=f"Pair #{i+1}")
+        
+        # Update the canvas scroll region
+        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+    
+    def browse_file(self, file_path_var):
+        file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx;*.xls"), ("CSV files", "*.csv"), ("All files", "*.*")])
+        if file_path:
+            # Convert to normal string and normalize path
+            file_path = os.path.normpath(str(file_path))
+            file_path_var.set(file_path)
+    
+    def browse_save_file(self, file_path_var):
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".xlsx", 
+            filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv"),
+                       ("Compressed CSV files", "*.csv.gz"), ("Parquet files", "*.parquet")]
+        )
+        if file_path:
+            # Add extension if not provided
+            if not file_path.lower().endswith(excel_io.OUTPUT_SUFFIXES):
+                file_path += '.xlsx'
+            # Convert to normal string and normalize path
+            file_path = os.path.normpath(str(file_path))
+            file_path_var.set(file_path)
+    
+    def try_multiple_engines(self, file_path, sheets=''):
+        """Read the header and a sample of rows; the full file is parsed at process time"""
+        return merge_engine.read_preview(file_path, self.log_message, sheets=sheets or None)
+    
+    def load_files(self, pair_config):
+        file1_path = pair_config['file1_path'].get()
+        file2_path = pair_config['file2_path'].get()
+        sheets = (pair_config['file1_sheets'].get().strip(), pair_config['file2_sheets'].get().strip())
+        
+        if not file1_path or not file2_path:
+            messagebox.showerror("Error", f"Please select both files for Pair #{pair_config['id']+1}")
+            return
+        
+        # Parse the files off the Tk thread; the widgets are built once both are loaded
+        self.run_in_background(
+            lambda: self.read_pair_files(pair_config, file1_path, file2_path, sheets),
+            f"Loading files for Pair #{pair_config['id']+1}..."
+        )
+    
+    def read_pair_files(self, pair_config, file1_path, file2_path, sheets=('', '')):
+        # Runs on the worker thread: no Tk calls here except through the queue
+        try:
+            # Check if files exist
+            if not os.path.isfile(file1_path):
+                raise FileNotFoundError(f"File 1 does not exist: {file1_path}")
+            if not os.path.isfile(file2_path):
+                raise FileNotFoundError(f"File 2 does not exist: {file2_path}")
+                
+            # Print file sizes for debugging
+            file1_size = os.path.getsize(file1_path) / 1024 / 1024  # Size in MB
+            file2_size = os.path.getsize(file2_path) / 1024 / 1024  # Size in MB
+            self.log_message(f"File 1 size: {file1_size:.2f} MB")
+            self.log_message(f"File 2 size: {file2_size:.2f} MB")
+            
+            # Time each preview load; the records go to the metrics log
+            timer = instrumentation.StageTimer(f"Pair #{pair_config['id']+1} load", instrumentation.DEFAULT_METRICS_LOG)
+            
+            # Use try/except for each file to provide more specific error messages
+            try:
+                self.log_message(f"Loading File 1: {file1_path}")
+                with timer.span('preview_file1'):
+                    file1_df = self.try_multiple_engines(file1_path, sheets[0])
+                self.log_message(f"File 1 header loaded successfully: {file1_df.shape[1]} columns")
+            except Exception as e:
+                self.log_message(f"Error loading File 1: {str(e)}")
+                raise Exception(f"Error loading File 1: {str(e)}")
+            
+            if self.cancel_event.is_set():
+                self.log_message(f"Pair #{pair_config['id']+1}: Loading cancelled")
+                return
+                
+            try:
+                self.log_message(f"Loading File 2: {file2_path}")
+                with timer.span('preview_file2'):
+                    file2_df = self.try_multiple_engines(file2_path, sheets[1])
+                self.log_message(f"File 2 header loaded successfully: {file2_df.shape[1]} columns")
+            except Exception as e:
+                self.log_message(f"Error loading File 2: {str(e)}")
+                raise Exception(f"Error loading File 2: {str(e)}")
+            
+            self.log_message(timer.summary())
+            self.call_in_ui(self.show_loaded_files, pair_config, file1_path, file1_df, file2_df)
+            
+        except Exception as e:
+            self.call_in_ui(self.report_load_error, pair_config, e, traceback.format_exc())
+    
+    def report_load_error(self, pair_config, error, error_details):
+        self.log_message(f"Error loading files for Pair #{pair_config['id']+1}: {str(error)}")
+        self.log_message(error_details)
+        messagebox.showerror("Error", f"Error loading files for Pair #{pair_config['id']+1}: {str(error)}")
+    
+    def show_loaded_files(self, pair_config, file1_path, file1_df, file2_df):
+        # Runs on the Tk thread once the worker has parsed both files
+        if not any(pair is pair_config for pair in self.file_pairs):
+            # The pair was removed while its files were loading
+            return
+        
+        pair_config['file1_preview'] = file1_df
+        pair_config['file2_preview'] = file2_df
+        
+        try:
+            # Show the column selection areas
+            pair_config['columns_frame'].pack(fill='x', padx=5, pady=5)
+            
+            # Update dropdowns with column headers
+            file1_columns = list(file1_df.columns)
+            file2_columns = list(file2_df.columns)
+            
+            # Log column data types to identify potential issues (inferred from the sample)
+            self.log_message("File 1 column types:")
+            for col in file1_columns:
+                dtype = file1_df[col].dtype
+                self.log_message(f"  - {col}: {dtype}")
+                
+            self.log_message("File 2 column types:")
+            for col in file2_columns:
+                dtype = file2_df[col].dtype
+                self.log_message(f"  - {col}: {dtype}")
+            
+            pair_config['dropdown_widgets']['file1_key']['values'] = file1_columns
+            pair_config['dropdown_widgets']['file2_key']['values'] = file2_columns
+            
+            # Try to auto-select columns with "name" or "id" in them
+            for col in file1_columns:
+                col_lower = str(col).lower()
+                if any(key in col_lower for key in ['name', 'id', '姓名', '名字', '学号', '身份']):
+                    pair_config['file1_key_column'].set(col)
+                    break
+            
+            for col in file2_columns:
+                col_lower = str(col).lower()
+                if any(key in col_lower for key in ['name', 'id', '姓名', '名字', '学号', '身份']):
+                    pair_config['file2_key_column'].set(col)
+                    break
+            
+            # Setup output column selection
+            # All potential output columns, built from the names alone
+            all_columns = [f"{col}_file1" for col in file1_columns] + [f"{col}_file2" for col in file2_columns]
+            pair_config['column_picker'].set_columns(all_columns)
+            
+            # Show the output column selection frame
+            pair_config['output_columns_frame'].pack(fill='x', padx=5, pady=5)
+            
+            # Suggest output file name based on input files
+            if not pair_config['output_file_path'].get():
+                pair_config['output_file_path'].set(merge_engine.default_output_path(file1_path))
+            
+            # Update status
+            pair_config['status'] = 'Files loaded'
+            pair_config['status_label'].configure(text=pair_config['status'], foreground='green')
+            
+            self.log_message(f"Pair #{pair_config['id']+1}: Files loaded successfully")
+            
+        except Exception as e:
+            self.report_load_error(pair_config, e, traceback.format_exc())
+    
+    def check_keys(self, pair_config):
+        if pair_config['file1_preview'] is None or pair_config['file2_preview'] is None:
+            messagebox.showerror("Error", f"Please load the files for Pair #{pair_config['id']+1} first")
+            return
+        
+        job = self.build_job(pair_config)
+        self.run_in_background(
+            lambda: self.read_key_stats(pair_config, job),
+            f"Checking keys for Pair #{pair_config['id']+1}..."
+        )
+    
+    def read_key_stats(self, pair_config, job):
+        # Runs on the worker thread: only the two key columns are parsed
+        label = f"Pair #{pair_config['id']+1}"
+        try:
+            stats = key_stats.profile_files(job, self.log_message)
+        except Exception as e:
+            self.log_message(f"{label}: Could not check keys - {str(e)}")
+            self.call_in_ui(self.show_key_stats, pair_config, f"Could not check keys: {str(e)}", 'red')
+            return
+        
+        lines = key_stats.describe(stats)
+        for line in lines:
+            self.log_message(f"{label}: {line}")
+        max_rows = job.get('max_output_rows')
+        color = 'red' if max_rows and stats['rows'] > max_rows else 'green'
+        self.call_in_ui(self.show_key_stats, pair_config, "\n".join(lines), color)
+    
+    def show_key_stats(self, pair_config, text, color):
+        # The pair may have been removed while its keys were being read
+        if any(pair is pair_config for pair in self.file_pairs):
+            pair_config['key_stats_label'].configure(text=text, foreground=color)
+            self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+    
+    def process_all_pairs(self):
+        if not self.file_pairs:
+            messagebox.showinfo("No Pairs", "No file pairs to process")
+            return
+            
+        total_pairs = len(self.file_pairs)
+        skipped_pairs = 0
+        
+        jobs = []
+        pairs_by_id = {}
+        for pair in self.file_pairs:
+            # Skip if files not loaded
+            if pair['file1_preview'] is None or pair['file2_preview'] is None:
+                self.log_message(f"Pair #{pair['id']+1}: Skipped - Files not loaded")
+                pair['status'] = 'Skipped - Files not loaded'
+                pair['status_label'].configure(text=pair['status'], foreground='orange')
+                skipped_pairs += 1
+                continue
+            
+            # Tk variables are read here on the main thread, never by the worker
+            jobs.append(self.build_job(pair))
+            pairs_by_id[pair['id']] = pair
+        
+        try:
+            workers = self.workers_var.get()
+        except tk.TclError:
+            workers = 1
+        
+        self.run_in_background(
+            lambda: self.run_pairs(jobs, pairs_by_id, workers, total_pairs, skipped_pairs),
+            f"Starting to process {total_pairs} file pairs...",
+            total=len(jobs)
+        )
+    
+    def run_pairs(self, jobs, pairs_by_id, workers, total_pairs, skipped_pairs):
+        # Runs on the worker thread: no Tk calls here except through the queue
+        successful_pairs = 0
+        failed_pairs = skipped_pairs
+        
+        # The merge itself is shared with the command-line tool; with more than
+        # one worker the pairs run in separate processes and report back as
+        # each one finishes
+        if workers > 1 and len(jobs) > 1:
+            self.log_message(f"Processing {len(jobs)} pairs with {workers} workers...")
+        
+        finished_ids = set()
+        timings = []
+        for result in merge_engine.iter_results(jobs, self.log_message, workers, self.cancel_event):
+            finished_ids.add(result['id'])
+            timings.append(result['timings'])
+            pair = pairs_by_id[result['id']]
+            if result.get('key_stats'):
+                self.call_in_ui(self.show_key_stats, pair, "\n".join(key_stats.describe(result['key_stats'])), 'green')
+            if result['success']:
+                self.call_in_ui(self.set_pair_status, pair, result['status'], 'green')
+                successful_pairs += 1
+            else:
+                self.call_in_ui(self.set_pair_status, pair, result['status'], 'red')
+                failed_pairs += 1
+            self.call_in_ui(self.progress_bar.step, 1)
+        
+        cancelled_pairs = 0
+        for job in jobs:
+            if job['id'] not in finished_ids:
+                self.call_in_ui(self.set_pair_status, pairs_by_id[job['id']], 'Cancelled', 'orange')
+                cancelled_pairs += 1
+        
+        # Show summary
+        self.log_message("\nProcessing Summary:")
+        self.log_message(f"Total pairs: {total_pairs}")
+        self.log_message(f"Successfully processed: {successful_pairs}")
+        self.log_message(f"Failed: {failed_pairs}")
+        if cancelled_pairs:
+            self.log_message(f"Cancelled: {cancelled_pairs}")
+        totals = instrumentation.stage_totals(timings)
+        if totals:
+            self.log_message(totals)
+            self.log_message(f"Stage records appended to {instrumentation.DEFAULT_METRICS_LOG}")
+        
+        summary = f"Processing complete.\nSuccessful: {successful_pairs}\nFailed: {failed_pairs}"
+        if cancelled_pairs:
+            summary += f"\nCancelled: {cancelled_pairs}"
+        self.call_in_ui(messagebox.showinfo, "Processing Complete", summary)
+    
+    def set_pair_status(self, pair, status, color):
+        pair['status'] = status
+        # The pair may have been removed while it was being processed
+        if any(p is pair for p in self.file_pairs):
+            pair['status_label'].configure(text=status, foreground=color)
+    
+    def build_job(self, pair):
+        # Snapshot the Tk variables into a plain job dictionary for the merge engine
+        return {
+            'id': pair['id'],
+            'file1_path': pair['file1_path'].get(),
+            'file2_path': pair['file2_path'].get(),
+            'file1_key_column': pair['file1_key_column'].get(),
+            'file2_key_column': pair['file2_key_column'].get(),
+            'file1_sheets': pair['file1_sheets'].get().strip() or None,
+            'file2_sheets': pair['file2_sheets'].get().strip() or None,
+            'selected_columns': list(pair['selected_columns']),
+            'output_file_path': pair['output_file_path'].get(),
+            'streaming_writer': self.streaming_var.get(),
+            'key_rules': 'all' if self.normalize_keys_var.get() else [],
+            'skip_unchanged': self.skip_unchanged_var.get(),
+            'incremental': self.incremental_var.get(),
+            'sorted_keys': 'auto' if self.sorted_keys_var.get() else False,
+            # An invalid threshold fails the pair with parse_threshold's message
+            'fuzzy_keys': (self.fuzzy_threshold_var.get().strip() or True) if self.fuzzy_keys_var.get() else False,
+            'fuzzy_columns': self.fuzzy_keys_var.get(),
+            'arrow': self.arrow_var.get(),
+            # Stage timings always go to the metrics log; profiling is opt-in
+            'metrics_log': instrumentation.DEFAULT_METRICS_LOG,
+            'profile': 'cprofile' if self.profile_var.get() else None,
+            'profile_dir': instrumentation.DEFAULT_PROFILE_DIR,
+            'max_output_rows': self.max_output_rows(pair['output_file_path'].get()),
+            'explosion_action': 'dedupe' if self.dedupe_var.get() else 'abort',
+        }
+    
+    def max_output_rows(self, output_path):
+        # 0 or an unreadable entry means no limit; a blank one only stops
+        # .xlsx outputs the sheet could not hold
+        text = self.max_rows_var.get().strip()
+        if not text:
+            if excel_io.output_format(output_path) == 'xlsx':
+                return key_stats.DEFAULT_MAX_OUTPUT_ROWS
+            return None
+        try:
+            return max(int(text), 0) or None
+        except ValueError:
+            return None
+    
+    def run_in_background(self, task, description, total=None):
+        """Run task on a worker thread; progress and results come back through ui_queue"""
+        if self.worker_thread is not None and self.worker_thread.is_alive():
+            messagebox.showinfo("Busy", "Please wait for the current task to finish or cancel it")
+            return False
+        
+        self.cancel_event.clear()
+        self.cancel_button.configure(state='normal')
+        if total:
+            self.progress_bar.configure(mode='determinate', maximum=total, value=0)
+        else:
+            # Loading has no meaningful step count
+            self.progress_bar.configure(mode='indeterminate', value=0)
+            self.progress_bar.start(10)
+        self.log_message(description)
+        
+        def runner():
+            try:
+                task()
+            except Exception as e:
+                self.log_message(f"Unexpected error: {str(e)}")
+                self.log_message(traceback.format_exc())
+            finally:
+                self.ui_queue.put(('done', None))
+        
+        self.worker_thread = threading.Thread(target=runner, daemon=True)
+        self.worker_thread.start()
+        return True
+    
+    def cancel_task(self):
+        # Pairs already running finish; pairs not yet started are skipped
+        self.cancel_event.set()
+        self.cancel_button.configure(state='disabled')
+        self.log_message("Cancelling after the pairs currently in progress...")
+    
+    def finish_task(self):
+        self.progress_bar.stop()
+        if str(self.progress_bar.cget('mode')) == 'indeterminate':
+            self.progress_bar.configure(mode='determinate', value=0)
+        self.cancel_button.configure(state='disabled')
+    
+    def call_in_ui(self, func, *args):
+        # Schedule func(*args) on the Tk main thread
+        self.ui_queue.put(('call', (func, args)))
+    
+    def poll_queue(self):
+        # Drain everything queued since the last poll and write the log lines
+        # to the Results pane in one insert instead of one redraw per message
+        lines = []
+        try:
+            while True:
+                kind, payload = self.ui_queue.get_nowait()
+                if kind == 'log':
+                    lines.append(payload)
+                    continue
+                
+                # Flush pending log lines first so messages stay in order
+                if lines:
+                    self.append_log(lines)
+                    lines = []
+                if kind == 'call':
+                    func, args = payload
+                    func(*args)
+                elif kind == 'done':
+                    self.finish_task()
+        except queue.Empty:
+            pass
+        except Exception as e:
+            lines.append(f"UI update error: {str(e)}")
+        finally:
+            if lines:
+                self.append_log(lines)
+            self.root.after(100, self.poll_queue)
+    
+    def append_log(self, lines):
+        self.results_text.configure(state='normal')
+        self.results_text.insert(tk.END, "\n".join(lines) + "\n")
+        self.results_text.see(tk.END)
+        self.results_text.configure(state='disabled')
+    
+    def log_message(self, message):
+        # Safe to call from any thread; poll_queue writes it to the Results pane
+        self.ui_queue.put(('log', str(message)))
+
+def main():
+    multiprocessing.freeze_support()
+    root = tk.Tk()
+    app = BatchMarksheetMergeApp(root)
+    root.mainloop()
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
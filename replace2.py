@@ -1,129 +1,314 @@
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-import pandas as pd
-import os
-
-class ReplacementApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Excel Replacement Tool")
-        self.root.geometry("600x400")
-        
-        # File Path Selection
-        self.frame_file = ttk.LabelFrame(root, text="Excel File Selection", padding="5")
-        self.frame_file.pack(fill="x", padx=5, pady=5)
-        
-        self.path_var = tk.StringVar()
-        self.path_entry = ttk.Entry(self.frame_file, textvariable=self.path_var, width=50)
-        self.path_entry.pack(side="left", padx=5)
-        
-        self.browse_btn = ttk.Button(self.frame_file, text="Browse", command=self.browse_file)
-        self.browse_btn.pack(side="left", padx=5)
-        
-        # Sheet Selection
-        self.frame_sheet = ttk.LabelFrame(root, text="Sheet Selection", padding="5")
-        self.frame_sheet.pack(fill="x", padx=5, pady=5)
-        
-        self.sheet_var = tk.StringVar()
-        self.sheet_combo = ttk.Combobox(self.frame_sheet, textvariable=self.sheet_var, state="readonly")
-        self.sheet_combo.pack(fill="x", padx=5)
-        
-        # Range Input
-        self.frame_range = ttk.LabelFrame(root, text="Range Selection (e.g., E2:F26)", padding="5")
-        self.frame_range.pack(fill="x", padx=5, pady=5)
-        
-        self.range_var = tk.StringVar()
-        self.range_entry = ttk.Entry(self.frame_range, textvariable=self.range_var)
-        self.range_entry.pack(fill="x", padx=5)
-        
-        # Replacement Rules
-        self.frame_rules = ttk.LabelFrame(root, text="Replacement Rules (format: find1,replace1,find2,replace2,...)", padding="5")
-        self.frame_rules.pack(fill="x", padx=5, pady=5)
-        
-        self.rules_text = tk.Text(self.frame_rules, height=5)
-        self.rules_text.pack(fill="x", padx=5)
-        
-        # Process Button
-        self.process_btn = ttk.Button(root, text="Process Replacements", command=self.process_replacements)
-        self.process_btn.pack(pady=20)
-
-    def browse_file(self):
-        filename = filedialog.askopenfilename(
-            title="Select Excel File",
-            filetypes=[("Excel files", "*.xlsx *.xls")]
-        )
-        if filename:
-            self.path_var.set(filename)
-            self.update_sheet_list(filename)
-
-    def update_sheet_list(self, filename):
-        try:
-            excel_file = pd.ExcelFile(filename)
-            sheet_names = excel_file.sheet_names
-            self.sheet_combo['values'] = sheet_names
-            if sheet_names:
-                self.sheet_combo.set(sheet_names[0])
-        except Exception as e:
-            messagebox.showerror("Error", f"Error reading Excel file: {str(e)}")
-
-    def safe_replace(self, value, replace_dict):
-        if pd.isna(value):
-            return value
-        try:
-            str_value = str(value)
-            for find_str, replace_str in replace_dict.items():
-                str_value = str_value.replace(find_str, replace_str)
-            return str_value
-        except:
-            return value
-
-    def process_replacements(self):
-        try:
-            # Get input values
-            file_path = self.path_var.get()
-            sheet_name = self.sheet_var.get()
-            cell_range = self.range_var.get()
-            rules_text = self.rules_text.get("1.0", "end-1c")
-
-            if not all([file_path, sheet_name, cell_range, rules_text]):
-                messagebox.showerror("Error", "Please fill in all fields")
-                return
-
-            # Parse replacement rules
-            rules = rules_text.strip().split(',')
-            if len(rules) % 2 != 0:
-                messagebox.showerror("Error", "Invalid replacement rules format")
-                return
-
-            # Create replacement dictionary
-            replace_dict = {rules[i]: rules[i+1] for i in range(0, len(rules), 2)}
-
-            # Read all sheets from the Excel file
-            excel_file = pd.ExcelFile(file_path)
-            all_sheets = {}
-            for sheet in excel_file.sheet_names:
-                all_sheets[sheet] = pd.read_excel(file_path, sheet_name=sheet)
-
-            # Modify only the selected sheet
-            df = all_sheets[sheet_name]
-            
-            # Apply replacements only to string columns
-            for column in df.columns:
-                df[column] = df[column].apply(lambda x: self.safe_replace(x, replace_dict))
-
-            all_sheets[sheet_name] = df
-
-            # Save all sheets back to the original file
-            with pd.ExcelWriter(file_path, mode='w') as writer:
-                for sheet, data in all_sheets.items():
-                    data.to_excel(writer, sheet_name=sheet, index=False)
-
-            messagebox.showinfo("Success", "Replacements completed and saved to the original file!")
-
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred: {str(e)}")
-
-if __name__ == "__main__":
-    root = tk.Tk()
-    app = ReplacementApp(root)
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox, scrolledtext
+import os
+import multiprocessing
+import queue
+import threading
+import traceback
+
+import excel_io
+import instrumentation
+import replace_engine
+
+class ReplacementApp:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("Excel Replacement Tool")
+        self.root.geometry("600x400")
+        
+        # File Path Selection
+        self.frame_file = ttk.LabelFrame(root, text="Excel File Selection", padding="5")
+        self.frame_file.pack(fill="x", padx=5, pady=5)
+        
+        self.path_var = tk.StringVar()
+        self.path_entry = ttk.Entry(self.frame_file, textvariable=self.path_var, width=50)
+        self.path_entry.pack(side="left", padx=5)
+        
+        self.browse_btn = ttk.Button(self.frame_file, text="Browse", command=self.browse_file)
+        self.browse_btn.pack(side="left", padx=5)
+        
+        # Sheet Selection
+        self.frame_sheet = ttk.LabelFrame(root, text="Sheet Selection", padding="5")
+        self.frame_sheet.pack(fill="x", padx=5, pady=5)
+        
+        self.sheet_var = tk.StringVar()
+        self.sheet_combo = ttk.Combobox(self.frame_sheet, textvariable=self.sheet_var, state="readonly")
+        self.sheet_combo.pack(fill="x", padx=5)
+        
+        # Range Input
+        self.frame_range = ttk.LabelFrame(root, text="Range Selection (e.g., E2:F26; leave blank for the whole sheet)", padding="5")
+        self.frame_range.pack(fill="x", padx=5, pady=5)
+        
+        self.range_var = tk.StringVar()
+        self.range_entry = ttk.Entry(self.frame_range, textvariable=self.range_var)
+        self.range_entry.pack(fill="x", padx=5)
+
+        # In-place editing keeps formatting, formulas and the other sheets intact
+        self.in_place_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(self.frame_range, text="Edit cells in place (keeps formatting; .xlsx/.xlsm only)",
+                        variable=self.in_place_var).pack(anchor="w", padx=5)
+        # Rewritten sheets can be replaced as Arrow columns instead of Python strings
+        self.arrow_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.frame_range, text="Arrow mode when rewriting (faster on large text sheets)",
+                        variable=self.arrow_var,
+                        state="normal" if excel_io.arrow_available() else "disabled").pack(anchor="w", padx=5)
+        
+        # Replacement Rules
+        self.frame_rules = ttk.LabelFrame(root, text="Replacement Rules (format: find1,replace1,find2,replace2,...)", padding="5")
+        self.frame_rules.pack(fill="x", padx=5, pady=5)
+        
+        self.rules_text = tk.Text(self.frame_rules, height=5)
+        self.rules_text.pack(fill="x", padx=5)
+        
+        # Process Button
+        self.process_btn = ttk.Button(root, text="Process Replacements", command=self.process_replacements)
+        self.process_btn.pack(pady=(20, 5))
+        
+        # Same rules over a whole folder of workbooks
+        self.batch_btn = ttk.Button(root, text="Batch Replace...", command=self.open_batch_window)
+        self.batch_btn.pack()
+
+    def open_batch_window(self):
+        BatchReplaceWindow(self.root, self.rules_text.get("1.0", "end-1c"), self.range_var.get())
+
+    def browse_file(self):
+        filename = filedialog.askopenfilename(
+            title="Select Excel File",
+            filetypes=[("Excel files", "*.xlsx *.xls")]
+        )
+        if filename:
+            self.path_var.set(filename)
+            self.update_sheet_list(filename)
+
+    def update_sheet_list(self, filename):
+        try:
+            # Read from the workbook manifest; no cell data is parsed
+            sheet_names = excel_io.list_sheet_names(filename)
+            self.sheet_combo['values'] = sheet_names
+            if sheet_names:
+                self.sheet_combo.set(sheet_names[0])
+        except Exception as e:
+            messagebox.showerror("Error", f"Error reading Excel file: {str(e)}")
+
+    def process_replacements(self):
+        try:
+            # Get input values
+            file_path = self.path_var.get()
+            sheet_name = self.sheet_var.get()
+            cell_range = self.range_var.get()
+            rules_text = self.rules_text.get("1.0", "end-1c")
+
+            # The range is optional: blank means the whole sheet
+            if not all([file_path, sheet_name, rules_text]):
+                messagebox.showerror("Error", "Please fill in all fields")
+                return
+
+            try:
+                replace_engine.range_bounds(cell_range)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+
+            # Parse replacement rules into a replacement dictionary
+            try:
+                replace_dict = replace_engine.parse_rules(rules_text)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+
+            # Compile all rules once for the whole sheet
+            rules = replace_engine.ReplacementRules(replace_dict)
+
+            # xlsx/xlsm are edited in place; other files are rewritten through pandas
+            timer = instrumentation.StageTimer(file_path, instrumentation.DEFAULT_METRICS_LOG)
+            changed = replace_engine.replace_in_workbook(file_path, sheet_name, cell_range, rules,
+                                                         in_place=self.in_place_var.get(), timer=timer,
+                                                         arrow=self.arrow_var.get())
+
+            if changed:
+                messagebox.showinfo("Success", f"Replaced text in {changed} cells and saved to the original file!\n\n"
+                                               f"{timer.summary()}")
+            else:
+                messagebox.showinfo("Success", "No cells matched the replacement rules; the file was not changed.\n\n"
+                                               f"{timer.summary()}")
+
+        except Exception as e:
+            messagebox.showerror("Error", f"An error occurred: {str(e)}")
+
+class BatchReplaceWindow:
+    """Apply one rule set to every workbook in a folder or glob, in parallel"""
+
+    def __init__(self, parent, rules_text, cell_range):
+        self.window = tk.Toplevel(parent)
+        self.window.title("Batch Replacement")
+        self.window.geometry("700x550")
+
+        # The batch runs on a worker thread and reports back through this queue
+        self.ui_queue = queue.Queue()
+        self.worker_thread = None
+        self.cancel_event = threading.Event()
+
+        form = ttk.Frame(self.window, padding=10)
+        form.pack(fill="x")
+        form.columnconfigure(1, weight=1)
+
+        self.source_var = tk.StringVar()
+        self.sheets_var = tk.StringVar(value="*")
+        self.range_var = tk.StringVar(value=cell_range)
+        self.rules_file_var = tk.StringVar()
+        self.report_var = tk.StringVar()
+
+        ttk.Label(form, text="Folder or glob:").grid(row=0, column=0, sticky="w")
+        ttk.Entry(form, textvariable=self.source_var).grid(row=0, column=1, sticky="ew", padx=5)
+        ttk.Button(form, text="Browse", command=self.browse_folder).grid(row=0, column=2)
+
+        ttk.Label(form, text="Sheet pattern:").grid(row=1, column=0, sticky="w")
+        ttk.Entry(form, textvariable=self.sheets_var).grid(row=1, column=1, sticky="ew", padx=5)
+
+        ttk.Label(form, text="Range (blank = whole sheet):").grid(row=2, column=0, sticky="w")
+        ttk.Entry(form, textvariable=self.range_var).grid(row=2, column=1, sticky="ew", padx=5)
+
+        ttk.Label(form, text="Rules file:").grid(row=3, column=0, sticky="w")
+        ttk.Entry(form, textvariable=self.rules_file_var).grid(row=3, column=1, sticky="ew", padx=5)
+        ttk.Button(form, text="Browse", command=self.browse_rules).grid(row=3, column=2)
+
+        ttk.Label(form, text="Rules (if no file):").grid(row=4, column=0, sticky="nw")
+        self.rules_text = tk.Text(form, height=3)
+        self.rules_text.grid(row=4, column=1, sticky="ew", padx=5)
+        self.rules_text.insert("1.0", rules_text)
+
+        ttk.Label(form, text="Report file (optional):").grid(row=5, column=0, sticky="w")
+        ttk.Entry(form, textvariable=self.report_var).grid(row=5, column=1, sticky="ew", padx=5)
+        ttk.Button(form, text="Browse", command=self.browse_report).grid(row=5, column=2)
+
+        controls = ttk.Frame(self.window, padding=(10, 0))
+        controls.pack(fill="x")
+        ttk.Label(controls, text="Workers:").pack(side=tk.LEFT)
+        self.workers_var = tk.IntVar(value=os.cpu_count() or 1)
+        ttk.Spinbox(controls, from_=1, to=os.cpu_count() or 1, textvariable=self.workers_var, width=4).pack(side=tk.LEFT, padx=5)
+        self.in_place_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(controls, text="Edit cells in place", variable=self.in_place_var).pack(side=tk.LEFT, padx=10)
+        self.skip_unchanged_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(controls, text="Skip unchanged", variable=self.skip_unchanged_var).pack(side=tk.LEFT)
+        self.run_button = ttk.Button(controls, text="Run Batch", command=self.run_batch)
+        self.run_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(controls, text="Cancel", command=self.cancel_event.set, state="disabled")
+        self.cancel_button.pack(side=tk.LEFT)
+        self.progress_bar = ttk.Progressbar(controls, mode="determinate", length=150)
+        self.progress_bar.pack(side=tk.RIGHT)
+
+        self.results_text = scrolledtext.ScrolledText(self.window, height=15, state="disabled")
+        self.results_text.pack(fill="both", expand=True, padx=10, pady=10)
+
+        self.window.after(100, self.poll_queue)
+
+    def browse_folder(self):
+        folder = filedialog.askdirectory(parent=self.window, title="Select Folder of Workbooks")
+        if folder:
+            self.source_var.set(folder)
+
+    def browse_rules(self):
+        filename = filedialog.askopenfilename(parent=self.window, title="Select Rules File",
+                                              filetypes=[("Text files", "*.txt *.csv"), ("All files", "*.*")])
+        if filename:
+            self.rules_file_var.set(filename)
+
+    def browse_report(self):
+        filename = filedialog.asksaveasfilename(parent=self.window, title="Save Report As",
+                                                defaultextension=".csv",
+                                                filetypes=[("CSV files", "*.csv"), ("Excel files", "*.xlsx")])
+        if filename:
+            self.report_var.set(filename)
+
+    def run_batch(self):
+        if self.worker_thread is not None and self.worker_thread.is_alive():
+            return
+
+        try:
+            if self.rules_file_var.get():
+                replace_dict = replace_engine.load_rules_file(self.rules_file_var.get())
+            else:
+                replace_dict = replace_engine.parse_rules(self.rules_text.get("1.0", "end-1c"))
+            replace_engine.range_bounds(self.range_var.get())
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", str(e), parent=self.window)
+            return
+
+        files = replace_engine.expand_inputs(self.source_var.get())
+        if not files:
+            messagebox.showerror("Error", "No workbooks found", parent=self.window)
+            return
+
+        try:
+            workers = self.workers_var.get()
+        except tk.TclError:
+            workers = 1
+
+        # Tk variables are read here on the main thread, never by the worker
+        jobs = replace_engine.build_batch_jobs(files, self.sheets_var.get(), self.range_var.get(),
+                                               self.in_place_var.get(), self.skip_unchanged_var.get(),
+                                               metrics_log=instrumentation.DEFAULT_METRICS_LOG)
+        report_path = self.report_var.get() or None
+
+        self.cancel_event.clear()
+        self.run_button.configure(state="disabled")
+        self.cancel_button.configure(state="normal")
+        self.progress_bar.configure(maximum=len(jobs), value=0)
+
+        def runner():
+            try:
+                summary = replace_engine.run_replace_batch(
+                    jobs, replace_dict, log=self.log_message, workers=workers, report_path=report_path,
+                    on_result=lambda result: self.ui_queue.put(('step', None)),
+                    cancel_event=self.cancel_event)
+                self.ui_queue.put(('done', summary))
+            except Exception as e:
+                self.log_message(f"Unexpected error: {str(e)}")
+                self.log_message(traceback.format_exc())
+                self.ui_queue.put(('done', None))
+
+        self.worker_thread = threading.Thread(target=runner, daemon=True)
+        self.worker_thread.start()
+
+    def log_message(self, message):
+        self.ui_queue.put(('log', str(message)))
+
+    def poll_queue(self):
+        lines = []
+        summary = None
+        finished = False
+        try:
+            while True:
+                kind, payload = self.ui_queue.get_nowait()
+                if kind == 'log':
+                    lines.append(payload)
+                elif kind == 'step':
+                    self.progress_bar.step(1)
+                elif kind == 'done':
+                    finished = True
+                    summary = payload
+        except queue.Empty:
+            pass
+
+        if lines:
+            self.results_text.configure(state="normal")
+            self.results_text.insert(tk.END, "\n".join(lines) + "\n")
+            self.results_text.see(tk.END)
+            self.results_text.configure(state="disabled")
+
+        if finished:
+            self.run_button.configure(state="normal")
+            self.cancel_button.configure(state="disabled")
+            if summary is not None:
+                messagebox.showinfo("Batch Complete",
+                                    f"Successful: {summary['successful']}\nFailed: {summary['failed']}\n"
+                                    f"Cells changed: {summary['cells_changed']}", parent=self.window)
+
+        if self.window.winfo_exists():
+            self.window.after(100, self.poll_queue)
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    root = tk.Tk()
+    app = ReplacementApp(root)
     root.mainloop()
\ No newline at end of file
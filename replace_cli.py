@@ -0,0 +1,80 @@
+import argparse
+import multiprocessing
+import sys
+import warnings
+
+import replace_engine
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Apply one set of find/replace rules to many workbooks without the GUI."
+    )
+    parser.add_argument("source", help="Folder of workbooks, a glob pattern such as 'grades/**/*.xlsx', or one file")
+    rules = parser.add_mutually_exclusive_group(required=True)
+    rules.add_argument("-r", "--rules-file", help="Text file of rules: find1,replace1,find2,replace2,...")
+    rules.add_argument("--rules", help="Rules given inline in the same format")
+    parser.add_argument("-s", "--sheets", default="*",
+                        help="Sheet name pattern, e.g. 'Term*' (default: every sheet)")
+    parser.add_argument("--range", default="", dest="cell_range",
+                        help="Cell range such as E2:F26 (default: the whole sheet below the header)")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="Number of workbooks to process in parallel (0 = one per CPU core)")
+    parser.add_argument("--rewrite", action="store_true",
+                        help="Rewrite sheets through pandas instead of editing xlsx cells in place")
+    parser.add_argument("--arrow", action="store_true",
+                        help="Replace rewritten sheets as Arrow-backed columns (needs pyarrow)")
+    parser.add_argument("--skip-unchanged", action="store_true",
+                        help="Skip workbooks left unchanged since a previous run with the same settings")
+    parser.add_argument("--state-dir", help="Folder for --skip-unchanged run records "
+                                            "(default: ~/.cache/marksheet_merge/runs)")
+    parser.add_argument("--metrics-log", help="Append per-stage timing and memory records to this JSON lines file")
+    parser.add_argument("--report", help="Save a per-file report to this .csv or .xlsx file")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="Only print the summary and the failed files")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    # Same behaviour as the GUI: keep pandas/openpyxl warnings out of the log
+    warnings.filterwarnings("ignore")
+
+    try:
+        if args.rules_file:
+            replace_dict = replace_engine.load_rules_file(args.rules_file)
+        else:
+            replace_dict = replace_engine.parse_rules(args.rules)
+        replace_engine.range_bounds(args.cell_range)
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 2
+
+    files = replace_engine.expand_inputs(args.source)
+    if not files:
+        print(f"Error: no workbooks found for {args.source}", file=sys.stderr)
+        return 2
+
+    jobs = replace_engine.build_batch_jobs(files, args.sheets, args.cell_range, in_place=not args.rewrite,
+                                           skip_unchanged=args.skip_unchanged, state_dir=args.state_dir,
+                                           metrics_log=args.metrics_log, arrow=args.arrow)
+    log = (lambda message: None) if args.quiet else print
+    summary = replace_engine.run_replace_batch(jobs, replace_dict, log=log, workers=args.workers,
+                                               report_path=args.report)
+
+    if args.quiet:
+        print(f"Total workbooks: {summary['total']}")
+        print(f"Successfully processed: {summary['successful']}")
+        print(f"Failed: {summary['failed']}")
+        print(f"Cells changed: {summary['cells_changed']}")
+        for result in summary['results']:
+            if not result['success']:
+                print(f"  {replace_engine.format_result(result)}")
+
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,576 @@
+import os
+import re
+import glob
+import fnmatch
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+
+import excel_io
+import instrumentation
+import merge_engine
+import run_manifest
+
+
+def parse_rules(rules_text):
+    """Parse "find1,replace1,find2,replace2,..." into an ordered dictionary.
+
+    Raises ValueError when the items do not come in pairs.
+    """
+    rules = rules_text.strip().split(',')
+    if len(rules) % 2 != 0:
+        raise ValueError("Invalid replacement rules format")
+    return {rules[i]: rules[i+1] for i in range(0, len(rules), 2)}
+
+
+def safe_replace(value, replace_dict):
+    """Apply every rule in order to one cell value; blanks are left alone"""
+    if pd.isna(value):
+        return value
+    try:
+        str_value = str(value)
+        for find_str, replace_str in replace_dict.items():
+            str_value = str_value.replace(find_str, replace_str)
+        return str_value
+    except:
+        return value
+
+
+def _trie_pattern(words):
+    """Regex matching any of ``words``, factored as a prefix trie.
+
+    A plain alternation tries every word at every position; the trie form
+    only follows branches that match the text so far, which keeps large
+    rule sets fast.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        end = node.get('') is True
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char != '']
+        if not branches:
+            return ''
+        if len(branches) == 1 and not end:
+            return branches[0]
+        body = '(?:' + '|'.join(branches) + ')'
+        return body + '?' if end else body
+
+    return build(trie)
+
+
+def _overlaps(a, b):
+    # True when an occurrence of a and one of b can share characters in a
+    # text: one contains the other, or a suffix of one is a prefix of the other
+    if a in b or b in a:
+        return True
+    for size in range(1, min(len(a), len(b))):
+        if a[-size:] == b[:size] or b[-size:] == a[:size]:
+            return True
+    return False
+
+
+def single_pass_safe(replace_dict):
+    """Whether one simultaneous pass gives the same result as applying the rules in order.
+
+    Sequential replacement differs from a single pass when a rule's output
+    (or the gap left by an empty replacement) can form a later rule's find
+    text, or when two find strings can overlap in the text.
+    """
+    items = list(replace_dict.items())
+    finds = [find for find, _ in items]
+    if any(find == '' for find in finds):
+        return False
+    for i, (find, replacement) in enumerate(items):
+        later = finds[i+1:]
+        if later and replacement == '':
+            return False
+        if any(_overlaps(replacement, other) for other in later):
+            return False
+        if any(_overlaps(find, other) for other in later):
+            return False
+    return True
+
+
+def is_arrow_text(dtype):
+    """Whether a column holds text in Arrow memory (string[pyarrow], pandas' str, ArrowDtype strings)"""
+    if isinstance(dtype, pd.StringDtype):
+        return dtype.storage == 'pyarrow'
+    return isinstance(dtype, pd.ArrowDtype) and pd.api.types.is_string_dtype(dtype)
+
+
+class ReplacementRules:
+    """Find/replace rules compiled once and applied to whole columns.
+
+    When :func:`single_pass_safe` holds, all rules are compiled into one
+    trie-shaped regex and each cell is scanned once; otherwise each rule is
+    applied as one vectorized ``str.replace`` pass, in order. Both produce
+    exactly what :func:`safe_replace` produces cell by cell. Arrow-backed
+    text columns are replaced rule by rule with Arrow's ``replace_substring``
+    kernel instead, which gives the same result (the trie is only used when
+    the order of the rules cannot matter) and keeps the column in Arrow.
+    """
+
+    def __init__(self, replace_dict):
+        self.replace_dict = dict(replace_dict)
+        self.pattern = None
+        if self.replace_dict and single_pass_safe(self.replace_dict):
+            self.pattern = re.compile(_trie_pattern(self.replace_dict))
+
+    def _substitute(self, match):
+        return self.replace_dict[match.group(0)]
+
+    def apply_text(self, text):
+        """Apply the rules to a single string"""
+        if self.pattern is not None:
+            return self.pattern.sub(self._substitute, text)
+        for find_str, replace_str in self.replace_dict.items():
+            text = text.replace(find_str, replace_str)
+        return text
+
+    def apply_series(self, series):
+        """Apply the rules to one column, leaving numeric and date columns untouched.
+
+        Text (object or string) columns have every non-blank value converted
+        to text and replaced, as :func:`safe_replace` does.
+        """
+        if not (pd.api.types.is_object_dtype(series.dtype) or pd.api.types.is_string_dtype(series.dtype)):
+            return series
+        if is_arrow_text(series.dtype):
+            return self.apply_arrow(series)
+
+        mask = series.notna()
+        if not mask.any():
+            return series
+        text = series[mask].astype(str)
+        if self.pattern is not None:
+            text = text.str.replace(self.pattern, self._substitute, regex=True)
+        else:
+            for find_str, replace_str in self.replace_dict.items():
+                text = text.str.replace(find_str, replace_str, regex=False)
+
+        result = series.astype(object)
+        result[mask] = text.astype(object)
+        return result
+
+    def apply_arrow(self, series):
+        """Apply the rules to an Arrow-backed text column, keeping its dtype"""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        text = pa.array(series.array)
+        for find_str, replace_str in self.replace_dict.items():
+            if find_str == '':
+                # replace_substring never returns for an empty pattern; str.replace
+                # puts the replacement between every character, as safe_replace does
+                text = pa.array([None if value is None else value.replace('', replace_str)
+                                 for value in text.to_pylist()], type=text.type)
+                continue
+            text = pc.replace_substring(text, find_str, replace_str)
+        return pd.Series(pd.array(text, dtype=series.dtype), index=series.index, name=series.name)
+
+    def apply_frame(self, df):
+        """Return a copy of df with the rules applied to every text column"""
+        return df.apply(self.apply_series)
+
+
+# Workbooks openpyxl can open and save without losing content
+IN_PLACE_EXTENSIONS = ('.xlsx', '.xlsm')
+
+
+def range_bounds(cell_range):
+    """Parse "E2:F26", "E2", "E:F" or "2:5" into 1-based (min_col, min_row, max_col, max_row).
+
+    Open-ended sides (whole columns or rows) are None. A blank range gives
+    all None, meaning the whole sheet.
+    """
+    from openpyxl.utils import range_boundaries
+
+    if not cell_range or not cell_range.strip():
+        return (None, None, None, None)
+    try:
+        return range_boundaries(cell_range.strip().upper().replace('$', ''))
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cell range: {cell_range}")
+
+
+def replace_in_place(file_path, sheet_names, cell_range, rules, timer=None):
+    """Edit only the text cells inside the range of the given sheets, then save.
+
+    The workbook is opened once with openpyxl and only the touched cells
+    change: formatting, formulas and every other sheet are kept as they
+    are. The header row is never changed, even when the range includes
+    row 1, so both paths edit the same cells as :func:`apply_range`;
+    without a range the whole used area below it is processed. Formula and
+    number cells are never modified. Returns the number of cells changed;
+    the file is not saved when nothing changed.
+    """
+    from openpyxl import load_workbook
+
+    keep_vba = file_path.lower().endswith('.xlsm')
+    with instrumentation.span(timer, 'load_workbook'):
+        workbook = load_workbook(file_path, keep_vba=keep_vba)
+    for sheet_name in sheet_names:
+        if sheet_name not in workbook.sheetnames:
+            raise ValueError(f"Sheet '{sheet_name}' not found")
+
+    min_col, min_row, max_col, max_row = range_bounds(cell_range)
+    # Skip the header row, as the DataFrame rewrite does
+    min_row = max(min_row or 2, 2)
+
+    changed = 0
+    with instrumentation.span(timer, 'replace') as span:
+        rows = 0
+        for sheet_name in sheet_names:
+            sheet = workbook[sheet_name]
+            for row in sheet.iter_rows(min_row=min_row, max_row=max_row or sheet.max_row,
+                                       min_col=min_col, max_col=max_col or sheet.max_column):
+                rows += 1
+                for cell in row:
+                    if cell.data_type != 's' or not isinstance(cell.value, str):
+                        continue
+                    new_value = rules.apply_text(cell.value)
+                    if new_value != cell.value:
+                        cell.value = new_value
+                        changed += 1
+        span['rows'] = rows
+
+    if changed:
+        with instrumentation.span(timer, 'save'):
+            with excel_io.atomic_output(file_path) as tmp_path:
+                workbook.save(tmp_path)
+    return changed
+
+
+def apply_range(df, cell_range, rules):
+    """Apply the rules to the part of a sheet's DataFrame covered by a cell range.
+
+    The frame is assumed to start at A1 with a header row, so sheet row 2
+    is the frame's first row; the header row itself is never changed. As in
+    :func:`replace_in_place`, only text cells are replaced: numbers and
+    dates in a column that also holds text are left as they are. Returns
+    the new frame and the number of cells changed.
+    """
+    min_col, min_row, max_col, max_row = range_bounds(cell_range)
+    row_start = max((min_row or 2) - 2, 0)
+    row_stop = (max_row - 1) if max_row else len(df)
+    col_start = (min_col or 1) - 1
+    col_stop = max_col if max_col else len(df.columns)
+
+    df = df.copy()
+    changed = 0
+    for position in range(col_start, min(col_stop, len(df.columns))):
+        column = df.iloc[:, position]
+        part = column.iloc[row_start:row_stop]
+        if pd.api.types.is_object_dtype(part.dtype):
+            is_text = part.map(lambda value: isinstance(value, str)).to_numpy(dtype=bool)
+            if not is_text.any():
+                continue
+            new_part = part.copy()
+            new_part.iloc[is_text] = rules.apply_series(part[is_text]).to_numpy()
+        else:
+            new_part = rules.apply_series(part)
+        if new_part is part:
+            continue
+        differs = ~((new_part == part.astype(object)) | (new_part.isna() & part.isna()))
+        changed += int(differs.sum())
+        if len(new_part) == len(column):
+            # The whole column: keep the replaced one (and its Arrow dtype) as is
+            new_column = new_part
+        else:
+            new_column = column.astype(object)
+            new_column.iloc[row_start:row_stop] = new_part.to_numpy()
+        df.isetitem(position, new_column)
+    return df, changed
+
+
+def rewrite_workbook(file_path, sheet_names, cell_range, rules, timer=None, arrow=False):
+    """Replace through pandas and rewrite every sheet of the workbook.
+
+    Used for files openpyxl cannot edit in place. Cell formatting and
+    formulas are not preserved. With ``arrow`` the selected sheets are
+    converted to Arrow-backed columns first, so text is replaced by Arrow
+    kernels (see :class:`ReplacementRules`). Returns the number of cells
+    changed.
+    """
+    # One open handle parses every sheet in a single pass
+    with instrumentation.span(timer, 'read_sheets'):
+        with pd.ExcelFile(file_path) as excel_file:
+            for sheet_name in sheet_names:
+                if sheet_name not in excel_file.sheet_names:
+                    raise ValueError(f"Sheet '{sheet_name}' not found")
+            all_sheets = excel_file.parse(sheet_name=None)
+
+    # Modify only the selected sheets
+    changed = 0
+    with instrumentation.span(timer, 'replace', sum(len(all_sheets[name]) for name in sheet_names)):
+        for sheet_name in sheet_names:
+            data = excel_io.to_arrow_backed(all_sheets[sheet_name]) if arrow else all_sheets[sheet_name]
+            all_sheets[sheet_name], sheet_changed = apply_range(data, cell_range, rules)
+            changed += sheet_changed
+
+    # Save all sheets back to the original file, replacing it only once complete
+    with instrumentation.span(timer, 'write', sum(len(data) for data in all_sheets.values())):
+        with excel_io.atomic_output(file_path) as tmp_path:
+            with pd.ExcelWriter(tmp_path, mode='w') as writer:
+                for sheet, data in all_sheets.items():
+                    data.to_excel(writer, sheet_name=sheet, index=False)
+    return changed
+
+
+def replace_in_workbook(file_path, sheet_names, cell_range, rules, in_place=True, timer=None, arrow=False):
+    """Apply compiled rules to a range of one or more sheets, editing in place when possible.
+
+    ``timer`` (an :class:`instrumentation.StageTimer`) records the load,
+    replace and save stages. ``arrow`` applies to rewritten workbooks only
+    (see :func:`rewrite_workbook`); in-place edits work cell by cell.
+    """
+    if isinstance(sheet_names, str):
+        sheet_names = [sheet_names]
+    if in_place and file_path.lower().endswith(IN_PLACE_EXTENSIONS):
+        return replace_in_place(file_path, sheet_names, cell_range, rules, timer)
+    return rewrite_workbook(file_path, sheet_names, cell_range, rules, timer, arrow)
+
+
+# Files picked up when a batch source is a folder or glob
+BATCH_EXTENSIONS = ('.xlsx', '.xlsm', '.xls')
+
+# Read but not written by pandas (xlwt is gone), so batch jobs skip them
+READ_ONLY_EXTENSIONS = ('.xls',)
+
+
+def expand_inputs(source):
+    """Workbooks named by a folder, a glob pattern (``**`` recurses) or a single path, sorted"""
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source, recursive=True)
+    # "~$book.xlsx" files are Excel's lock files for open workbooks
+    return sorted(path for path in paths
+                  if os.path.isfile(path)
+                  and path.lower().endswith(BATCH_EXTENSIONS)
+                  and not os.path.basename(path).startswith('~$'))
+
+
+def load_rules_file(rules_path):
+    """Read rules from a text file in the usual comma format; line breaks separate items too"""
+    with open(rules_path, encoding='utf-8-sig') as f:
+        lines = [line.rstrip('\r\n') for line in f]
+    return parse_rules(','.join(line for line in lines if line.strip()))
+
+
+def matching_sheets(sheet_names, pattern):
+    """Sheets whose name matches a case-insensitive fnmatch pattern ("*" or blank = all)"""
+    pattern = (pattern or '*').lower()
+    return [name for name in sheet_names if fnmatch.fnmatchcase(name.lower(), pattern)]
+
+
+def build_batch_jobs(files, sheet_pattern='*', cell_range='', in_place=True, skip_unchanged=False, state_dir=None,
+                     metrics_log=None, arrow=False):
+    return [{
+        'id': index,
+        'file_path': file_path,
+        'sheet_pattern': sheet_pattern,
+        'cell_range': cell_range,
+        'in_place': in_place,
+        'skip_unchanged': skip_unchanged,
+        'state_dir': state_dir,
+        'metrics_log': metrics_log,
+        'arrow': arrow,
+    } for index, file_path in enumerate(files)]
+
+
+# Rules compiled once per worker process by _init_worker
+_worker_rules = None
+
+
+def _init_worker(replace_dict):
+    global _worker_rules
+    _worker_rules = ReplacementRules(replace_dict)
+
+
+def replace_file(job, rules=None):
+    """Apply the rules to the matching sheets of one workbook described by a batch job.
+
+    ``rules`` defaults to the set compiled for this worker process. .xls
+    workbooks cannot be saved back and are skipped. With
+    ``skip_unchanged`` a workbook is skipped when it is exactly the file a
+    previous run with the same rules, sheets and range left behind. Never
+    raises; the outcome is reported in the returned result dictionary.
+    """
+    rules = rules if rules is not None else _worker_rules
+    file_path = job['file_path']
+    result = {
+        'id': job['id'],
+        'file_path': file_path,
+        'success': False,
+        'status': 'Not processed',
+        'sheets': [],
+        'changed': 0,
+        'error': None,
+        'timings': [],
+    }
+    if file_path.lower().endswith(READ_ONLY_EXTENSIONS):
+        # Listed in the results rather than failing after the sheets are replaced
+        result['status'] = 'Skipped - Cannot save .xls'
+        result['error'] = "Save the workbook as .xlsx to process it"
+        return result
+
+    timer = instrumentation.StageTimer(file_path, job.get('metrics_log'))
+    result['timings'] = timer.spans
+    try:
+        if job.get('skip_unchanged'):
+            manifest = run_manifest.RunManifest(job.get('state_dir'))
+            config = {
+                'rules': list(rules.replace_dict.items()),
+                'sheet_pattern': job.get('sheet_pattern'),
+                'cell_range': job.get('cell_range'),
+                'in_place': job.get('in_place', True),
+            }
+            if job.get('arrow'):
+                # Only recorded when set, so records from earlier runs stay current
+                config['arrow'] = True
+            record = manifest.is_current(file_path, run_manifest.fingerprint([file_path], config))
+            if record is not None:
+                result['success'] = True
+                result['status'] = 'Skipped - Unchanged'
+                result['sheets'] = record.get('sheets', [])
+                return result
+
+        sheets = matching_sheets(excel_io.list_sheet_names(file_path), job.get('sheet_pattern'))
+        if not sheets:
+            result['status'] = 'Skipped - No matching sheet'
+            result['success'] = True
+            return result
+        result['sheets'] = sheets
+        result['changed'] = replace_in_workbook(file_path, sheets, job.get('cell_range'), rules,
+                                                job.get('in_place', True), timer, job.get('arrow', False))
+        result['success'] = True
+        result['status'] = 'Updated' if result['changed'] else 'No changes'
+
+        if job.get('skip_unchanged'):
+            # The workbook is both input and output: fingerprint its new content
+            manifest.record(file_path, run_manifest.fingerprint([file_path], config), sheets=sheets)
+    except Exception as e:
+        result['status'] = 'Failed'
+        result['error'] = str(e)
+    return result
+
+
+def format_result(result):
+    """One log line describing a batch result"""
+    line = f"{result['status']}: {result['file_path']}"
+    if result['changed']:
+        line += f" ({result['changed']} cells in {', '.join(result['sheets'])})"
+    if result['error']:
+        line += f" - {result['error']}"
+    return line
+
+
+def iter_batch_results(jobs, replace_dict, workers=1, cancel_event=None):
+    """Process batch jobs and yield each result as soon as its file finishes.
+
+    The rules are compiled once, in this process for a single worker or
+    once per worker process otherwise. Setting ``cancel_event`` skips files
+    that have not started yet.
+    """
+    workers = min(merge_engine.resolve_workers(workers), max(len(jobs), 1))
+    cancelled = lambda: cancel_event is not None and cancel_event.is_set()
+
+    if workers == 1:
+        rules = ReplacementRules(replace_dict)
+        for job in jobs:
+            if cancelled():
+                return
+            yield replace_file(job, rules)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(replace_dict,)) as executor:
+        futures = {executor.submit(replace_file, job): job for job in jobs}
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            if cancelled():
+                for pending in futures:
+                    pending.cancel()
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker process itself died (e.g. out of memory)
+                result = {
+                    'id': job['id'],
+                    'file_path': job['file_path'],
+                    'success': False,
+                    'status': 'Failed - Worker error',
+                    'sheets': [],
+                    'changed': 0,
+                    'error': str(e),
+                    'timings': [],
+                }
+            yield result
+
+
+def write_report(results, report_path):
+    """Save one row per file (status, sheets, cells changed, error) as CSV or xlsx"""
+    report = pd.DataFrame([{
+        'File': result['file_path'],
+        'Status': result['status'],
+        'Sheets': ', '.join(result['sheets']),
+        'Cells Changed': result['changed'],
+        'Error': result['error'] or '',
+    } for result in results], columns=['File', 'Status', 'Sheets', 'Cells Changed', 'Error'])
+    excel_io.write_table(report, report_path)
+
+
+def run_replace_batch(jobs, replace_dict, log=print, workers=1, on_result=None, report_path=None, cancel_event=None):
+    """Process every batch job and return a summary dictionary.
+
+    Each file is logged as soon as it finishes. ``report_path`` saves the
+    per-file results as an aggregate report.
+    """
+    total_files = len(jobs)
+    results = []
+
+    log(f"Starting to process {total_files} workbooks...")
+
+    for result in iter_batch_results(jobs, replace_dict, workers, cancel_event):
+        results.append(result)
+        log(format_result(result))
+        if on_result is not None:
+            on_result(result)
+
+    results.sort(key=lambda result: result['id'])
+    successful_files = sum(1 for result in results if result['success'])
+    failed_files = sum(1 for result in results if not result['success'])
+    cancelled_files = total_files - len(results)
+    cells_changed = sum(result['changed'] for result in results)
+
+    # Show summary
+    log("\nReplacement Summary:")
+    log(f"Total workbooks: {total_files}")
+    log(f"Successfully processed: {successful_files}")
+    log(f"Failed: {failed_files}")
+    if cancelled_files:
+        log(f"Cancelled: {cancelled_files}")
+    log(f"Cells changed: {cells_changed}")
+    totals = instrumentation.stage_totals(result['timings'] for result in results)
+    if totals:
+        log(totals)
+
+    if report_path:
+        write_report(results, report_path)
+        log(f"Report saved to {report_path}")
+
+    return {
+        'total': total_files,
+        'successful': successful_files,
+        'failed': failed_files,
+        'cancelled': cancelled_files,
+        'cells_changed': cells_changed,
+        'results': results,
+    }
@@ -0,0 +1,87 @@
+import os
+import json
+import hashlib
+
+import excel_io
+import workbook_cache
+
+# Bump when the fingerprint layout changes so every output is rebuilt once
+RUN_STATE_VERSION = 1
+
+DEFAULT_STATE_DIR = os.path.join(workbook_cache.DEFAULT_CACHE_DIR, 'runs')
+
+HASH_BLOCK_BYTES = 1024 * 1024
+
+# Digests already computed in this process, keyed by path, size and mtime, so
+# a file shared by many pairs of one batch is hashed once
+_digests = {}
+
+
+def file_digest(file_path):
+    """SHA-256 of a file's content, read in blocks"""
+    stat = os.stat(file_path)
+    identity = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    digest = _digests.get(identity)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b''):
+                sha.update(block)
+        digest = _digests[identity] = sha.hexdigest()
+    return digest
+
+
+def fingerprint(input_paths, config):
+    """Describe a run by the content of its inputs and the settings that shape its output"""
+    return {
+        'version': RUN_STATE_VERSION,
+        'inputs': {os.path.abspath(path): file_digest(path) for path in input_paths},
+        'config': hashlib.sha256(json.dumps(config, sort_keys=True, ensure_ascii=False,
+                                            default=str).encode('utf-8')).hexdigest(),
+    }
+
+
+class RunManifest:
+    """Remembers, for each output file, the fingerprint of the run that wrote it.
+
+    Each output gets its own small JSON record in the state folder, so
+    parallel workers never write the same file. A run can be skipped when
+    its fingerprint matches the record and the output is still the file
+    that run left behind.
+    """
+
+    def __init__(self, state_dir=None):
+        self.state_dir = state_dir or DEFAULT_STATE_DIR
+
+    def path_for(self, output_path, extension='.json'):
+        name = hashlib.sha256(os.path.abspath(output_path).encode('utf-8')).hexdigest()
+        return os.path.join(self.state_dir, f"{name}{extension}")
+
+    def is_current(self, output_path, run_fingerprint):
+        """The stored record when output_path is up to date for this fingerprint, else None"""
+        try:
+            with open(self.path_for(output_path), encoding='utf-8') as f:
+                record = json.load(f)
+            stat = os.stat(output_path)
+        except (OSError, ValueError):
+            return None
+
+        # Someone edited or replaced the output since it was written
+        if record.get('output') != {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}:
+            return None
+        if record.get('fingerprint') != run_fingerprint:
+            return None
+        return record
+
+    def record(self, output_path, run_fingerprint, **details):
+        """Store the fingerprint of the run that just wrote output_path"""
+        stat = os.stat(output_path)
+        record = dict(details)
+        record['output_path'] = os.path.abspath(output_path)
+        record['output'] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        record['fingerprint'] = run_fingerprint
+
+        os.makedirs(self.state_dir, exist_ok=True)
+        with excel_io.atomic_output(self.path_for(output_path)) as tmp_path:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+
+import merge_engine
+from merge_engine import MERGE_KEY
+
+
+class UnsortedKeysError(ValueError):
+    """An input expected to be sorted by Merge_Key is not"""
+
+
+def keys_sorted(side):
+    """True when a prepared side's Merge_Key never decreases (string order)"""
+    return side[MERGE_KEY].is_monotonic_increasing
+
+
+def _checked_chunks(chunks, label):
+    # Skip empty chunks and make sure keys keep increasing across chunk borders
+    last_key = None
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        keys = chunk[MERGE_KEY]
+        if not keys.is_monotonic_increasing or (last_key is not None and keys.iloc[0] < last_key):
+            raise UnsortedKeysError(f"{label} is not sorted by its key column")
+        last_key = keys.iloc[-1]
+        yield chunk
+
+
+def merge_sorted_chunks(file1_chunks, file2_chunks, file1_header, file2_header):
+    """Sort-merge join two streams of prepared chunks that are sorted by Merge_Key.
+
+    Yields merged frames in key order. Keys below the smaller of the two
+    last-buffered keys cannot receive more rows from either stream, so they
+    are merged and released as soon as they are complete; only the rows of
+    the current boundary key are carried over. Memory is bounded by one
+    chunk per side (plus the rows of a single key), and the concatenated
+    output equals :func:`merge_engine.merge_sides` on the whole inputs.
+
+    ``file1_header``/``file2_header`` are empty prepared frames giving the
+    columns. Raises :class:`UnsortedKeysError` when a stream goes backwards.
+    """
+    file1_iter = _checked_chunks(file1_chunks, "File 1")
+    file2_iter = _checked_chunks(file2_chunks, "File 2")
+
+    def refill(buffer, chunk_iter):
+        chunk = next(chunk_iter, None)
+        if chunk is None:
+            return buffer, True
+        if buffer.empty:
+            return chunk, False
+        return pd.concat([buffer, chunk], ignore_index=True), False
+
+    file1_buffer, file1_done = refill(file1_header, file1_iter)
+    file2_buffer, file2_done = refill(file2_header, file2_iter)
+
+    while True:
+        open_keys = [buffer[MERGE_KEY].iloc[-1]
+                     for buffer, done in ((file1_buffer, file1_done), (file2_buffer, file2_done)) if not done]
+        if not open_keys:
+            if not (file1_buffer.empty and file2_buffer.empty):
+                yield merge_engine.merge_sides(file1_buffer, file2_buffer)
+            return
+
+        bound = min(open_keys)
+        file1_ready = file1_buffer[MERGE_KEY].searchsorted(bound, side='left')
+        file2_ready = file2_buffer[MERGE_KEY].searchsorted(bound, side='left')
+        if file1_ready or file2_ready:
+            yield merge_engine.merge_sides(file1_buffer.iloc[:file1_ready], file2_buffer.iloc[:file2_ready])
+        file1_buffer = file1_buffer.iloc[file1_ready:]
+        file2_buffer = file2_buffer.iloc[file2_ready:]
+
+        # Read more from the streams whose buffered rows end at the boundary key
+        if not file1_done and file1_buffer[MERGE_KEY].iloc[-1] == bound:
+            file1_buffer, file1_done = refill(file1_buffer, file1_iter)
+        if not file2_done and file2_buffer[MERGE_KEY].iloc[-1] == bound:
+            file2_buffer, file2_done = refill(file2_buffer, file2_iter)
+
+
+def _key_runs(keys):
+    # Start position and length of each run of equal keys in a sorted column
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    changes = np.asarray(keys[1:] != keys[:-1], dtype=bool)
+    starts = np.concatenate([[0], np.flatnonzero(changes) + 1])
+    return starts, np.diff(np.append(starts, len(keys)))
+
+
+def merge_sorted_sides(file1_side, file2_side):
+    """In-memory sort-merge join of two prepared sides already sorted by key.
+
+    No key is hashed: runs of equal keys are found by comparing neighbours,
+    the two sorted lists of distinct keys are interleaved by a stable sort
+    (which merges the two sorted runs), and every output row is given its
+    row positions in each side arithmetically. The columns are then taken
+    by position, missing rows becoming blanks, which gives exactly
+    :func:`merge_engine.merge_sides`.
+    """
+    key_dtype = file1_side[MERGE_KEY].dtype
+    # numpy compares object arrays faster than pandas' wrapper does
+    file1_keys, file2_keys = [side[MERGE_KEY].to_numpy() if side[MERGE_KEY].dtype == object else side[MERGE_KEY].array
+                              for side in (file1_side, file2_side)]
+    file1_starts, file1_counts = _key_runs(file1_keys)
+    file2_starts, file2_counts = _key_runs(file2_keys)
+
+    # Distinct keys of both sides in order; a key present in both is
+    # followed by its File 2 copy
+    distinct = pd.concat([pd.Series(file1_keys.take(file1_starts), dtype=key_dtype),
+                          pd.Series(file2_keys.take(file2_starts), dtype=file2_side[MERGE_KEY].dtype)],
+                         ignore_index=True)
+    distinct = distinct.to_numpy() if distinct.dtype == object else distinct.array
+    order = distinct.argsort(kind='stable')
+    ordered = distinct.take(order)
+    duplicate = np.zeros(len(order), dtype=bool)
+    duplicate[1:] = np.asarray(ordered[1:] == ordered[:-1], dtype=bool)
+
+    # Per output key: its run in each side, or no rows (count 0)
+    n_file1 = len(file1_starts)
+    first = np.flatnonzero(~duplicate)
+    shared = np.zeros(len(first), dtype=bool)
+    shared[:-1] = duplicate[first[:-1] + 1]
+    if len(first):
+        shared[-1] = first[-1] + 1 < len(order)
+    head = order[first]
+    file1_run = np.where(head < n_file1, head, -1)
+    file2_run = np.where(head >= n_file1, head - n_file1, -1)
+    file2_run[shared] = order[first[shared] + 1] - n_file1
+
+    # Run -1 picks an appended empty run
+    file1_starts, file1_counts = np.append(file1_starts, 0), np.append(file1_counts, 0)
+    file2_starts, file2_counts = np.append(file2_starts, 0), np.append(file2_counts, 0)
+    file1_count = file1_counts[file1_run]
+    file2_count = file2_counts[file2_run]
+    # Duplicate keys multiply out, File 1's rows varying slowest
+    width = np.maximum(file2_count, 1)
+    sizes = np.maximum(file1_count, 1) * width
+    key_rows = np.repeat(np.arange(len(first)), sizes)
+    offset = np.arange(len(key_rows)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    file1_rows = np.where(file1_count[key_rows] > 0,
+                          file1_starts[file1_run[key_rows]] + offset // width[key_rows], -1)
+    file2_rows = np.where(file2_count[key_rows] > 0,
+                          file2_starts[file2_run[key_rows]] + offset % width[key_rows], -1)
+
+    def taken(side, rows):
+        # Position -1 is not in the RangeIndex, so it becomes a blank row
+        values = side.drop(columns=MERGE_KEY).reset_index(drop=True)
+        return values.reindex(rows).reset_index(drop=True)
+
+    merged_df = pd.concat([taken(file1_side, file1_rows), taken(file2_side, file2_rows)], axis=1)
+    keys = pd.Series(ordered.take(first[key_rows]), dtype=key_dtype)
+    merged_df.insert(0, MERGE_KEY, keys)
+    return merged_df
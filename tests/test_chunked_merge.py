@@ -0,0 +1,152 @@
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+import chunked_merge
+import excel_io
+import key_stats
+import merge_engine
+import merge_keys
+from merge_engine import MERGE_KEY
+
+
+def quiet(message):
+    pass
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # Several read chunks, so per-chunk type inference differs between chunks
+    monkeypatch.setattr(chunked_merge, 'READ_CHUNK_ROWS', 7)
+
+
+def write_inputs(tmp_path, sort=False, seed=0):
+    rng = np.random.default_rng(seed)
+    file1_df = pd.DataFrame({
+        'ID': rng.integers(1000, 1030, size=40).astype(float),
+        ' Math': rng.integers(0, 100, size=40),
+        'Name': rng.choice(['张三', '李四', 'Ann'], size=40),
+        'Score': rng.random(40).round(3),
+    })
+    file1_df.loc[25, 'ID'] = np.nan            # a blank key in one chunk only
+    file1_df.loc[14:20, 'Name'] = None         # a chunk with no names at all
+    file2_df = pd.DataFrame({
+        '学号': rng.integers(1015, 1045, size=30),
+        'Eng': rng.integers(0, 100, size=30),
+        'Pass': rng.choice([True, False], size=30),
+    })
+    # A key repeated in both files, whose rows multiply out
+    repeated = file1_df['ID'].value_counts().index[0]
+    file2_df.loc[[3, 20], '学号'] = int(repeated)
+    if sort:
+        file1_df = file1_df.assign(key=file1_df['ID'].fillna('').astype(str)).sort_values('key', kind='stable')
+        file1_df = file1_df.drop(columns='key')
+        file2_df = file2_df.sort_values('学号', key=lambda keys: keys.astype(str), kind='stable')
+    file1_path, file2_path = tmp_path / 'a.csv', tmp_path / 'b.csv'
+    file1_df.to_csv(file1_path, index=False)
+    file2_df.to_csv(file2_path, index=False)
+    return str(file1_path), str(file2_path)
+
+
+def in_memory(file1_path, file2_path, selected_columns, max_output_rows=None, key_rules=()):
+    key_rules = merge_keys.parse_rules(key_rules)
+    sides = [merge_engine.prepare_side(pd.read_csv(file1_path), 'ID', '_file1', selected_columns, "File 1", key_rules),
+             merge_engine.prepare_side(pd.read_csv(file2_path), '学号', '_file2', selected_columns, "File 2",
+                                       key_rules)]
+    sides, stats = key_stats.guard_output_size(sides, key_stats.profile_sides(sides), max_output_rows, 'dedupe', quiet)
+    merged = merge_engine.merge_sides(*sides)
+    return merged[merge_engine.output_columns(merged.columns, selected_columns)]
+
+
+def out_of_core(tmp_path, file1_path, file2_path, selected_columns, output_name, **options):
+    job = {'file1_path': file1_path, 'file2_path': file2_path, 'file1_key_column': 'ID',
+           'file2_key_column': '学号', 'selected_columns': selected_columns,
+           'output_file_path': str(tmp_path / output_name), 'temp_dir': str(tmp_path)}
+    job.update(options)
+    output_path, rows, columns = chunked_merge.merge_csv_pair(job, quiet)
+    return output_path
+
+
+def by_key(df):
+    return df.sort_values(MERGE_KEY, kind='stable').reset_index(drop=True)
+
+
+@pytest.mark.parametrize('selected_columns', [[], ['Math_file1', 'Eng_file2', 'Name_file1']])
+@pytest.mark.parametrize('buckets', [1, 3])
+def test_csv_output_matches_the_in_memory_merge(tmp_path, small_chunks, selected_columns, buckets):
+    file1_path, file2_path = write_inputs(tmp_path)
+    expected = in_memory(file1_path, file2_path, selected_columns)
+    output_path = out_of_core(tmp_path, file1_path, file2_path, selected_columns, 'out.csv', buckets=buckets)
+
+    with open(output_path, encoding='utf-8') as f:
+        got_text = f.read()
+    if buckets == 1:
+        assert got_text == expected.to_csv(index=False)
+    got = pd.read_csv(output_path, dtype={MERGE_KEY: str}, keep_default_na=False, na_values=[''])
+    want = pd.read_csv(pd.io.common.StringIO(expected.to_csv(index=False)), dtype={MERGE_KEY: str},
+                       keep_default_na=False, na_values=[''])
+    pd.testing.assert_frame_equal(by_key(got), by_key(want))
+
+
+@pytest.mark.parametrize('buckets', [1, 3])
+def test_integer_keys_with_a_blank_in_a_chunk_still_match(tmp_path, monkeypatch, buckets):
+    # The first chunk holds 1001 and a blank, which pandas alone parses as 1001.0
+    monkeypatch.setattr(chunked_merge, 'READ_CHUNK_ROWS', 2)
+    (tmp_path / 'a.csv').write_text("ID,Name\n1001,x\n,y\nabc,z\n1002,w\n", encoding='utf-8')
+    (tmp_path / 'b.csv').write_text("学号,Eng\n1001,1.0\n", encoding='utf-8')
+    file1_path, file2_path = str(tmp_path / 'a.csv'), str(tmp_path / 'b.csv')
+    expected = in_memory(file1_path, file2_path, [])
+    output_path = out_of_core(tmp_path, file1_path, file2_path, [], 'out.csv', buckets=buckets)
+    got = pd.read_csv(output_path, dtype={MERGE_KEY: str}, keep_default_na=False, na_values=[''])
+    want = pd.read_csv(pd.io.common.StringIO(expected.to_csv(index=False)), dtype={MERGE_KEY: str},
+                       keep_default_na=False, na_values=[''])
+    assert '1001.0' not in set(got[MERGE_KEY])
+    pd.testing.assert_frame_equal(by_key(got), by_key(want))
+
+
+def test_xlsx_cells_match_the_in_memory_output(tmp_path, small_chunks):
+    file1_path, file2_path = write_inputs(tmp_path)
+    expected_path = str(tmp_path / 'expected.xlsx')
+    # The streaming writer, as used out of core, so blank cells are written alike
+    excel_io.write_table(in_memory(file1_path, file2_path, []), expected_path, streaming=True)
+    output_path = out_of_core(tmp_path, file1_path, file2_path, [], 'out.xlsx', buckets=1)
+
+    def cells(path):
+        sheet = openpyxl.load_workbook(path, read_only=True).worksheets[0]
+        return [[(cell.value, cell.data_type) for cell in row] for row in sheet.iter_rows()]
+
+    assert cells(output_path) == cells(expected_path)
+
+
+def test_sorted_streaming_matches_the_in_memory_merge(tmp_path, small_chunks):
+    file1_path, file2_path = write_inputs(tmp_path, sort=True)
+    expected = in_memory(file1_path, file2_path, [])
+    output_path = out_of_core(tmp_path, file1_path, file2_path, [], 'out.csv', sorted_keys=True)
+    with open(output_path, encoding='utf-8') as f:
+        assert f.read() == expected.to_csv(index=False)
+
+
+@pytest.mark.parametrize('sorted_keys', [False, True])
+def test_output_limit_applies_out_of_core(tmp_path, small_chunks, sorted_keys):
+    file1_path, file2_path = write_inputs(tmp_path, sort=sorted_keys)
+    rows = len(in_memory(file1_path, file2_path, []))
+    with pytest.raises(key_stats.OutputTooLargeError):
+        out_of_core(tmp_path, file1_path, file2_path, [], 'out.csv', buckets=3, sorted_keys=sorted_keys,
+                    max_output_rows=rows - 1)
+    assert not (tmp_path / 'out.csv').exists()
+
+
+@pytest.mark.parametrize('sorted_keys', [False, True])
+def test_dedupe_out_of_core_matches_the_in_memory_merge(tmp_path, small_chunks, sorted_keys):
+    file1_path, file2_path = write_inputs(tmp_path, sort=sorted_keys)
+    # 1015.0 in File 1 matches 1015 in File 2
+    limit = len(in_memory(file1_path, file2_path, [], key_rules='numeric')) - 1
+    expected = in_memory(file1_path, file2_path, [], max_output_rows=limit, key_rules='numeric')
+    output_path = out_of_core(tmp_path, file1_path, file2_path, [], 'out.csv', buckets=3, sorted_keys=sorted_keys,
+                              key_rules='numeric', max_output_rows=limit, explosion_action='dedupe')
+    got = pd.read_csv(output_path, dtype={MERGE_KEY: str}, keep_default_na=False, na_values=[''])
+    want = pd.read_csv(pd.io.common.StringIO(expected.to_csv(index=False)), dtype={MERGE_KEY: str},
+                       keep_default_na=False, na_values=[''])
+    assert len(expected) <= limit
+    pd.testing.assert_frame_equal(by_key(got), by_key(want))
@@ -0,0 +1,48 @@
+import pytest
+
+import excel_io
+import merge_engine
+
+SPREADSHEETML = '''<?xml version="1.0"?>
+<?mso-application progid="Excel.Sheet"?>
+<Workbook xmlns="urn:schemas-microsoft-com:office:spreadsheet"
+ xmlns:ss="urn:schemas-microsoft-com:office:spreadsheet">
+ <Worksheet ss:Name="Sheet1"><Table><Row><Cell><Data ss:Type="String">学号</Data></Cell></Row></Table></Worksheet>
+</Workbook>
+'''
+
+XHTML = '''<?xml version="1.0" encoding="utf-8"?>
+<!-- exported by the school system -->
+<html xmlns="http://www.w3.org/1999/xhtml"><body>
+<table><tr><th>学号</th><th>Math</th></tr><tr><td>1001</td><td>90</td></tr></table>
+</body></html>
+'''
+
+
+@pytest.mark.parametrize('content, file_format', [
+    ('<html><body><table><tr><td>1</td></tr></table></body></html>', 'html'),
+    ('\ufeff<!DOCTYPE html><html></html>', 'html'),
+    (XHTML, 'html'),
+    ('学号,Math\n1001,90\n', 'csv'),
+])
+def test_sniff_format_reads_the_content(tmp_path, content, file_format):
+    file_path = tmp_path / 'export.xls'
+    file_path.write_text(content, encoding='utf-8')
+    assert excel_io.sniff_format(str(file_path)) == file_format
+
+
+@pytest.mark.parametrize('name', ['export.xml', 'export.xls'])
+def test_spreadsheetml_is_reported_as_unsupported(tmp_path, name):
+    file_path = tmp_path / name
+    file_path.write_text(SPREADSHEETML, encoding='utf-8')
+    with pytest.raises(ValueError, match='SpreadsheetML'):
+        excel_io.sniff_format(str(file_path))
+    with pytest.raises(ValueError, match='save it as .xlsx'):
+        merge_engine.try_multiple_engines(str(file_path), lambda message: None)
+
+
+def test_other_xml_is_not_read_as_html(tmp_path):
+    file_path = tmp_path / 'data.xml'
+    file_path.write_text('<?xml version="1.0"?><students><student id="1001"/></students>', encoding='utf-8')
+    with pytest.raises(ValueError, match='XML file'):
+        excel_io.sniff_format(str(file_path))
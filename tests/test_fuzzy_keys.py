@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+
+import fuzzy_keys
+import key_stats
+import merge_engine
+from merge_engine import MERGE_KEY
+
+
+def pairs(matches):
+    return list(matches.itertuples(index=False, name=None))
+
+
+def test_short_cjk_names_need_a_lower_threshold():
+    # Two and three characters: one extra or changed character scores well below the default
+    assert pairs(fuzzy_keys.find_matches(['张三'], ['张三丰'])) == []
+    assert pairs(fuzzy_keys.find_matches(['张三'], ['张三丰'], 0.8)) == [('张三', '张三丰', 0.8)]
+    assert pairs(fuzzy_keys.find_matches(['王小明'], ['王晓明'])) == []
+    assert pairs(fuzzy_keys.find_matches(['王小明'], ['王晓明'], 0.65)) == [('王小明', '王晓明', 0.6667)]
+
+
+def test_two_character_names_sharing_one_character_stay_apart():
+    assert pairs(fuzzy_keys.find_matches(['张三'], ['李三'], 0.6)) == []
+    assert pairs(fuzzy_keys.find_matches(['张三', '李四'], ['张 三', '李四。'], 0.6)) == [
+        ('张三', '张 三', 1.0), ('李四', '李四。', 1.0)]
+
+
+def test_each_key_is_matched_once_best_first():
+    matches = fuzzy_keys.find_matches(['王小明', '王小敏'], ['王晓明'], 0.6)
+    assert pairs(matches) == [('王小明', '王晓明', 0.6667)]
+
+
+@pytest.mark.parametrize('value, threshold', [(None, None), (False, None), ('', None),
+                                              (True, fuzzy_keys.DEFAULT_THRESHOLD), ('0.7', 0.7), (1, 1.0)])
+def test_parse_threshold(value, threshold):
+    assert fuzzy_keys.parse_threshold(value) == threshold
+
+
+@pytest.mark.parametrize('value', ['2', '0', 'high'])
+def test_parse_threshold_rejects_invalid_values(value):
+    with pytest.raises(ValueError):
+        fuzzy_keys.parse_threshold(value)
+
+
+def test_unmatched_keys_are_rewritten_to_the_file1_key():
+    left = merge_engine.prepare_side(pd.DataFrame({'姓名': ['张三', '王小明', '李四']}), '姓名', '_file1', [], "File 1")
+    right = merge_engine.prepare_side(pd.DataFrame({'Name': ['张三丰', '王晓明', '李四', '赵六'],
+                                                    'Score': [90, 80, 70, 60]}),
+                                      'Name', '_file2', [], "File 2")
+    right, matches = fuzzy_keys.match_unmatched_keys(left, right, 0.65, add_columns=True, log=lambda message: None)
+    assert sorted(pairs(matches)) == [('张三', '张三丰', 0.8), ('王小明', '王晓明', 0.6667)]
+    assert list(right[MERGE_KEY]) == ['张三', '王小明', '李四', '赵六']
+    assert list(right[fuzzy_keys.MATCH_CONFIDENCE].fillna(-1)) == [0.8, 0.6667, 1.0, -1]
+    assert list(right[fuzzy_keys.FUZZY_MATCHED_KEY].fillna('')) == ['张三丰', '王晓明', '', '']
+
+
+def test_check_keys_reports_fuzzy_matches(tmp_path):
+    pd.DataFrame({'姓名': ['张三', '王小明', '李四'], 'Math': [1, 2, 3]}).to_csv(tmp_path / 'a.csv', index=False)
+    pd.DataFrame({'Name': ['张三丰', '王晓明', '李四'], 'Eng': [4, 5, 6]}).to_csv(tmp_path / 'b.csv', index=False)
+    job = {'file1_path': str(tmp_path / 'a.csv'), 'file2_path': str(tmp_path / 'b.csv'),
+           'file1_key_column': '姓名', 'file2_key_column': 'Name', 'use_cache': False}
+
+    stats = key_stats.profile_files(dict(job, fuzzy_keys='0.65'), lambda message: None)
+    assert stats['fuzzy_matches'] == 2
+    assert stats['matched_keys'] == 3
+    assert "Fuzzy matches: 2 File 2 keys matched to File 1 keys" in key_stats.describe(stats)
+
+    stats = key_stats.profile_files(job, lambda message: None)
+    assert 'fuzzy_matches' not in stats
+    assert stats['matched_keys'] == 1
+
+
+def test_deduplicated_merges_keep_the_fuzzy_match_count(tmp_path):
+    # 李四 is repeated in both files, so the limit collapses it to one row
+    pd.DataFrame({'姓名': ['张三', '李四', '李四'], 'Math': [1, 2, 3]}).to_csv(tmp_path / 'a.csv', index=False)
+    pd.DataFrame({'Name': ['张三丰', '李四', '李四'], 'Eng': [4, 5, 6]}).to_csv(tmp_path / 'b.csv', index=False)
+    job = {'file1_path': str(tmp_path / 'a.csv'), 'file2_path': str(tmp_path / 'b.csv'),
+           'file1_key_column': '姓名', 'file2_key_column': 'Name', 'selected_columns': [],
+           'output_file_path': str(tmp_path / 'out.csv'), 'use_cache': False,
+           'fuzzy_keys': 0.8, 'max_output_rows': 4, 'explosion_action': 'dedupe'}
+    messages = []
+    result = merge_engine.process_pair(job, messages.append)
+    assert result['success'], result
+    assert result['rows'] == 2
+    assert result['key_stats']['fuzzy_matches'] == 1
+    assert "  Fuzzy matches: 1 File 2 keys matched to File 1 keys" in messages
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import incremental_merge
+import key_stats
+import merge_engine
+
+
+def make_inputs(seed):
+    rng = np.random.default_rng(seed)
+    file1_df = pd.DataFrame({
+        '学号': [f"S{n}" for n in rng.integers(0, 120, size=150)],
+        'Math': rng.integers(0, 100, size=150),
+        'Class': rng.choice(['A', 'B', '缺考', None], size=150),
+    })
+    file2_df = pd.DataFrame({
+        'ID': [f"S{n}" for n in rng.integers(60, 180, size=150)],
+        'Eng': rng.random(150).round(2),
+        'Pass': rng.integers(0, 2, size=150),
+    })
+    return file1_df, file2_df
+
+
+def edit(file1_df, file2_df, rng):
+    # A few edits of the kind a re-exported marksheet has: changed scores,
+    # a copied cell, a new student, a removed row and swapped duplicates
+    file1_df = file1_df.copy()
+    file2_df = file2_df.copy()
+    for _ in range(3):
+        file2_df.loc[rng.integers(len(file2_df)), 'Eng'] = round(rng.random(), 2)
+    file1_df.loc[rng.integers(len(file1_df)), 'Class'] = 'B'
+    file2_df = pd.concat([file2_df, pd.DataFrame({'ID': ['S999'], 'Eng': [0.5], 'Pass': [1]})], ignore_index=True)
+    file1_df = file1_df.drop(index=file1_df.index[rng.integers(len(file1_df))]).reset_index(drop=True)
+    duplicated = file2_df.index[file2_df['ID'].duplicated(keep=False)]
+    if len(duplicated) >= 2:
+        first, second = duplicated[:2]
+        file2_df.loc[[first, second]] = file2_df.loc[[second, first]].to_numpy()
+    return file1_df, file2_df
+
+
+def full_merge(job):
+    sides = [merge_engine.prepare_side(merge_engine.load_table(spec['file_path'], lambda message: None),
+                                       spec['key_column'], spec['suffix'], job['selected_columns'],
+                                       f"File {number}")
+             for number, spec in enumerate(merge_engine.job_inputs(job), 1)]
+    if job.get('max_output_rows'):
+        sides, stats = key_stats.guard_output_size(sides, key_stats.profile_sides(sides), job['max_output_rows'],
+                                                   job.get('explosion_action'), lambda message: None)
+    merged_df = merge_engine.merge_sides(*sides)
+    return merged_df[merge_engine.output_columns(merged_df.columns, job['selected_columns'])]
+
+
+@pytest.mark.parametrize('selected_columns', [[], ['Math_file1', 'Eng_file2']])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_patched_merges_equal_a_full_merge(tmp_path, seed, selected_columns):
+    rng = np.random.default_rng(seed)
+    file1_df, file2_df = make_inputs(seed)
+    job = {'file1_path': str(tmp_path / 'a.csv'), 'file2_path': str(tmp_path / 'b.csv'),
+           'file1_key_column': '学号', 'file2_key_column': 'ID', 'selected_columns': selected_columns,
+           'output_file_path': str(tmp_path / 'out.csv'), 'state_dir': str(tmp_path / 'state')}
+
+    messages = []
+    for run in range(4):
+        file1_df.to_csv(job['file1_path'], index=False)
+        file2_df.to_csv(job['file2_path'], index=False)
+        got = incremental_merge.merge_pair(job, messages.append)
+        pd.testing.assert_frame_equal(got.reset_index(drop=True), full_merge(job).reset_index(drop=True))
+        file1_df, file2_df = edit(file1_df, file2_df, rng)
+
+    assert any(message.startswith("Re-merging") for message in messages)
+
+
+def test_unchanged_inputs_reuse_the_previous_merge(tmp_path):
+    file1_df, file2_df = make_inputs(3)
+    file1_df.to_csv(tmp_path / 'a.csv', index=False)
+    file2_df.to_csv(tmp_path / 'b.csv', index=False)
+    job = {'file1_path': str(tmp_path / 'a.csv'), 'file2_path': str(tmp_path / 'b.csv'),
+           'file1_key_column': '学号', 'file2_key_column': 'ID', 'selected_columns': [],
+           'output_file_path': str(tmp_path / 'out.csv'), 'state_dir': str(tmp_path / 'state')}
+    first = incremental_merge.merge_pair(job, lambda message: None)
+    messages = []
+    second = incremental_merge.merge_pair(job, messages.append)
+    assert "No keys changed; reusing the previous merge" in messages
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_output_limit_applies_to_incremental_merges(tmp_path):
+    file1_df, file2_df = make_inputs(4)
+    file1_df.to_csv(tmp_path / 'a.csv', index=False)
+    file2_df.to_csv(tmp_path / 'b.csv', index=False)
+    job = {'file1_path': str(tmp_path / 'a.csv'), 'file2_path': str(tmp_path / 'b.csv'),
+           'file1_key_column': '学号', 'file2_key_column': 'ID', 'selected_columns': [],
+           'output_file_path': str(tmp_path / 'out.csv'), 'state_dir': str(tmp_path / 'state')}
+    rows = len(full_merge(job))
+    with pytest.raises(key_stats.OutputTooLargeError):
+        incremental_merge.merge_pair(dict(job, max_output_rows=rows - 1), lambda message: None)
+
+
+def test_deduplicated_incremental_merges_equal_a_full_merge(tmp_path):
+    rng = np.random.default_rng(5)
+    file1_df, file2_df = make_inputs(5)
+    job = {'file1_path': str(tmp_path / 'a.csv'), 'file2_path': str(tmp_path / 'b.csv'),
+           'file1_key_column': '学号', 'file2_key_column': 'ID', 'selected_columns': [],
+           'output_file_path': str(tmp_path / 'out.csv'), 'state_dir': str(tmp_path / 'state')}
+    limited = dict(job, explosion_action='dedupe')
+    messages = []
+    for run in range(4):
+        file1_df.to_csv(job['file1_path'], index=False)
+        file2_df.to_csv(job['file2_path'], index=False)
+        if run == 0:
+            # Just below the full output, so the first runs deduplicate
+            limited['max_output_rows'] = len(full_merge(job)) - 1
+        got = incremental_merge.merge_pair(limited, messages.append)
+        pd.testing.assert_frame_equal(got.reset_index(drop=True), full_merge(limited).reset_index(drop=True))
+        file1_df, file2_df = edit(file1_df, file2_df, rng)
+    assert any("running a full merge" in message for message in messages)
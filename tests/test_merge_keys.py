@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import merge_engine
+import merge_keys
+from merge_engine import MERGE_KEY
+
+
+def as_list(keys):
+    # Missing keys compare equal whether pandas holds them as NaN or NA
+    return [None if pd.isna(key) else key for key in keys]
+
+
+def old_merge(file1_df, file2_df, file1_key, file2_key):
+    # The merge mergebypivotv4 used before key normalization and integer codes
+    file1_df = file1_df.copy()
+    file2_df = file2_df.copy()
+    file1_df[file1_key] = file1_df[file1_key].fillna('').astype(str)
+    file2_df[file2_key] = file2_df[file2_key].fillna('').astype(str)
+    file1_df = file1_df.add_suffix('_file1').rename(columns={f"{file1_key}_file1": MERGE_KEY})
+    file2_df = file2_df.add_suffix('_file2').rename(columns={f"{file2_key}_file2": MERGE_KEY})
+    merged = pd.merge(file1_df, file2_df, on=MERGE_KEY, how='outer')
+    return merged[merge_engine.output_columns(merged.columns, [])]
+
+
+def new_merge(file1_df, file2_df, file1_key, file2_key, key_rules=(), arrow=False):
+    sides = [merge_engine.prepare_side(file1_df, file1_key, '_file1', [], "File 1", key_rules, arrow),
+             merge_engine.prepare_side(file2_df, file2_key, '_file2', [], "File 2", key_rules, arrow)]
+    return merge_engine.merge_prepared(sides, [], lambda message: None)
+
+
+def sample_frames(seed):
+    rng = np.random.default_rng(seed)
+    ids = rng.integers(1000, 1040, size=60).astype(float)
+    ids[rng.random(60) < 0.1] = np.nan
+    file1_df = pd.DataFrame({'学号': ids, 'Math': rng.integers(0, 100, size=60),
+                             'Class': rng.choice(['A', 'B', None], size=60)})
+    file2_df = pd.DataFrame({'ID': rng.choice([f"{n}.0" for n in range(1020, 1060)] + ['', 'x'], size=50),
+                             'Eng': rng.random(50)})
+    return file1_df, file2_df
+
+
+@pytest.mark.parametrize('values', [
+    pd.Series([1001.0, np.nan, 3.5]),
+    pd.Series([1, 2, 3]),
+    pd.Series(['a', None, ' b '], dtype=object),
+    pd.Series([1, 'a', None, 2.0], dtype=object),
+    pd.Series(['x', None]),
+    pd.Series(pd.to_datetime(['2024-01-02', None])),
+])
+def test_no_rules_is_the_old_string_conversion(values):
+    expected = as_list(values.fillna('').astype(str))
+    assert as_list(merge_keys.normalize_keys(values)) == expected
+    assert as_list(merge_keys.normalize_keys(values, arrow=True)) == expected
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_merge_without_rules_matches_the_old_merge(seed):
+    file1_df, file2_df = sample_frames(seed)
+    expected = old_merge(file1_df, file2_df, '学号', 'ID')
+    got = new_merge(file1_df, file2_df, '学号', 'ID')
+    pd.testing.assert_frame_equal(got.reset_index(drop=True), expected.reset_index(drop=True))
+    assert got.to_csv(index=False) == expected.to_csv(index=False)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_arrow_keys_merge_the_same_rows(seed):
+    file1_df, file2_df = sample_frames(seed)
+    for rules in ([], merge_keys.parse_rules('all')):
+        plain = new_merge(file1_df, file2_df, '学号', 'ID', rules)
+        arrow = new_merge(file1_df, file2_df, '学号', 'ID', rules, arrow=True)
+        assert list(arrow[MERGE_KEY]) == list(plain[MERGE_KEY])
+
+
+def test_rules_match_spacing_case_width_and_decimal_ids():
+    keys = pd.Series([' S1001 ', 'ｓ１００１', '1001.0', '1001.00', 'Straße'])
+    assert list(merge_keys.normalize_keys(keys, merge_keys.parse_rules('all'))) == \
+        ['s1001', 's1001', '1001', '1001', 'strasse']
@@ -0,0 +1,134 @@
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+import replace_engine
+from replace_engine import ReplacementRules, safe_replace
+
+
+RULE_SETS = {
+    # Disjoint find strings: compiled into the single-pass trie
+    'trie': {'及格': '合格', '缺考': '0', 'absent': 'ABS', 'c': 'C'},
+    # A rule's output is a later rule's find text
+    'chained': {'a': 'b', 'b': 'c'},
+    # Find strings that overlap in the text
+    'overlapping': {'ab': '1', 'bc': '2', 'b': '3'},
+    # An empty replacement can join text into a later find string
+    'deleting': {'-': '', 'ab': 'Y'},
+    'prefixes': {'张': '章', '张三': '张叁', '三丰': 'S', 'absent': 'ABS', 'abs': 'x'},
+    # "a,b,,c": an empty find puts its replacement between every character
+    'empty_find': replace_engine.parse_rules('a,b,,c'),
+}
+
+
+def sample_values(seed):
+    rng = np.random.default_rng(seed)
+    pieces = ['a', 'b', 'c', '-', 'ab', '及格', '缺考', '张三丰', 'absent', ' ', '']
+    words = [''.join(rng.choice(pieces, size=rng.integers(0, 6))) for _ in range(80)]
+    values = pd.Series(words, dtype=object)
+    values[rng.random(80) < 0.1] = None
+    return values
+
+
+def per_cell(series, replace_dict):
+    # The loop replace2 ran before the rules were vectorized
+    return series.apply(lambda x: safe_replace(x, replace_dict))
+
+
+def as_list(values):
+    return [None if pd.isna(value) else value for value in values]
+
+
+def test_trie_is_only_used_when_order_cannot_matter():
+    assert ReplacementRules(RULE_SETS['trie']).pattern is not None
+    for name in ('chained', 'overlapping', 'deleting', 'prefixes', 'empty_find'):
+        assert ReplacementRules(RULE_SETS[name]).pattern is None
+
+
+@pytest.mark.parametrize('name', sorted(RULE_SETS))
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_text_columns_match_per_cell_safe_replace(name, seed):
+    replace_dict = RULE_SETS[name]
+    values = sample_values(seed)
+    got = ReplacementRules(replace_dict).apply_series(values)
+    assert as_list(got) == as_list(per_cell(values, replace_dict))
+
+
+@pytest.mark.parametrize('name', sorted(RULE_SETS))
+def test_arrow_text_columns_match_per_cell_safe_replace(name):
+    replace_dict = RULE_SETS[name]
+    values = sample_values(3)
+    got = ReplacementRules(replace_dict).apply_series(values.astype('string[pyarrow]'))
+    assert got.dtype == 'string[pyarrow]'
+    assert as_list(got) == as_list(per_cell(values, replace_dict))
+
+
+@pytest.mark.parametrize('name', sorted(RULE_SETS))
+def test_apply_text_matches_safe_replace(name):
+    replace_dict = RULE_SETS[name]
+    rules = ReplacementRules(replace_dict)
+    for value in sample_values(4).dropna():
+        assert rules.apply_text(value) == safe_replace(value, replace_dict)
+
+
+def test_frames_replace_text_cells_and_leave_numbers_alone():
+    replace_dict = RULE_SETS['trie']
+    df = pd.DataFrame({
+        'Result': ['及格', '缺考', None, 'absent'],
+        # A marksheet column mixing scores with text: numbers become text, as per cell
+        'Mixed': [95, '缺考', 60.5, None],
+        'Score': [1.0, 2.5, np.nan, 4.0],
+    })
+    got = ReplacementRules(replace_dict).apply_frame(df)
+    for col in ('Result', 'Mixed'):
+        assert as_list(got[col]) == as_list(per_cell(df[col], replace_dict))
+    pd.testing.assert_series_equal(got['Score'], df['Score'])
+
+
+def test_parse_rules_keeps_the_order():
+    assert list(replace_engine.parse_rules('b,c,a,b').items()) == [('b', 'c'), ('a', 'b')]
+
+
+@pytest.mark.parametrize('cell_range', ['A1:B3', 'A:B', '1:3', ''])
+def test_in_place_and_rewrite_leave_the_header_alone(tmp_path, cell_range):
+    df = pd.DataFrame({'缺考': ['缺考', '及格', '缺考'], 'Note': ['absent', 'c', None]})
+    results = []
+    for in_place in (True, False):
+        file_path = str(tmp_path / f"{in_place}.xlsx")
+        df.to_excel(file_path, index=False)
+        changed = replace_engine.replace_in_workbook(file_path, 'Sheet1', cell_range,
+                                                     ReplacementRules(RULE_SETS['trie']), in_place=in_place)
+        results.append((changed, pd.read_excel(file_path)))
+    (in_place_changed, in_place_df), (rewrite_changed, rewrite_df) = results
+    assert list(in_place_df.columns) == ['缺考', 'Note']
+    assert in_place_changed == rewrite_changed
+    pd.testing.assert_frame_equal(in_place_df, rewrite_df)
+
+
+@pytest.mark.parametrize('arrow', [False, True])
+def test_in_place_and_rewrite_replace_only_text_cells(tmp_path, arrow):
+    # A rule that matches digits: numbers in a column that also holds text stay numbers either way
+    rules = ReplacementRules({'缺考': '0', '9': 'N'})
+    df = pd.DataFrame({'Mixed': [95, '缺考', 60.5, '9班', None], 'Score': [9, 19, 29, 39, 49]})
+    results = []
+    for in_place in (True, False):
+        file_path = str(tmp_path / f"{in_place}.xlsx")
+        df.to_excel(file_path, index=False)
+        changed = replace_engine.replace_in_workbook(file_path, 'Sheet1', '', rules, in_place=in_place, arrow=arrow)
+        sheet = openpyxl.load_workbook(file_path).worksheets[0]
+        results.append((changed, [[(cell.value, cell.data_type) for cell in row] for row in sheet.iter_rows()]))
+    (in_place_changed, in_place_cells), (rewrite_changed, rewrite_cells) = results
+    assert in_place_changed == rewrite_changed == 2
+    assert in_place_cells == rewrite_cells
+    assert [row[0] for row in in_place_cells[1:]] == [(95, 'n'), ('0', 's'), (60.5, 'n'), ('N班', 's'), (None, 'n')]
+
+
+def test_batch_skips_xls_before_reading_it(tmp_path):
+    file_path = tmp_path / 'old.xls'
+    file_path.write_bytes(b'not really a workbook')
+    job = replace_engine.build_batch_jobs([str(file_path)])[0]
+    result = replace_engine.replace_file(job, ReplacementRules(RULE_SETS['trie']))
+    assert result['status'] == 'Skipped - Cannot save .xls'
+    assert result['changed'] == 0
+    assert file_path.read_bytes() == b'not really a workbook'
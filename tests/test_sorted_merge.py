@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import merge_engine
+import sorted_merge
+from merge_engine import MERGE_KEY
+
+
+def sorted_side(n, suffix, seed, distinct_keys, dtype):
+    rng = np.random.default_rng(seed)
+    keys = sorted(f"K{key:03d}" for key in rng.integers(0, distinct_keys, size=n))
+    if n and seed % 3 == 0:
+        keys[0] = ''                        # the key of rows with a blank key cell
+    return pd.DataFrame({
+        MERGE_KEY: pd.Series(keys, dtype=dtype),
+        f"Score{suffix}": rng.integers(0, 100, size=n),
+        f"Rate{suffix}": rng.random(n),
+        f"Pass{suffix}": rng.random(n) > 0.5,
+        f"Class{suffix}": rng.choice(['A', None, '缺考'], size=n),
+    })
+
+
+@pytest.mark.parametrize('dtype', [object, 'str', 'large_string[pyarrow]'])
+@pytest.mark.parametrize('seed', range(8))
+def test_ordered_join_equals_the_hash_merge(seed, dtype):
+    rng = np.random.default_rng(seed)
+    # Few distinct keys give many duplicates to multiply out, many give one-sided keys
+    file1_side = sorted_side(int(rng.integers(0, 60)), '_file1', seed, int(rng.choice([3, 40, 500])), dtype)
+    file2_side = sorted_side(int(rng.integers(0, 60)), '_file2', seed + 100, int(rng.choice([3, 40, 500])), dtype)
+    pd.testing.assert_frame_equal(sorted_merge.merge_sorted_sides(file1_side, file2_side),
+                                  merge_engine.merge_sides(file1_side, file2_side))
+
+
+def test_ordered_join_of_identical_keys():
+    file1_side = sorted_side(30, '_file1', 1, 10, object)
+    file2_side = file1_side.rename(columns=lambda col: col.replace('_file1', '_file2'))
+    pd.testing.assert_frame_equal(sorted_merge.merge_sorted_sides(file1_side, file2_side),
+                                  merge_engine.merge_sides(file1_side, file2_side))
+
+
+def test_merge_prepared_rejects_unsorted_inputs_declared_sorted():
+    file1_side = sorted_side(20, '_file1', 1, 10, object).iloc[::-1]
+    file2_side = sorted_side(20, '_file2', 2, 10, object)
+    with pytest.raises(sorted_merge.UnsortedKeysError):
+        merge_engine.merge_prepared([file1_side, file2_side], [], lambda message: None, sorted_keys=True)
@@ -0,0 +1,151 @@
+import os
+import json
+import pickle
+import hashlib
+import tempfile
+from collections import OrderedDict
+
+# Bump when the cached payload or key layout changes so old entries are ignored
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'marksheet_merge')
+DEFAULT_MAX_MB = 2048
+
+# Parsed frames kept in this process, so a file used by many pairs of one batch
+# (e.g. the master roster) is read once even when the disk cache is disabled.
+# Bounded by count and by in-memory size; batches clear it when they finish.
+MEMORY_ENTRIES = 8
+MEMORY_MAX_MB = 512
+_memory = OrderedDict()    # key -> (frame, bytes)
+
+
+def cache_key(file_path, sheet=0, engine=None, usecols=None, nrows=None, arrow=False):
+    """Key a parse by the file's identity and every option that changes the result.
+
+    The file is identified by absolute path, size and modification time, so
+    any edit to the workbook produces a new key.
+    """
+    stat = os.stat(file_path)
+    parts = {
+        'version': CACHE_VERSION,
+        'path': os.path.abspath(file_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sheet': sheet,
+        'engine': engine,
+        'usecols': sorted(str(col) for col in usecols) if usecols is not None else None,
+        'nrows': nrows,
+    }
+    if arrow:
+        # Only set for Arrow-backed parses, so existing entries keep their keys
+        parts['arrow'] = True
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def remember(key, df):
+    size = int(df.memory_usage(index=True, deep=True).sum())
+    max_bytes = MEMORY_MAX_MB * 1024 * 1024
+    _memory.pop(key, None)
+    if size > max_bytes:
+        # Too large to keep around; the disk cache can still serve it
+        return
+    _memory[key] = (df, size)
+    total = sum(entry_size for _, entry_size in _memory.values())
+    while len(_memory) > MEMORY_ENTRIES or total > max_bytes:
+        _, (_, evicted) = _memory.popitem(last=False)
+        total -= evicted
+
+
+def recall(key):
+    entry = _memory.get(key)
+    if entry is None:
+        return None
+    _memory.move_to_end(key)
+    return entry[0]
+
+
+def forget_all():
+    """Drop every frame kept in this process, e.g. once a batch has finished"""
+    _memory.clear()
+
+
+class WorkbookCache:
+    """On-disk cache of parsed DataFrames with a least-recently-used size cap.
+
+    Entries are pickles, which round-trip every pandas dtype (including mixed
+    object columns) exactly, so a cached load merges and writes the same
+    output as a fresh parse. Writes go through a temporary file and an atomic
+    rename, so parallel workers can share one cache directory.
+    """
+
+    def __init__(self, cache_dir=None, max_mb=DEFAULT_MAX_MB):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = int(max_mb * 1024 * 1024)
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            with open(path, 'rb') as f:
+                df = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Truncated or incompatible entry: drop it and parse again
+            self.discard(path)
+            return None
+
+        # Reading counts as a use for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return df
+
+    def put(self, key, df):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path_for(key))
+        except Exception:
+            self.discard(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits its cap"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith('.pkl'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.discard(path)
+            total -= size
+
+    def clear(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(('.pkl', '.tmp')):
+                self.discard(entry.path)
+
+    @staticmethod
+    def discard(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass